@@ -0,0 +1,327 @@
+"""
+Throughput and latency benchmarks for the logging service.
+
+Drives the real ingestion paths of the service in process (POST /log,
+POST /log/bulk and the UDP datagram listener) against a temporary directory,
+with the storage settings taken from the usual LOG_* environment variables.
+Reports messages per second, request latency percentiles and bytes written
+per message, and can compare the results with a previous run:
+
+    python benchmarks/logging_service_bench.py --output bench.json
+    python benchmarks/logging_service_bench.py --baseline bench.json
+
+The second command exits with status 1 if a scenario got slower than the
+baseline by more than the tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICE_DIR = os.path.join(ROOT, "top_secret", "services", "logging_service")
+
+SCENARIOS = ("log", "bulk", "datagram")
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """
+    Returns a percentile of a list of values (nearest rank).
+
+    Args:
+        values (List[float]): The values.
+        fraction (float): The percentile, between 0 and 1.
+
+    Returns:
+        float: The value, or 0 for an empty list.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_requests(client, requests: List[dict], concurrency: int) -> List[float]:
+    """
+    Sends requests from `concurrency` concurrent workers.
+
+    Args:
+        client (httpx.AsyncClient): The client bound to the app.
+        requests (List[dict]): Keyword arguments of each `client.post` call.
+        concurrency (int): Number of requests in flight.
+
+    Returns:
+        List[float]: The latency of each request, in seconds.
+    """
+    latencies = []
+    queue = iter(requests)
+
+    async def worker():
+        for kwargs in queue:
+            started = time.perf_counter()
+            response = await client.post(**kwargs)
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+async def run_datagrams(main, messages: int, message: str) -> int:
+    """
+    Sends one datagram per message and waits for the listener to drain them.
+
+    Args:
+        main: The logging service module.
+        messages (int): Number of messages to send.
+        message (str): The message text.
+
+    Returns:
+        int: Number of messages the listener received.
+    """
+    from shared.logger import DatagramLogClient
+
+    host, port = main.log_datagram_server.addresses[0]
+    sender = DatagramLogClient(f"udp://{host}:{port}", service="bench")
+    protocol = main.log_datagram_server.protocol
+    received = protocol.received
+    for i in range(messages):
+        sender.log(message, level="info")
+        if i % 64 == 63:
+            # Let the listener read before the socket buffer overflows.
+            await asyncio.sleep(0)
+    await sender.stop()
+    # Wait until the listener stops receiving.
+    last = -1
+    while protocol.received != last:
+        last = protocol.received
+        await asyncio.sleep(0.05)
+    return protocol.received - received
+
+
+async def run_scenario(
+    main,
+    client,
+    scenario: str,
+    messages: int,
+    concurrency: int,
+    batch_size: int,
+    message_size: int,
+) -> Dict:
+    """
+    Runs one ingestion scenario and measures it.
+
+    Args:
+        main: The logging service module.
+        client (httpx.AsyncClient): The client bound to the app.
+        scenario (str): "log", "bulk" or "datagram".
+        messages (int): Number of messages to ingest.
+        concurrency (int): Number of requests in flight.
+        batch_size (int): Number of messages per bulk request.
+        message_size (int): Length of each message.
+
+    Returns:
+        Dict: The measurements.
+    """
+    message = "x" * message_size
+    record = {"message": message, "service": "bench", "level": "info"}
+    start_offset = main.log_storage.end_offset
+    latencies: List[float] = []
+    requests = 0
+    started = time.perf_counter()
+    if scenario == "log":
+        requests = messages
+        latencies = await run_requests(
+            client, [{"url": "/log", "json": record}] * messages, concurrency
+        )
+    elif scenario == "bulk":
+        body = "".join(json.dumps(record) + "\n" for _ in range(batch_size))
+        kwargs = {
+            "url": "/log/bulk",
+            "content": body.encode(),
+            "headers": {"Content-Type": "application/x-ndjson"},
+        }
+        requests = max(1, messages // batch_size)
+        messages = requests * batch_size
+        latencies = await run_requests(client, [kwargs] * requests, concurrency)
+    else:
+        sent = messages
+        messages = await run_datagrams(main, sent, message)
+        requests = sent
+    await main.log_storage.flush()
+    seconds = time.perf_counter() - started
+    written = main.log_storage.end_offset - start_offset
+    return {
+        "scenario": scenario,
+        "messages": messages,
+        "requests": requests,
+        "seconds": round(seconds, 4),
+        "msgs_per_sec": round(messages / seconds, 1) if seconds else 0.0,
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "bytes_per_message": round(written / messages, 1) if messages else 0.0,
+    }
+
+
+async def run_benchmarks(
+    scenarios=SCENARIOS,
+    messages: int = 5000,
+    concurrency: int = 32,
+    batch_size: int = 500,
+    message_size: int = 100,
+    directory: Optional[str] = None,
+) -> Dict:
+    """
+    Starts the logging service in process and runs the scenarios.
+
+    Args:
+        scenarios: The scenarios to run, among SCENARIOS.
+        messages (int): Number of messages per scenario.
+        concurrency (int): Number of requests in flight.
+        batch_size (int): Number of messages per bulk request.
+        message_size (int): Length of each message.
+        directory (Optional[str]): Working directory of the service; a
+            temporary directory by default.
+
+    Returns:
+        Dict: The settings and the measurements of each scenario.
+    """
+    import httpx
+
+    for path in (SERVICE_DIR, os.path.join(ROOT, "top_secret"), ROOT):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    from top_secret.services.logging_service import main
+
+    with tempfile.TemporaryDirectory() as tmp:
+        previous = os.getcwd()
+        # The service keeps its data under ./logs.
+        os.chdir(directory or tmp)
+        try:
+            main.log_datagram_server.udp_address = ("127.0.0.1", 0)
+            main.log_datagram_server.unix_path = None
+            results = []
+            async with main.app.router.lifespan_context(main.app):
+                transport = httpx.ASGITransport(app=main.app)
+                async with httpx.AsyncClient(
+                    transport=transport, base_url="http://bench"
+                ) as client:
+                    for scenario in scenarios:
+                        results.append(
+                            await run_scenario(
+                                main,
+                                client,
+                                scenario,
+                                messages,
+                                concurrency,
+                                batch_size,
+                                message_size,
+                            )
+                        )
+        finally:
+            os.chdir(previous)
+    return {
+        "settings": {
+            "messages": messages,
+            "concurrency": concurrency,
+            "batch_size": batch_size,
+            "message_size": message_size,
+            "durability": main.log_storage.durability,
+            "segment_format": main.log_storage.segment_format,
+            "compression": main.log_storage.compression,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def find_regressions(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Compares a report with a baseline report.
+
+    Args:
+        report (Dict): The measurements of this run.
+        baseline (Dict): The measurements of a previous run.
+        tolerance (float): Allowed relative slowdown, e.g. 0.2 for 20%.
+
+    Returns:
+        List[str]: A description of each regression.
+    """
+    previous = {result["scenario"]: result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        before = previous.get(result["scenario"])
+        if before is None:
+            continue
+        if result["msgs_per_sec"] < before["msgs_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{result['scenario']}: {result['msgs_per_sec']} msgs/s, "
+                f"baseline {before['msgs_per_sec']}"
+            )
+        if before["latency_p99_ms"] and result["latency_p99_ms"] > before[
+            "latency_p99_ms"
+        ] * (1 + tolerance):
+            regressions.append(
+                f"{result['scenario']}: p99 {result['latency_p99_ms']} ms, "
+                f"baseline {before['latency_p99_ms']}"
+            )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Runs the benchmarks from the command line.
+
+    Returns:
+        int: The exit status; 1 if a regression was found.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--message-size", type=int, default=100)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with this results file")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(
+        run_benchmarks(
+            args.scenario or SCENARIOS,
+            args.messages,
+            args.concurrency,
+            args.batch_size,
+            args.message_size,
+        )
+    )
+    print(f"{'scenario':<10} {'msgs/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'B/msg':>7}")
+    for result in report["results"]:
+        print(
+            f"{result['scenario']:<10} {result['msgs_per_sec']:>10} "
+            f"{result['latency_p50_ms']:>8} {result['latency_p99_ms']:>8} "
+            f"{result['bytes_per_message']:>7}"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            regressions = find_regressions(
+                report, json.load(baseline_file), args.tolerance
+            )
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
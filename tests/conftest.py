@@ -0,0 +1,21 @@
+# conftest.py
+
+import os
+import sys
+
+# Services are deployed with their own directory as the working directory, so
+# they import their helpers as top-level modules (e.g. `libraries.log_storage`).
+SERVICES_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "top_secret",
+    "services",
+)
+
+for service in ("logging_service", "chatgpt_service"):
+    sys.path.insert(0, os.path.join(SERVICES_DIR, service))
+
+# The gateway imports its helpers the same way.
+sys.path.insert(0, os.path.join(os.path.dirname(SERVICES_DIR), "api_gateway"))
+
+# The shared helpers are copied into each service image as `shared`.
+sys.path.insert(0, os.path.dirname(SERVICES_DIR))
@@ -0,0 +1,295 @@
+# test_api_gateway.py
+
+import asyncio
+import json
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from libraries.jobs import JobStore
+from libraries.translation_cache import TranslationCache
+from shared.transport import service_routes
+from top_secret.api_gateway import main
+
+
+@pytest.fixture(autouse=True)
+def fresh_upstreams(monkeypatch):
+    """
+    Gives each test closed circuits, full retry budgets and quick backoffs.
+    """
+    for name in ("openai_upstream", "command_upstream"):
+        upstream = getattr(main, name)
+        fresh = main.create_upstream(
+            upstream.name, upstream.timeout, upstream.breaker.slow_call_seconds
+        )
+        fresh.base_backoff = 0.001
+        monkeypatch.setattr(main, name, fresh)
+
+
+@pytest.fixture
+def upstreams(monkeypatch):
+    """
+    Mounts fake chatgpt and command executor services, recording how many
+    completions run at once. Commands run for `running_polls` status checks.
+    """
+    monkeypatch.setattr(main, "JOB_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(main, "http_client", None)
+    monkeypatch.setattr(main, "translation_cache", TranslationCache())
+    state = {"active": 0, "max_active": 0, "completions": 0, "running_polls": 0}
+    state["output"] = ""
+    state["deadlines"] = []
+    state["payloads"] = []
+    chatgpt = FastAPI()
+    executor = FastAPI()
+
+    @chatgpt.post("/completion")
+    async def completion(request: Request):
+        state["deadlines"].append(request.headers.get("x-request-timeout-ms"))
+        state["payloads"].append(await request.json())
+        state["active"] += 1
+        state["completions"] += 1
+        state["max_active"] = max(state["max_active"], state["active"])
+        await asyncio.sleep(0.05)
+        state["active"] -= 1
+        return {"completion": '{"command": "ls"}'}
+
+    @executor.get("/commands/status")
+    def command_status(process_id: int):
+        # The output grows while the command runs.
+        if state["running_polls"]:
+            state["running_polls"] -= 1
+            state["output"] += "partial\n"
+            return {"running": True, "output": state["output"]}
+        return {"running": False, "output": state["output"] + f"ran {process_id}"}
+
+    executor.post("/commands/start")(lambda: {"process_id": 7})
+    service_routes.mount(8001, chatgpt)
+    service_routes.mount(8003, executor)
+    yield state
+    service_routes.unmount(8001)
+    service_routes.unmount(8003)
+
+
+def parse_events(text):
+    return [json.loads(line[len("data: ") :]) for line in text.split("\n\n") if line]
+
+
+@pytest.mark.asyncio
+async def test_commands_are_handled_concurrently(upstreams):
+    async with main.app.router.lifespan_context(main.app):
+        client = main.upstream_client()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            started = await asyncio.gather(
+                *(
+                    c.post(
+                        "/execute_command/",
+                        json={"verbal_command": "tidy up downloads"},
+                    )
+                    for _ in range(5)
+                )
+            )
+            assert {r.status_code for r in started} == {202}
+            ids = [r.json()["job_id"] for r in started]
+            await asyncio.gather(*(c.get(f"/jobs/{i}/events") for i in ids))
+            jobs = [(await c.get(f"/jobs/{i}")).json() for i in ids]
+        assert main.upstream_client() is client
+    assert client.is_closed
+    assert [(j["status"], j["output"]) for j in jobs] == [("succeeded", "ran 7")] * 5
+    assert upstreams["max_active"] == 5
+
+
+@pytest.mark.asyncio
+async def test_job_events_follow_a_long_command(upstreams):
+    upstreams["running_polls"] = 2
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app), httpx.AsyncClient(
+        transport=transport, base_url="http://test"
+    ) as c:
+        started = await c.post("/execute_command/", json={"verbal_command": "tidy up"})
+        events = await c.get(f"/jobs/{started.json()['job_id']}/events")
+    assert events.headers["content-type"].startswith("text/event-stream")
+    assert parse_events(events.text) == [
+        {"type": "status", "status": "queued"},
+        {"type": "status", "status": "translating"},
+        {"type": "command", "command": "ls", "source": "llm"},
+        {"type": "status", "status": "running"},
+        {"type": "output", "output": "partial\n"},
+        {"type": "output", "output": "partial\n"},
+        {"type": "output", "output": "ran 7"},
+        {"type": "status", "status": "succeeded"},
+    ]
+    assert upstreams["payloads"][0]["similar"] is False
+
+
+@pytest.mark.asyncio
+async def test_commands_are_refused_while_too_many_jobs_run(upstreams, monkeypatch):
+    upstreams["running_polls"] = 1000
+    monkeypatch.setattr(main, "jobs", JobStore(max_jobs=1))
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app), httpx.AsyncClient(
+        transport=transport, base_url="http://test"
+    ) as c:
+        first = await c.post("/execute_command/", json={"verbal_command": "tidy up"})
+        second = await c.post("/execute_command/", json={"verbal_command": "tidy up"})
+        assert (first.status_code, second.status_code) == (202, 503)
+        assert (await c.get(f"/jobs/{first.json()['job_id']}")).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_repeated_commands_skip_the_llm(upstreams):
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app), httpx.AsyncClient(
+        transport=transport, base_url="http://test"
+    ) as c:
+        events = []
+        for verbal_command in ("Tidy up the downloads.", "please tidy up downloads"):
+            started = await c.post(
+                "/execute_command/", json={"verbal_command": verbal_command}
+            )
+            job_events = await c.get(f"/jobs/{started.json()['job_id']}/events")
+            events += parse_events(job_events.text)
+        stats = (await c.get("/translations/stats")).json()
+    commands = [event for event in events if event["type"] == "command"]
+    assert [event["source"] for event in commands] == ["llm", "cache"]
+    assert upstreams["completions"] == 1
+    assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (1, 1, 0.5)
+
+
+@pytest.mark.asyncio
+async def test_rules_translate_common_commands_locally(upstreams):
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app), httpx.AsyncClient(
+        transport=transport, base_url="http://test"
+    ) as c:
+        before = (await c.get("/translator/stats")).json()
+        started = await c.post(
+            "/execute_command/", json={"verbal_command": "Show me the files in /tmp"}
+        )
+        job_id = started.json()["job_id"]
+        events = parse_events((await c.get(f"/jobs/{job_id}/events")).text)
+        after = (await c.get("/translator/stats")).json()
+    assert {"type": "command", "command": "ls /tmp", "source": "rules"} in events
+    assert upstreams["completions"] == 0
+    assert after["matched"] == before["matched"] + 1
+
+
+def test_translation_admin_endpoints(upstreams, monkeypatch):
+    client = TestClient(main.app)
+    body = {"verbal_command": "Where am I?", "command": "pwd"}
+    assert client.put("/translations", json=body).status_code == 403
+    monkeypatch.setattr(main, "TRANSLATION_ADMIN_TOKEN", "s3cret")
+    wrong = client.put("/translations", json=body, headers={"X-Admin-Token": "x"})
+    assert wrong.status_code == 403
+    client.headers["X-Admin-Token"] = "s3cret"
+    pinned = client.put("/translations", json=body)
+    assert pinned.json()["key"] == "where am i"
+    assert pinned.json()["pinned"] is True
+    listed = client.get("/translations").json()["translations"]
+    assert [(t["command"], t["pinned"]) for t in listed] == [("pwd", True)]
+    deleted = client.delete("/translations", params={"verbal_command": "where am i"})
+    missing = client.delete("/translations", params={"verbal_command": "where am i"})
+    assert (deleted.status_code, missing.status_code) == (204, 404)
+    assert client.get("/translations").json() == {"translations": []}
+
+
+def test_job_websocket(upstreams):
+    with TestClient(main.app) as client:
+        job_id = client.post(
+            "/execute_command/", json={"verbal_command": "tidy up"}
+        ).json()["job_id"]
+        with client.websocket_connect(f"/jobs/{job_id}/ws") as websocket:
+            events = []
+            while not events or events[-1].get("status") != "succeeded":
+                events.append(websocket.receive_json())
+        assert {"type": "output", "output": "ran 7"} in events
+        assert client.get("/jobs/unknown").status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_upstream_timeout_fails_the_job(monkeypatch):
+    def handler(request):
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    upstream = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(main, "http_client", upstream)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        started = await c.post("/execute_command/", json={"verbal_command": "tidy up"})
+        job_id = started.json()["job_id"]
+        await c.get(f"/jobs/{job_id}/events")
+        job = (await c.get(f"/jobs/{job_id}")).json()
+    await upstream.aclose()
+    assert (job["status"], job["error"]) == ("failed", "ReadTimeout: timed out")
+    assert main.openai_upstream.stats()["retries"] == 2
+
+
+@pytest.mark.asyncio
+async def test_deadline_is_propagated_upstream(upstreams):
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app), httpx.AsyncClient(
+        transport=transport, base_url="http://test"
+    ) as c:
+        started = await c.post(
+            "/execute_command/",
+            json={"verbal_command": "tidy up"},
+            headers={"X-Request-Timeout-Ms": "5000"},
+        )
+        await c.get(f"/jobs/{started.json()['job_id']}/events")
+    assert 4000 < int(upstreams["deadlines"][0]) <= 5000
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_fails_jobs_fast(upstreams):
+    main.openai_upstream.breaker._open()
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app), httpx.AsyncClient(
+        transport=transport, base_url="http://test"
+    ) as c:
+        started = await c.post("/execute_command/", json={"verbal_command": "tidy up"})
+        job_id = started.json()["job_id"]
+        await c.get(f"/jobs/{job_id}/events")
+        job = (await c.get(f"/jobs/{job_id}")).json()
+        stats = (await c.get("/upstreams/stats")).json()
+    assert (job["status"], job["error"]) == (
+        "failed",
+        "Circuit of chatgpt_service is open",
+    )
+    assert upstreams["completions"] == 0
+    assert stats["chatgpt_service"]["breaker"]["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_unexpected_errors_fail_the_job(upstreams, monkeypatch):
+    async def broken_get(verbal_command):
+        raise RuntimeError("disk I/O error")
+
+    monkeypatch.setattr(main.translation_cache, "get", broken_get)
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app), httpx.AsyncClient(
+        transport=transport, base_url="http://test"
+    ) as c:
+        started = await c.post("/execute_command/", json={"verbal_command": "tidy up"})
+        job_id = started.json()["job_id"]
+        events = parse_events((await c.get(f"/jobs/{job_id}/events")).text)
+    assert events[-2:] == [
+        {"type": "error", "detail": "Unexpected error: RuntimeError: disk I/O error"},
+        {"type": "status", "status": "failed"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_cache_errors_do_not_fail_the_job(upstreams, monkeypatch):
+    async def broken_put(verbal_command, command):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(main.translation_cache, "put", broken_put)
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app), httpx.AsyncClient(
+        transport=transport, base_url="http://test"
+    ) as c:
+        started = await c.post("/execute_command/", json={"verbal_command": "tidy up"})
+        job_id = started.json()["job_id"]
+        await c.get(f"/jobs/{job_id}/events")
+        job = (await c.get(f"/jobs/{job_id}")).json()
+    assert (job["status"], job["output"]) == ("succeeded", "ran 7")
@@ -0,0 +1,29 @@
+# test_benchmarks.py
+
+import pytest
+from benchmarks.logging_service_bench import find_regressions, run_benchmarks
+
+
+@pytest.mark.asyncio
+async def test_benchmark_smoke(tmp_path):
+    report = await run_benchmarks(
+        messages=40, concurrency=4, batch_size=10, directory=str(tmp_path)
+    )
+    results = {result["scenario"]: result for result in report["results"]}
+    assert set(results) == {"log", "bulk", "datagram"}
+    assert results["log"]["messages"] == 40
+    assert results["bulk"]["requests"] == 4
+    assert all(result["bytes_per_message"] > 0 for result in results.values())
+
+
+def test_find_regressions():
+    baseline = {
+        "results": [{"scenario": "log", "msgs_per_sec": 1000, "latency_p99_ms": 2.0}]
+    }
+    report = {
+        "results": [{"scenario": "log", "msgs_per_sec": 700, "latency_p99_ms": 2.1}]
+    }
+    assert find_regressions(report, baseline, tolerance=0.2) == [
+        "log: 700 msgs/s, baseline 1000"
+    ]
+    assert find_regressions(report, baseline, tolerance=0.5) == []
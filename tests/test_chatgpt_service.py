@@ -0,0 +1,334 @@
+# test_chatgpt_service.py
+
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from libraries.completion_cache import CompletionCache
+from libraries.similarity_cache import SimilarityCache
+from top_secret.services.chatgpt_service import main
+
+client = TestClient(main.app)
+
+
+def completion(content):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))]
+    )
+
+
+@pytest.fixture
+def mock_completion(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    with patch(
+        "top_secret.services.chatgpt_service.main.OpenAIWrapper.get_completion",
+        new_callable=AsyncMock,
+        return_value=completion("Hi there"),
+    ) as mock_method:
+        yield mock_method
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = CompletionCache()
+    monkeypatch.setattr(main, "completion_cache", cache)
+    return cache
+
+
+def test_completion_without_cache(mock_completion):
+    response = client.post("/completion", json={"prompt": "Hello"})
+    assert response.status_code == 200
+    assert response.json() == {"completion": "Hi there"}
+    assert "X-Cache" not in response.headers
+
+
+def test_completion_cache_hit(mock_completion, cache):
+    first = client.post("/completion", json={"prompt": "Hello"})
+    second = client.post("/completion", json={"prompt": " Hello "})
+    assert (first.headers["X-Cache"], second.headers["X-Cache"]) == ("MISS", "HIT")
+    assert second.json() == {"completion": "Hi there"}
+    assert mock_completion.await_count == 1
+    assert client.get("/cache/stats").json()["hits"] == 1
+
+
+def test_completion_cache_control(mock_completion, cache):
+    client.post("/completion", json={"prompt": "Hello"})
+    refresh = client.post(
+        "/completion", json={"prompt": "Hello"}, headers={"Cache-Control": "no-cache"}
+    )
+    bypass = client.post("/completion", json={"prompt": "Hello", "cache": "bypass"})
+    assert refresh.headers["X-Cache"] == "REFRESH"
+    assert bypass.headers["X-Cache"] == "BYPASS"
+    assert mock_completion.await_count == 3
+
+
+def test_completion_similarity_cache(mock_completion, monkeypatch):
+    monkeypatch.setattr(main, "similarity_cache", SimilarityCache(threshold=0.6))
+    first = client.post("/completion", json={"prompt": "List the files in /tmp please"})
+    similar = client.post("/completion", json={"prompt": "list the files in /tmp"})
+    other_model = client.post(
+        "/completion", json={"prompt": "list the files in /tmp", "model": "gpt-4"}
+    )
+    assert (first.headers["X-Cache"], similar.headers["X-Cache"]) == ("MISS", "SIMILAR")
+    assert float(similar.headers["X-Cache-Similarity"]) >= 0.6
+    assert similar.json() == {"completion": "Hi there"}
+    assert other_model.headers["X-Cache"] == "MISS"
+    assert mock_completion.await_count == 2
+    assert client.get("/cache/similarity/stats").json()["hits"] == 1
+
+
+def test_completion_can_skip_the_similarity_cache(mock_completion, monkeypatch):
+    monkeypatch.setattr(main, "similarity_cache", SimilarityCache(threshold=0.6))
+    client.post("/completion", json={"prompt": "list the files in /tmp"})
+    skipped = client.post(
+        "/completion", json={"prompt": "list the files in /tmp", "similar": False}
+    )
+    client.post("/completion", json={"prompt": "list /var files", "similar": False})
+    assert skipped.headers["X-Cache"] == "MISS"
+    assert mock_completion.await_count == 3
+    assert main.similarity_cache.stats()["entries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_identical_completions_share_one_call(mock_completion):
+    async def slow_completion(*args):
+        await asyncio.sleep(0.05)
+        return completion("Hi there")
+
+    mock_completion.side_effect = slow_completion
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        responses = await asyncio.gather(
+            *(c.post("/completion", json={"prompt": "Hello"}) for _ in range(3))
+        )
+    assert [r.json() for r in responses] == [{"completion": "Hi there"}] * 3
+    assert mock_completion.await_count == 1
+
+
+@pytest.fixture
+def mock_stream(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    calls = []
+
+    async def deltas(self, messages, model="gpt-3.5-turbo"):
+        calls.append([dict(m) for m in messages])
+        for token in ("Hi", " there"):
+            yield {"type": "delta", "content": token}
+        yield {"type": "done", "finish_reason": "stop", "usage": None}
+
+    with patch.object(
+        main.OpenAIWrapperStream, "create_chat_completion_deltas", deltas
+    ):
+        yield calls
+
+
+def receive_turn(websocket):
+    frames = []
+    while not frames or frames[-1]["type"] not in ("done", "error"):
+        frames.append(websocket.receive_json())
+    return frames
+
+
+def test_stream_delta_mode_keeps_the_conversation(mock_stream):
+    with client.websocket_connect("/stream") as websocket:
+        websocket.send_text(json.dumps([{"role": "user", "content": "Hello"}]))
+        first = receive_turn(websocket)
+        websocket.send_text(json.dumps({"role": "user", "content": "Again"}))
+        second = receive_turn(websocket)
+    assert first == second
+    assert [f.get("content") for f in first] == ["Hi", " there", None]
+    assert first[-1] == {"type": "done", "finish_reason": "stop", "usage": None}
+    assert mock_stream[1] == [
+        {"role": "user", "content": "Hello"},
+        {"role": "assistant", "content": "Hi there"},
+        {"role": "user", "content": "Again"},
+    ]
+
+
+def test_stream_cumulative_mode(mock_stream):
+    with client.websocket_connect("/stream?mode=cumulative") as websocket:
+        websocket.send_text(json.dumps([{"role": "user", "content": "Hello"}]))
+        frames = receive_turn(websocket)
+        websocket.send_text("not json")
+        error = websocket.receive_json()
+    assert [f.get("content") for f in frames] == ["Hi", "Hi there", None]
+    assert frames[0]["type"] == "content"
+    assert error["type"] == "error"
+
+
+@pytest.mark.asyncio
+async def test_stream_wrapper_reports_finish_reason_and_usage(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+
+    def chunk(content=None, finish_reason=None, usage=None):
+        choices = [
+            SimpleNamespace(
+                delta=SimpleNamespace(content=content), finish_reason=finish_reason
+            )
+        ]
+        return SimpleNamespace(choices=[] if usage else choices, usage=usage)
+
+    async def stream():
+        for item in (chunk("Hi"), chunk(" there"), chunk(finish_reason="stop")):
+            yield item
+        yield chunk(usage={"completion_tokens": 2})
+
+    wrapper = main.OpenAIWrapperStream(clients=main.openai_clients)
+    create = AsyncMock(return_value=stream())
+    monkeypatch.setattr(wrapper.client.chat.completions, "create", create)
+    events = [e async for e in wrapper.create_chat_completion_deltas([])]
+    assert events == [
+        {"type": "delta", "content": "Hi"},
+        {"type": "delta", "content": " there"},
+        {"type": "done", "finish_reason": "stop", "usage": {"completion_tokens": 2}},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_stream_wrapper_holds_a_rate_limit_slot(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    limiter = main.RateLimiter()
+    model = limiter.for_model("gpt-3.5-turbo", "http://llm.local/v1")
+    headers = {"x-ratelimit-remaining-requests": "41"}
+
+    class Stream:
+        response = SimpleNamespace(headers=headers)
+
+        async def __aiter__(self):
+            assert model.in_flight == 1
+            yield SimpleNamespace(choices=[], usage=None)
+
+    wrapper = main.OpenAIWrapperStream(
+        base_url="http://llm.local/v1", clients=main.openai_clients, limiter=limiter
+    )
+    create = AsyncMock(return_value=Stream())
+    monkeypatch.setattr(wrapper.client.chat.completions, "create", create)
+    events = [e async for e in wrapper.create_chat_completion_deltas([])]
+    assert events[-1]["type"] == "done"
+    assert (model.in_flight, model.requests, model.remaining_requests) == (0, 1, 41)
+    assert set(limiter.stats()) == {"gpt-3.5-turbo@http://llm.local/v1"}
+
+
+def test_completion_streaming(mock_stream, cache):
+    body = {"prompt": "Hello", "streaming": True}
+    with client.stream("POST", "/completion", json=body) as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert response.headers["X-Cache"] == "MISS"
+        events = response.read().decode()
+    assert events == (
+        'data: {"content": "Hi"}\n\n'
+        'data: {"content": " there"}\n\n'
+        'event: done\ndata: {"finish_reason": "stop", "usage": null}\n\n'
+    )
+    cached = client.post("/completion", json=body)
+    assert cached.headers["X-Cache"] == "HIT"
+    assert cached.text.startswith('data: {"content": "Hi there"}\n\n')
+    assert len(mock_stream) == 1
+
+
+def test_completion_streaming_upstream_error(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    error = main.APIStatusError(
+        "unauthorized", response=httpx.Response(401, request=request), body=None
+    )
+
+    async def deltas(self, messages, model="gpt-3.5-turbo"):
+        raise error
+        yield
+
+    with patch.object(
+        main.OpenAIWrapperStream, "create_chat_completion_deltas", deltas
+    ):
+        response = client.post("/completion", json={"prompt": "Hi", "streaming": True})
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_completion_stream_disconnect_cancels_upstream():
+    flight = main.StreamFlight()
+    cancelled = asyncio.Event()
+
+    async def upstream():
+        try:
+            yield {"type": "delta", "content": "Hi"}
+            await asyncio.sleep(10)
+        finally:
+            cancelled.set()
+
+    events = flight.subscribe("k", upstream)
+    first = await anext(events)
+    body = main.stream_completion_events(first, events, None)
+    assert await anext(body) == 'data: {"content": "Hi"}\n\n'
+    reader = asyncio.ensure_future(anext(body))
+    await asyncio.sleep(0.01)
+    reader.cancel()
+    await asyncio.wait_for(cancelled.wait(), 1)
+
+
+def test_completion_batch(mock_completion, monkeypatch):
+    monkeypatch.setattr(main, "COMPLETION_BATCH_CONCURRENCY", 2)
+    running = peak = 0
+
+    async def get_completion(prompt, model):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01 if prompt != "slow" else 0.05)
+        running -= 1
+        if prompt == "bad":
+            raise main.HTTPException(status_code=429, detail="Slow down")
+        return completion(prompt.upper())
+
+    mock_completion.side_effect = get_completion
+    prompts = ["slow", "a", "bad", "b", "c"]
+    response = client.post(
+        "/completion/batch", json={"prompts": prompts, "concurrency": 5}
+    )
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["index"] for line in lines) == [0, 1, 2, 3, 4]
+    assert lines[-1] == {"index": 0, "completion": "SLOW"}
+    assert {"index": 2, "status": 429, "error": "Slow down"} in lines
+    assert {"index": 4, "completion": "C"} in lines
+    assert peak == 2
+
+
+def test_completion_batch_validation(mock_completion):
+    assert client.post("/completion/batch", json={"prompts": []}).status_code == 422
+
+
+def test_session_sends_trimmed_history(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(main, "SESSION_TOKEN_BUDGET", 40)
+    sent = []
+
+    async def create_completion(self, model, messages, **kwargs):
+        sent.append(list(messages))
+        reply = SimpleNamespace(role="assistant", content="x" * 60)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=reply)],
+            model_dump_json=lambda indent=2: '{"ok": true}',
+        )
+
+    with patch.object(main.OpenAIWrapperJson, "create_completion", create_completion):
+        created = client.post(
+            "/sessions", json={"messages": [{"role": "system", "content": "Be"}]}
+        )
+        assert created.status_code == 201
+        session_id = created.json()["session_id"]
+        for text in ("one", "two", "three"):
+            response = client.post(
+                f"/sessions/{session_id}/messages",
+                json={"role": "user", "content": text},
+            )
+            assert response.json() == '{"ok": true}'
+    assert [m["content"] for m in sent[0]] == ["Be", "one"]
+    assert [m["content"] for m in sent[2]] == ["Be", "two", "x" * 60, "three"]
+    history = client.get(f"/sessions/{session_id}").json()
+    assert history["trimmed"] == 2
+    assert client.delete(f"/sessions/{session_id}").status_code == 204
+    assert client.get(f"/sessions/{session_id}").status_code == 404
@@ -0,0 +1,84 @@
+# test_command_rules.py
+
+import os
+import pytest
+from libraries.command_rules import CommandTranslator
+from top_secret.api_gateway import main
+
+RULES = [
+    {"command": "ls", "patterns": ["list files", "show me the files"]},
+    {"command": "ls {path}", "patterns": ["list {path}", "list files in {path}"]},
+    {"command": "tail -n {count} {path}", "patterns": ["last {count} lines of {path}"]},
+    {"command": "pgrep -a {name}", "patterns": ["is {name} running"]},
+    {"command": "kill {name}", "patterns": ["is {name} running"]},
+]
+
+
+def test_translates_with_slots():
+    translator = CommandTranslator(RULES)
+    match = translator.translate("The LAST 20 lines of ~/app.log, please.")
+    assert match.command == "tail -n 20 ~/app.log"
+    assert match.slots == {"count": "20", "path": "~/app.log"}
+    assert translator.translate("list files in /var/log").command == "ls /var/log"
+
+
+def test_literal_words_win_over_slots():
+    translator = CommandTranslator(RULES)
+    assert translator.translate("list files").command == "ls"
+    assert translator.translate("list docs").command == "ls docs"
+
+
+def test_unsafe_slot_values_do_not_match():
+    translator = CommandTranslator(RULES)
+    assert translator.translate("list -rf") is None
+    assert translator.translate("last many lines of app.log") is None
+
+
+def test_ambiguous_and_unmatched_phrases_fall_through():
+    translator = CommandTranslator(RULES)
+    assert translator.translate("is nginx running") is None
+    assert translator.translate("delete everything") is None
+    translator.translate("list files")
+    stats = translator.stats()
+    assert (stats["matched"], stats["ambiguous"], stats["unmatched"]) == (1, 1, 1)
+    assert stats["coverage"] == pytest.approx(1 / 3)
+
+
+def test_patterns_must_give_the_command_slots():
+    with pytest.raises(ValueError):
+        CommandTranslator([{"command": "ls {path}", "patterns": ["list files"]}])
+    with pytest.raises(ValueError):
+        CommandTranslator([{"command": "ls", "patterns": ["list {folder}"]}])
+
+
+def test_shipped_rules_load():
+    path = os.path.join(os.path.dirname(main.__file__), "command_rules.json")
+    translator = CommandTranslator.from_file(path)
+    assert translator.translate("where am I?").command == "pwd"
+    assert translator.translate("show disk usage").command == "df -h"
+    assert translator.translate("show running processes").command == "ps aux"
+    assert translator.translate("list /var/log").command == "ls /var/log"
+    assert translator.translate("read ./Notes.txt").command == "cat ./Notes.txt"
+
+
+@pytest.mark.parametrize(
+    "phrase",
+    ["list users", "list ports", "list containers", "print date", "read logs"],
+)
+def test_shipped_rules_leave_bare_words_to_the_llm(phrase):
+    path = os.path.join(os.path.dirname(main.__file__), "command_rules.json")
+    assert CommandTranslator.from_file(path).translate(phrase) is None
+
+
+def test_slots_keep_the_original_case():
+    translator = CommandTranslator(RULES)
+    match = translator.translate("Last 5 lines of /home/Bob/README.md")
+    assert match.command == "tail -n 5 /home/Bob/README.md"
+    assert translator.translate("LIST ./Makefile").command == "ls ./Makefile"
+
+
+def test_pronouns_do_not_fill_slots():
+    translator = CommandTranslator([RULES[3]])
+    assert translator.translate("is Xorg running").command == "pgrep -a Xorg"
+    assert translator.translate("is it running") is None
+    assert translator.translate("is That running") is None
@@ -0,0 +1,60 @@
+# test_completion_cache.py
+
+import pytest
+from libraries.completion_cache import CompletionCache, cache_key, cache_mode
+
+
+def test_cache_key_normalizes_messages():
+    key = cache_key("gpt", [{"role": "user", "content": "Hello\r\nworld "}])
+    assert key == cache_key("gpt", [{"role": "user", "content": " Hello\nworld"}])
+    assert key != cache_key("gpt-4", [{"role": "user", "content": "Hello\nworld"}])
+    assert key != cache_key(
+        "gpt", [{"role": "user", "content": "Hello\nworld"}], base_url="http://x"
+    )
+
+
+def test_cache_mode_from_header():
+    assert cache_mode(None, "no-store") == "bypass"
+    assert cache_mode(None, "max-age=0, no-cache") == "refresh"
+    assert cache_mode(None, None) == "use"
+    assert cache_mode("bypass", "no-cache") == "bypass"
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction_and_counters():
+    cache = CompletionCache(max_entries=2)
+    await cache.put("a", "A")
+    await cache.put("b", "B")
+    assert await cache.get("a") == "A"
+    await cache.put("c", "C")
+    assert await cache.get("b") is None
+    assert await cache.get("a") == "A"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["stores"]) == (2, 1, 3)
+
+
+@pytest.mark.asyncio
+async def test_entries_expire(monkeypatch):
+    cache = CompletionCache(ttl=10)
+    now = [1000.0]
+    monkeypatch.setattr("libraries.completion_cache.time.time", lambda: now[0])
+    await cache.put("a", "A")
+    now[0] += 11
+    assert await cache.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_persistent_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "completions.db")
+    cache = CompletionCache(path=path)
+    cache.open()
+    await cache.put("a", {"text": "A"})
+    cache.close()
+
+    restarted = CompletionCache(path=path)
+    restarted.open()
+    assert await restarted.get("a") == {"text": "A"}
+    assert restarted.disk_hits == 1
+    assert await restarted.get("a") == {"text": "A"}
+    assert restarted.disk_hits == 1
+    restarted.close()
@@ -0,0 +1,37 @@
+# test_deadline.py
+
+import asyncio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from shared.deadline import Deadline, DeadlineMiddleware
+
+app = FastAPI()
+app.add_middleware(DeadlineMiddleware)
+
+
+@app.get("/slow")
+async def slow():
+    await asyncio.sleep(0.2)
+    return {"done": True}
+
+
+client = TestClient(app)
+
+
+def test_requests_without_deadline_run_to_completion():
+    assert client.get("/slow").json() == {"done": True}
+
+
+def test_requests_past_their_deadline_are_abandoned():
+    response = client.get("/slow", headers={"X-Request-Timeout-Ms": "20"})
+    assert response.status_code == 504
+    assert response.json() == {"detail": "Deadline exceeded"}
+    assert client.get("/slow", headers={"X-Request-Timeout-Ms": "0"}).status_code == (
+        504
+    )
+
+
+def test_deadline_header_parsing():
+    assert Deadline.from_header("nonsense") is None
+    assert Deadline.from_header(None) is None
+    assert 0.9 < Deadline.from_header("1000").remaining() <= 1.0
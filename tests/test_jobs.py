@@ -0,0 +1,70 @@
+# test_jobs.py
+
+import asyncio
+import pytest
+from libraries.jobs import JobStore, TooManyJobs
+
+
+def test_store_evicts_finished_jobs_first():
+    store = JobStore(max_jobs=2)
+    running = store.create("sleep 100")
+    finished = store.create("ls")
+    finished.set_status("succeeded")
+    store.create("pwd")
+    assert store.get(finished.job_id) is None
+    assert store.get(running.job_id) is running
+    assert (len(store), store.evicted) == (2, 1)
+
+
+def test_store_refuses_jobs_when_none_is_over():
+    store = JobStore(max_jobs=2)
+    running = [store.create("sleep 100"), store.create("sleep 200")]
+    with pytest.raises(TooManyJobs):
+        store.create("ls")
+    assert [store.get(job.job_id) for job in running] == running
+    running[0].set_status("failed")
+    store.create("ls")
+    assert store.get(running[0].job_id) is None
+
+
+def test_output_events_carry_only_new_output():
+    job = JobStore().create("tail log")
+    for output in ("one\n", "one\ntwo\n", "one\ntwo\n", "three\n"):
+        job.set_output(output)
+    assert job.output == "three\n"
+    assert job.events[1:] == [
+        {"type": "output", "output": "one\n"},
+        {"type": "output", "output": "two\n"},
+        {"type": "output", "output": "three\n", "replace": True},
+    ]
+
+
+def test_store_expires_finished_jobs():
+    store = JobStore(ttl=60)
+    job = store.create("ls")
+    assert store.get(job.job_id) is job
+    job.fail("boom")
+    job.finished_at -= 61
+    assert store.get(job.job_id) is None
+
+
+@pytest.mark.asyncio
+async def test_follow_replays_then_waits_for_events():
+    job = JobStore().create("ls")
+    job.set_status("running")
+    events = []
+
+    async def follow():
+        async for event in job.follow():
+            events.append(event)
+
+    follower = asyncio.ensure_future(follow())
+    await asyncio.sleep(0)
+    assert [e.get("status") for e in events] == ["queued", "running"]
+    job.set_output("file")
+    job.set_status("succeeded")
+    await asyncio.wait_for(follower, 1)
+    assert events[2:] == [
+        {"type": "output", "output": "file"},
+        {"type": "status", "status": "succeeded"},
+    ]
@@ -0,0 +1,149 @@
+# test_log_client.py
+
+import asyncio
+import gzip
+import json
+import httpx
+import pytest
+from shared.logger import DatagramLogClient, LogClient, create_log_client
+
+
+class FakeLoggingService:
+    """Records the batches posted to /log/bulk, optionally failing."""
+
+    def __init__(self):
+        self.batches = []
+        self.down = False
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if self.down:
+            raise httpx.ConnectError("connection refused", request=request)
+        body = request.content
+        if request.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        self.batches.append([json.loads(line) for line in body.splitlines()])
+        return httpx.Response(200, json={"status": "success"})
+
+    @property
+    def messages(self):
+        return [record["message"] for batch in self.batches for record in batch]
+
+
+@pytest.fixture
+def service():
+    return FakeLoggingService()
+
+
+def make_client(service, tmp_path, **kwargs):
+    return LogClient(
+        base_url="http://logging",
+        service="test",
+        flush_interval=0.01,
+        spill_path=str(tmp_path / "spill.ndjson"),
+        transport=httpx.MockTransport(service.handle),
+        **kwargs,
+    )
+
+
+@pytest.mark.asyncio
+async def test_records_are_sent_in_batches(service, tmp_path):
+    client = make_client(service, tmp_path, batch_size=3)
+    await client.start()
+    for i in range(7):
+        client.log(f"message {i}", level="INFO")
+    await client.flush()
+    assert [len(batch) for batch in service.batches] == [3, 3, 1]
+    assert service.messages == [f"message {i}" for i in range(7)]
+    assert service.batches[0][0]["service"] == "test"
+    assert service.batches[0][0]["level"] == "INFO"
+    await client.stop()
+
+
+@pytest.mark.asyncio
+async def test_records_logged_before_start_are_sent(service, tmp_path):
+    client = make_client(service, tmp_path)
+    client.log("early")
+    await client.start()
+    await client.stop()
+    assert service.messages == ["early"]
+
+
+@pytest.mark.parametrize(
+    "overflow, expected", [("drop_oldest", ["b", "c"]), ("drop_newest", ["a", "b"])]
+)
+@pytest.mark.asyncio
+async def test_full_queue_drops_records(service, tmp_path, overflow, expected):
+    client = make_client(service, tmp_path, max_queue_size=2, overflow=overflow)
+    for message in ["a", "b", "c"]:
+        client.log(message)
+    assert client.dropped == 1
+    await client.start()
+    await client.stop()
+    assert service.messages == expected
+
+
+@pytest.mark.asyncio
+async def test_unreachable_service_spills_and_replays(service, tmp_path):
+    client = make_client(service, tmp_path, retry_interval=0.05)
+    service.down = True
+    await client.start()
+    client.log("one")
+    await client.flush()
+    client.log("two")
+    await client.flush()
+    assert (tmp_path / "spill.ndjson").exists()
+
+    service.down = False
+    await asyncio.sleep(0.1)
+    client.log("three")
+    await client.flush()
+    assert service.messages == ["one", "two", "three"]
+    assert not (tmp_path / "spill.ndjson").exists()
+    await client.stop()
+
+
+@pytest.mark.asyncio
+async def test_invalid_records_are_dropped_alone(service, tmp_path):
+    client = make_client(service, tmp_path)
+    await client.start()
+    assert client.log("kept")
+    assert not client.log("")
+    assert not client.log("nan", fields={"ms": float("nan")})
+    assert not client.log("huge", fields={"n": 10**400})
+    assert not client.log("surrogate \ud800")
+    assert not client.log("long", trace_id="x" * 300)
+    assert client.log("also kept", fields={"ms": 2})
+    await client.flush()
+    assert service.messages == ["kept", "also kept"]
+    assert client.dropped == 5
+    await client.stop()
+
+
+def test_spill_while_replaying(service, tmp_path):
+    client = make_client(service, tmp_path)
+    (tmp_path / "spill.ndjson.replay").write_text('{"message": "old"}\n')
+    client._spill([{"message": "new"}])
+    assert (tmp_path / "spill.ndjson").read_text() == '{"message": "new"}\n'
+    assert client.dropped == 0
+
+
+@pytest.mark.parametrize(
+    "attributes",
+    [{"fields": {"ms": "slow"}}, {"trace_id": "x" * 70000}, {"service": 3}],
+)
+def test_datagram_client_drops_malformed_records(attributes):
+    client = DatagramLogClient("udp://127.0.0.1:9")
+    assert client.log("boom", **attributes) is False
+    assert client.dropped == 1
+
+
+def test_invalid_overflow_is_rejected():
+    with pytest.raises(ValueError):
+        LogClient(overflow="block")
+
+
+def test_create_log_client_modes():
+    assert isinstance(create_log_client("http"), LogClient)
+    assert isinstance(create_log_client("datagram"), DatagramLogClient)
+    with pytest.raises(ValueError):
+        create_log_client("carrier-pigeon")
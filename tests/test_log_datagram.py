@@ -0,0 +1,113 @@
+# test_log_datagram.py
+
+import asyncio
+import socket
+import pytest
+from libraries.log_datagram import LogDatagramServer, parse_datagram
+from libraries.log_segments import iter_segment_records
+from libraries.log_storage import LogStorage
+from shared.logger import DATAGRAM_BINARY, DatagramLogClient, encode_datagram_frame
+
+
+def test_parse_json_datagram():
+    data = b'{"message": "one", "level": "info"}\n{"message": "two"}\n'
+    assert parse_datagram(data) == [
+        {"message": "one", "level": "info"},
+        {"message": "two"},
+    ]
+
+
+def test_parse_binary_datagram():
+    record = {
+        "message": "served",
+        "service": "api",
+        "trace_id": "t-1",
+        "timestamp": 1700000000.5,
+        "fields": {"duration_ms": 3.25},
+    }
+    data = DATAGRAM_BINARY + encode_datagram_frame(record) * 2
+    assert parse_datagram(data) == [record, record]
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"",
+        b"not json",
+        b'{"message": ""}',
+        b'{"message": "x", "fields": {"n": "ten"}}',
+        b'{"message": "x", "fields": {"n": 1e999}}',
+        b'{"message": "x", "timestamp": NaN}',
+        b'{"message": "boom \\ud800"}',
+        b'{"message": "x", "level": "\\udfff"}',
+        b'{"message": "x", "fields": {"\\ud800": 1}}',
+        b'{"message": "x", "fields": {"n": 1%s}}' % (b"0" * 400),
+        DATAGRAM_BINARY
+        + encode_datagram_frame({"message": "x", "fields": {"n": float("inf")}}),
+        DATAGRAM_BINARY + encode_datagram_frame({"message": "cut"})[:-2],
+    ],
+)
+def test_invalid_datagrams_are_rejected(data):
+    with pytest.raises(ValueError):
+        parse_datagram(data)
+
+
+@pytest.mark.asyncio
+async def test_datagrams_reach_storage(tmp_path):
+    storage = LogStorage(str(tmp_path / "segments"), flush_interval=0.01)
+    server = LogDatagramServer(
+        storage,
+        udp_address=("127.0.0.1", 0),
+        unix_path=str(tmp_path / "ingest.sock"),
+    )
+    await storage.start()
+    await server.start()
+    host, port = server.addresses[0]
+    udp = DatagramLogClient(f"udp://{host}:{port}", service="udp-sender")
+    unix = DatagramLogClient(f"unix://{tmp_path / 'ingest.sock'}")
+    assert udp.log("over udp", level="INFO")
+    assert unix.log("over unix", fields={"n": 1})
+    for _ in range(50):
+        if server.protocol.received == 2:
+            break
+        await asyncio.sleep(0.01)
+    await udp.stop()
+    await unix.stop()
+    await server.stop()
+    await storage.stop()
+
+    records = [
+        record
+        for segment in storage.segments()
+        for record in iter_segment_records(storage.log_directory, segment)
+    ]
+    assert sorted(record["message"] for record in records) == ["over udp", "over unix"]
+    by_message = {record["message"]: record for record in records}
+    assert by_message["over udp"]["service"] == "udp-sender"
+    assert by_message["over unix"]["fields"] == {"n": 1.0}
+    assert all("timestamp" in record for record in records)
+
+
+@pytest.mark.asyncio
+async def test_unencodable_datagram_does_not_stop_ingestion(tmp_path):
+    storage = LogStorage(str(tmp_path / "segments"), flush_interval=0.01)
+    server = LogDatagramServer(storage, udp_address=("127.0.0.1", 0))
+    await storage.start()
+    await server.start()
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender.sendto(b'{"message": "boom \\ud800"}', server.addresses[0])
+    sender.sendto(b'{"message": "fine"}', server.addresses[0])
+    sender.close()
+    for _ in range(50):
+        if server.protocol.received == 1:
+            break
+        await asyncio.sleep(0.01)
+    await asyncio.wait_for(storage.flush(), timeout=1)
+    await server.stop()
+    await storage.stop()
+    messages = [
+        record["message"]
+        for segment in storage.segments()
+        for record in iter_segment_records(storage.log_directory, segment)
+    ]
+    assert messages == ["fine"]
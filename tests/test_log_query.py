@@ -0,0 +1,107 @@
+# test_log_query.py
+
+import asyncio
+import pytest
+from libraries.log_query import LogQuery, LogReader
+from libraries.log_storage import LogStorage
+
+
+async def fill_storage(storage, batches):
+    """Stores each batch with its own timestamp and returns the timestamps."""
+    timestamps = []
+    for batch in batches:
+        storage.store_records(batch)
+        timestamps.append(storage._last_ts)
+        await storage.flush()
+        await asyncio.sleep(0.02)
+    return timestamps
+
+
+@pytest.fixture(
+    params=[
+        ("gzip", "jsonl"),
+        ("none", "jsonl"),
+        ("gzip", "binary"),
+        ("none", "binary"),
+    ]
+)
+def storage(tmp_path, request):
+    compression, segment_format = request.param
+    return LogStorage(
+        str(tmp_path),
+        flush_interval=0.01,
+        segment_max_bytes=400,
+        index_interval=100,
+        compression=compression,
+        segment_format=segment_format,
+    )
+
+
+@pytest.mark.asyncio
+async def test_query_time_range_across_segments(storage):
+    await storage.start()
+    batches = [
+        [{"message": f"batch {i} line {j}", "service": "api"} for j in range(4)]
+        for i in range(6)
+    ]
+    timestamps = await fill_storage(storage, batches)
+    await asyncio.to_thread(storage._compress_sealed)
+    reader = LogReader(storage)
+
+    result = reader.query(LogQuery(since=timestamps[2], until=timestamps[3]))
+    assert [r["message"] for r in result.records] == [
+        f"batch {i} line {j}" for i in (2, 3) for j in range(4)
+    ]
+    assert result.next_cursor is None
+    assert len(storage.segments()) > 2
+    await storage.stop()
+
+
+@pytest.mark.asyncio
+async def test_query_cursor_pagination(storage):
+    await storage.start()
+    await fill_storage(
+        storage,
+        [
+            [{"message": f"message {i}"} for i in range(b * 5, b * 5 + 5)]
+            for b in range(4)
+        ],
+    )
+    await asyncio.to_thread(storage._compress_sealed)
+    reader = LogReader(storage)
+
+    messages, cursor = [], None
+    while True:
+        result = reader.query(LogQuery(limit=3, cursor=cursor))
+        messages.extend(r["message"] for r in result.records)
+        cursor = result.next_cursor
+        if cursor is None:
+            break
+    assert messages == [f"message {i}" for i in range(20)]
+    await storage.stop()
+
+
+@pytest.mark.asyncio
+async def test_query_filters(storage):
+    await storage.start()
+    await fill_storage(
+        storage,
+        [
+            [
+                {"message": 'disk "sda" full', "service": "api", "level": "ERROR"},
+                {"message": "request served", "service": "api", "level": "INFO"},
+                {"message": "disk check ok", "service": "worker", "level": "info"},
+            ]
+        ],
+    )
+    reader = LogReader(storage)
+
+    def messages(**filters):
+        return [r["message"] for r in reader.query(LogQuery(**filters)).records]
+
+    assert messages(service="worker") == ["disk check ok"]
+    assert messages(level="info") == ["request served", "disk check ok"]
+    assert messages(contains='"sda"') == ['disk "sda" full']
+    assert messages(contains="disk", level="INFO") == ["disk check ok"]
+    assert messages(regex=r"^re\w+ served$") == ["request served"]
+    await storage.stop()
@@ -0,0 +1,78 @@
+# test_log_records.py
+
+import json
+import pytest
+from libraries.log_query import LogQuery, LogReader
+from libraries.log_records import (
+    FRAME_LENGTH,
+    decode_record,
+    encode_record,
+    format_record_text,
+    iter_frames,
+)
+from libraries.log_storage import LogStorage
+
+RECORD = {
+    "ts": 1700000000.25,
+    "message": "request served ✓",
+    "service": "gateway",
+    "level": "info",
+    "trace_id": "abc123",
+    "timestamp": 1699999999.5,
+    "fields": {"duration_ms": 12.5, "status": 200.0},
+}
+
+
+@pytest.mark.parametrize("segment_format", ["jsonl", "binary"])
+def test_records_round_trip(segment_format):
+    minimal = {"ts": 1.0, "message": "hello"}
+    data = encode_record(RECORD, segment_format) + encode_record(
+        minimal, segment_format
+    )
+    records = [
+        decode_record(raw, segment_format)
+        for _, raw in iter_frames(data, 0, len(data), 100, segment_format)
+    ]
+    assert records == [RECORD, minimal]
+
+
+def test_binary_encoding_is_smaller_than_json():
+    assert len(encode_record(RECORD, "binary")) < len(encode_record(RECORD, "jsonl"))
+
+
+def test_incomplete_binary_frame_is_not_yielded():
+    data = encode_record(RECORD, "binary")
+    truncated = data + data[: FRAME_LENGTH.size + 3]
+    offsets = [
+        offset for offset, _ in iter_frames(truncated, 0, len(truncated), 0, "binary")
+    ]
+    assert offsets == [0]
+
+
+def test_format_record_text():
+    assert format_record_text(RECORD) == (
+        "2023-11-14T22:13:19.500000+00:00 INFO [gateway] request served ✓ "
+        "trace_id=abc123 duration_ms=12.5 status=200"
+    )
+
+
+@pytest.mark.asyncio
+async def test_export_binary_segments(tmp_path):
+    storage = LogStorage(str(tmp_path), flush_interval=0.01, segment_format="binary")
+    await storage.start()
+    storage.store_records(
+        [
+            {"message": "first", "level": "info", "fields": {"n": 1}},
+            {"message": "second", "level": "error"},
+        ]
+    )
+    await storage.flush()
+    reader = LogReader(storage)
+
+    lines = list(reader.export(LogQuery(), "jsonl"))
+    assert [json.loads(line)["message"] for line in lines] == ["first", "second"]
+    assert json.loads(lines[0])["fields"] == {"n": 1.0}
+    text = list(reader.export(LogQuery(level="error"), "text"))
+    assert len(text) == 1 and text[0].endswith(" ERROR second\n")
+    assert storage.segments()[0].file.endswith(".bin")
+    await storage.stop()
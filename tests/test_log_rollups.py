@@ -0,0 +1,103 @@
+# test_log_rollups.py
+
+import sys
+import pytest
+from libraries.log_query import LogReader
+from libraries.log_rollups import LogRollups
+from libraries.log_storage import LogStorage
+
+
+def test_counts_per_bucket_service_and_level(tmp_path):
+    rollups = LogRollups(str(tmp_path), bucket_seconds=60)
+    rollups.add(
+        [
+            {"ts": 0.0, "message": "a", "service": "api", "level": "ERROR"},
+            {"ts": 10.0, "message": "b", "service": "api", "level": "error"},
+            {"ts": 30.0, "message": "c", "service": "web", "level": "info"},
+            {"ts": 75.0, "message": "d", "service": "api", "level": "error"},
+        ]
+    )
+    result = rollups.stats(0, 119, level="Error")
+    assert [
+        (b.start, [(c.service, c.count) for c in b.counts]) for b in result.buckets
+    ] == [
+        (0, [("api", 2)]),
+        (60, [("api", 1)]),
+    ]
+    assert rollups.stats(60, 119, service="web").buckets == []
+
+
+def test_field_histograms(tmp_path):
+    rollups = LogRollups(str(tmp_path), bucket_seconds=60)
+    rollups.add(
+        [
+            {"ts": 1.0, "message": "x", "service": "api", "fields": {"ms": value}}
+            for value in (0.0, 3.0, 4.0, 100.0, float("inf"), float("nan"))
+        ]
+    )
+    (stats,) = rollups.stats(0, 59, field="ms").buckets[0].fields
+    assert (stats.count, stats.sum, stats.min, stats.max) == (4, 107.0, 0.0, 100.0)
+    assert [(b.le, b.count) for b in stats.histogram] == [
+        (0.0, 1),
+        (4.0, 2),
+        (128.0, 1),
+    ]
+
+
+def test_huge_field_values_stay_finite(tmp_path):
+    rollups = LogRollups(str(tmp_path), bucket_seconds=60)
+    rollups.add(
+        [
+            {"ts": 1.0, "message": "x", "fields": {"n": value}}
+            for value in (1e308, 1e308, 2.0**1000)
+        ]
+    )
+    (stats,) = rollups.stats(0, 59).buckets[0].fields
+    assert stats.sum == sys.float_info.max
+    assert [(b.le, b.count) for b in stats.histogram] == [
+        (2.0**1000, 1),
+        (sys.float_info.max, 2),
+    ]
+
+
+def test_zero_retention_keeps_every_bucket(tmp_path):
+    rollups = LogRollups(str(tmp_path), bucket_seconds=60, retention=0)
+    rollups.add([{"ts": ts, "message": "m"} for ts in (0.0, 120.0, 240.0, 360.0)])
+    rollups.expire(now=1000.0)
+    assert [b.start for b in rollups.stats(0, 400).buckets] == [0, 120, 240, 360]
+
+
+def test_expire_discards_old_buckets(tmp_path):
+    rollups = LogRollups(str(tmp_path), bucket_seconds=60, retention=120)
+    rollups.add([{"ts": 0.0, "message": "old"}, {"ts": 300.0, "message": "new"}])
+    rollups.expire(now=330.0)
+    assert [b.start for b in rollups.stats(0, 400).buckets] == [300]
+
+
+@pytest.mark.asyncio
+async def test_rollups_survive_restart_without_rescan(tmp_path):
+    storage = LogStorage(str(tmp_path), flush_interval=0.01)
+    rollups = LogRollups(str(tmp_path))
+    storage.add_listener(lambda records: rollups.add(records, storage.end_offset))
+    await storage.start()
+    storage.store_records([{"message": "saved", "level": "info"}] * 3)
+    await storage.flush()
+    await rollups.save()
+    saved_offset = rollups.offset
+    # Stored after the last save, e.g. right before a crash.
+    storage.store_records([{"message": "unsaved", "level": "info"}] * 2)
+    await storage.stop()
+
+    restarted = LogStorage(str(tmp_path), flush_interval=0.01)
+    await restarted.start()
+    reloaded = LogRollups(str(tmp_path))
+    reloaded.load()
+    assert reloaded.offset == saved_offset
+    replayed = list(LogReader(restarted).iter_raw_records(cursor=reloaded.offset))
+    assert len(replayed) == 2
+    reloaded.catch_up(iter(replayed), restarted.end_offset)
+    await restarted.stop()
+
+    (bucket,) = reloaded.stats(0, 2**40).buckets
+    assert [(c.level, c.count) for c in bucket.counts] == [("info", 5)]
+    assert reloaded.offset == restarted.end_offset
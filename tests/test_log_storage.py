@@ -0,0 +1,166 @@
+# test_log_storage.py
+
+import asyncio
+import os
+import pytest
+from libraries.log_segments import iter_segment_records
+from libraries.log_storage import LogStorage
+
+
+def read_messages(storage):
+    messages = []
+    for segment in storage.segments():
+        for record in iter_segment_records(storage.log_directory, segment):
+            messages.append(record["message"])
+    return messages
+
+
+@pytest.mark.asyncio
+async def test_store_writes_messages_in_order(tmp_path):
+    storage = LogStorage(str(tmp_path / "segments"), flush_interval=0.01)
+    await storage.start()
+    for i in range(5):
+        storage.store(f"message {i}")
+    await storage.flush()
+    assert read_messages(storage) == [f"message {i}" for i in range(5)]
+    await storage.stop()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_messages_share_one_batch(tmp_path, monkeypatch):
+    storage = LogStorage(str(tmp_path), flush_interval=0.05, durability="fsync")
+    batches = []
+    write_batch = storage._write_batch
+
+    def record_batch(batch):
+        batches.append(list(batch))
+        return write_batch(batch)
+
+    monkeypatch.setattr(storage, "_write_batch", record_batch)
+    await storage.start()
+
+    async def log(i):
+        storage.store(f"message {i}")
+        await storage.flush()
+
+    await asyncio.gather(*(log(i) for i in range(20)))
+    assert len(batches) == 1
+    assert read_messages(storage) == [f"message {i}" for i in range(20)]
+    await storage.stop()
+
+
+@pytest.mark.asyncio
+async def test_unencodable_records_are_skipped(tmp_path):
+    storage = LogStorage(str(tmp_path), flush_interval=0.01)
+    await storage.start()
+    storage.store_records([{"message": m} for m in ["a", "bad \ud800", "c"]])
+    await storage.flush()
+    assert read_messages(storage) == ["a", "c"]
+    assert storage.dropped == 1
+    await storage.stop()
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_does_not_stop_the_writer(tmp_path, monkeypatch):
+    storage = LogStorage(str(tmp_path), flush_interval=0.01)
+    write_batch = storage._write_batch
+    failures = [RuntimeError("boom")]
+
+    def flaky_write(batch):
+        if failures:
+            raise failures.pop()
+        return write_batch(batch)
+
+    monkeypatch.setattr(storage, "_write_batch", flaky_write)
+    await storage.start()
+    storage.store("lost")
+    with pytest.raises(RuntimeError):
+        await storage.flush()
+    storage.store("kept")
+    await asyncio.wait_for(storage.flush(), timeout=1)
+    assert read_messages(storage) == ["kept"]
+    await storage.stop()
+
+
+@pytest.mark.asyncio
+async def test_max_batch_size_triggers_write(tmp_path):
+    storage = LogStorage(str(tmp_path), flush_interval=60, max_batch_size=3)
+    await storage.start()
+    storage.store_records([{"message": m} for m in ["a", "b", "c"]])
+    await asyncio.wait_for(storage.flush(), timeout=1)
+    assert read_messages(storage) == ["a", "b", "c"]
+    await storage.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_writes_queued_messages(tmp_path):
+    storage = LogStorage(str(tmp_path), flush_interval=60)
+    await storage.start()
+    storage.store("last words")
+    await storage.stop()
+    assert read_messages(storage) == ["last words"]
+
+
+def test_invalid_durability_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        LogStorage(str(tmp_path), durability="sometimes")
+
+
+@pytest.mark.asyncio
+async def test_full_segments_are_rotated_and_compressed(tmp_path):
+    storage = LogStorage(str(tmp_path), flush_interval=0.01, segment_max_bytes=100)
+    await storage.start()
+    for i in range(3):
+        storage.store_records([{"message": f"batch {i} message {j}"} for j in range(5)])
+        await storage.flush()
+        await asyncio.sleep(0.05)
+    await asyncio.to_thread(storage._compress_sealed)
+    await storage.stop()
+
+    segments = storage.manifest.segments()
+    assert [s.state for s in segments] == ["compressed"] * 3 + ["active"]
+    assert all(s.file.endswith(".log.gz") for s in segments[:3])
+    assert [s.lines for s in segments[:3]] == [5, 5, 5]
+    assert all(a.end_offset == b.start_offset for a, b in zip(segments, segments[1:]))
+    assert read_messages(storage) == [
+        f"batch {i} message {j}" for i in range(3) for j in range(5)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_restart_seals_previous_active_segment(tmp_path):
+    storage = LogStorage(str(tmp_path), flush_interval=0.01, compression="none")
+    await storage.start()
+    storage.store_records([{"message": "one"}, {"message": "two"}])
+    await storage.stop()
+
+    restarted = LogStorage(str(tmp_path), flush_interval=0.01, compression="none")
+    await restarted.start()
+    restarted.store("three")
+    await restarted.flush()
+    segments = restarted.segments()
+    assert [(s.state, s.lines) for s in segments] == [("sealed", 2), ("active", 1)]
+    assert read_messages(restarted) == ["one", "two", "three"]
+    await restarted.stop()
+
+
+@pytest.mark.asyncio
+async def test_retention_deletes_oldest_segments(tmp_path):
+    storage = LogStorage(
+        str(tmp_path),
+        flush_interval=0.01,
+        segment_max_bytes=1,
+        compression="none",
+        retention_max_bytes=1,
+    )
+    await storage.start()
+    for i in range(3):
+        storage.store(f"message {i}")
+        await storage.flush()
+        await asyncio.sleep(0.05)
+    storage._enforce_retention()
+    await storage.stop()
+
+    segments = storage.manifest.segments()
+    assert [s.state for s in segments] == ["active"]
+    assert sorted(os.listdir(tmp_path)) == ["manifest.json", segments[0].file]
@@ -0,0 +1,63 @@
+# test_log_tail.py
+
+import pytest
+from libraries.log_query import LogQuery
+from libraries.log_storage import LogStorage
+from libraries.log_tail import LogTail, TooManySubscribers
+
+
+def records(*messages, **attributes):
+    return [{"ts": 1.0, "message": message, **attributes} for message in messages]
+
+
+@pytest.mark.asyncio
+async def test_new_subscriber_gets_matching_backlog():
+    tail = LogTail(backlog_size=3)
+    tail.publish(records("a", "b", service="api"))
+    tail.publish(records("c", "d", service="worker"))
+    subscription = tail.subscribe(LogQuery(service="worker"), backlog=10)
+    batch, dropped = await subscription.next_batch(timeout=0.1)
+    assert [r["message"] for r in batch] == ["c", "d"]
+    assert dropped == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_skips_ahead():
+    tail = LogTail(queue_size=2)
+    subscription = tail.subscribe(LogQuery(), backlog=0)
+    tail.publish(records("a", "b", "c", "d", "e"))
+    batch, dropped = await subscription.next_batch(timeout=0.1)
+    assert [r["message"] for r in batch] == ["d", "e"]
+    assert dropped == 3
+
+
+@pytest.mark.asyncio
+async def test_next_batch_times_out_empty():
+    tail = LogTail()
+    subscription = tail.subscribe(LogQuery(), backlog=0)
+    assert await subscription.next_batch(timeout=0.01) == ([], 0)
+    tail.unsubscribe(subscription)
+    tail.publish(records("ignored"))
+    assert await subscription.next_batch(timeout=0.01) == ([], 0)
+
+
+def test_subscriber_limit():
+    tail = LogTail(max_subscribers=1)
+    tail.subscribe(LogQuery())
+    with pytest.raises(TooManySubscribers):
+        tail.subscribe(LogQuery())
+
+
+@pytest.mark.asyncio
+async def test_tail_follows_written_records(tmp_path):
+    storage = LogStorage(str(tmp_path), flush_interval=0.01)
+    tail = LogTail()
+    storage.add_listener(tail.publish)
+    subscription = tail.subscribe(LogQuery(level="error"))
+    await storage.start()
+    storage.store("ok", level="INFO")
+    storage.store("boom", level="ERROR")
+    await storage.flush()
+    batch, _ = await subscription.next_batch(timeout=1)
+    assert [r["message"] for r in batch] == ["boom"]
+    await storage.stop()
@@ -1,12 +1,19 @@
 # test_logging_service.py
 
+import gzip
+import socket
+import httpx
 from fastapi.testclient import TestClient
 from unittest.mock import patch
 import pytest
+from top_secret.services.logging_service import main
 from top_secret.services.logging_service.main import (
     app,
 )  # Adjust the import according to your actual file structure
 from pydantic import BaseModel, Field
+from libraries.log_query import LogQueryResult
+from libraries.log_rollups import LogRollups
+from libraries.log_tail import LogTail
 
 
 class LogMessage(BaseModel):
@@ -31,15 +38,191 @@ def test_log_message_success(mock_log_storage):
     mock_log_storage.assert_called_once_with("Test log message")
 
 
+def test_log_message_with_attributes(mock_log_storage):
+    response = client.post(
+        "/log", json={"message": "Disk full", "service": "api", "level": "ERROR"}
+    )
+    assert response.status_code == 200
+    mock_log_storage.assert_called_once_with("Disk full", service="api", level="ERROR")
+
+
 def test_log_message_failure():
     response = client.post("/log", json={})
     assert response.status_code == 422
     assert response.json()["detail"][0]["msg"] == "Field required"
 
 
+@pytest.mark.parametrize(
+    "body",
+    [
+        '{"message": "x", "fields": {"ms": 1e999}}',
+        '{"message": "x", "fields": {"ms": NaN}}',
+        '{"message": "x", "timestamp": -Infinity}',
+    ],
+)
+def test_log_message_rejects_non_finite_numbers(body, mock_log_storage):
+    response = client.post(
+        "/log", content=body, headers={"Content-Type": "application/json"}
+    )
+    assert response.status_code == 422
+    mock_log_storage.assert_not_called()
+
+
 def test_log_message_empty():
     response = client.post("/log", json={"message": ""})
     assert response.status_code == 422
     assert (
         "String should have at least 1 character" in response.json()["detail"][0]["msg"]
     )
+
+
+@pytest.fixture
+def mock_log_storage_records():
+    with patch(
+        "top_secret.services.logging_service.main.LogStorage.store_records",
+        return_value=None,
+    ) as mock_method:
+        yield mock_method
+
+
+def test_log_bulk_json_array(mock_log_storage_records):
+    response = client.post(
+        "/log/bulk", json=[{"message": "first"}, {"message": "second"}]
+    )
+    assert response.status_code == 200
+    assert response.json() == {"status": "success", "accepted": 2}
+    mock_log_storage_records.assert_called_once_with(
+        [{"message": "first"}, {"message": "second"}]
+    )
+
+
+def test_log_bulk_gzipped_ndjson(mock_log_storage_records):
+    body = b'{"message": "first"}\n\n{"message": "second"}\n'
+    response = client.post(
+        "/log/bulk",
+        content=gzip.compress(body),
+        headers={
+            "Content-Type": "application/x-ndjson",
+            "Content-Encoding": "gzip",
+        },
+    )
+    assert response.status_code == 200
+    assert response.json() == {"status": "success", "accepted": 2}
+    mock_log_storage_records.assert_called_once_with(
+        [{"message": "first"}, {"message": "second"}]
+    )
+
+
+def test_log_bulk_rejects_whole_batch(mock_log_storage_records):
+    response = client.post("/log/bulk", json=[{"message": "ok"}, {"message": ""}])
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == [1, "message"]
+    mock_log_storage_records.assert_not_called()
+
+
+def test_log_bulk_invalid_ndjson(mock_log_storage_records):
+    response = client.post(
+        "/log/bulk",
+        content=b'{"message": "ok"}\nnot json\n',
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 400
+    mock_log_storage_records.assert_not_called()
+
+
+def test_query_logs_invalid_regex():
+    response = client.get("/logs", params={"regex": "("})
+    assert response.status_code == 422
+
+
+def test_query_logs_passes_filters():
+    with patch(
+        "top_secret.services.logging_service.main.LogReader.query",
+        return_value=LogQueryResult(records=[{"ts": 1.0, "message": "hi"}]),
+    ) as mock_query:
+        response = client.get(
+            "/logs",
+            params={"since": "1970-01-01T00:00:10", "service": "api", "limit": 5},
+        )
+    assert response.status_code == 200
+    assert response.json() == {
+        "records": [{"ts": 1.0, "message": "hi"}],
+        "next_cursor": None,
+    }
+    query = mock_query.call_args.args[0]
+    assert (query.since, query.service, query.limit) == (10.0, "api", 5)
+
+
+def test_export_logs_as_text():
+    with patch(
+        "top_secret.services.logging_service.main.LogReader.export",
+        return_value=iter(["line one\n", "line two\n"]),
+    ) as mock_export:
+        response = client.get(
+            "/logs/export", params={"format": "text", "level": "info"}
+        )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert response.text == "line one\nline two\n"
+    query, output_format = mock_export.call_args.args
+    assert (query.level, output_format) == ("info", "text")
+
+
+def test_export_logs_unknown_format():
+    response = client.get("/logs/export", params={"format": "xml"})
+    assert response.status_code == 422
+
+
+@pytest.fixture
+def log_rollups(tmp_path, monkeypatch):
+    rollups = LogRollups(str(tmp_path))
+    monkeypatch.setattr(main, "log_rollups", rollups)
+    return rollups
+
+
+def test_log_stats(log_rollups):
+    log_rollups.add(
+        [{"ts": 120.0, "message": "boom", "service": "api", "level": "error"}]
+    )
+    response = client.get(
+        "/logs/stats",
+        params={"since": "1970-01-01T00:01:00", "until": "1970-01-01T00:03:00"},
+    )
+    assert response.status_code == 200
+    assert response.json()["buckets"] == [
+        {
+            "start": 120.0,
+            "counts": [{"service": "api", "level": "error", "count": 1}],
+            "fields": [],
+        }
+    ]
+
+
+@pytest.mark.asyncio
+async def test_datagram_bind_failure_keeps_http_ingestion(
+    tmp_path, monkeypatch, log_rollups
+):
+    monkeypatch.chdir(tmp_path)
+    taken = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    taken.bind(("127.0.0.1", 0))
+    monkeypatch.setattr(main.log_datagram_server, "udp_address", taken.getsockname())
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with app.router.lifespan_context(app), httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as c:
+            response = await c.post("/log", json={"message": "still up"})
+    finally:
+        taken.close()
+    assert response.status_code == 200
+    assert main.log_datagram_server._transports == []
+
+
+@pytest.mark.asyncio
+async def test_tail_subscribes_only_once_streaming(monkeypatch):
+    tail = LogTail(max_subscribers=1)
+    monkeypatch.setattr(main, "log_tail", tail)
+    response = await main.tail_logs_sse(request=None, backlog=0)
+    assert not tail.full
+    await response.body_iterator.aclose()
+    assert not tail.full
@@ -0,0 +1,88 @@
+# test_monolith.py
+
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+import httpx
+import pytest
+from fastapi import FastAPI
+from shared.logger import log_client
+from shared.transport import service_routes
+from top_secret import monolith
+
+
+@pytest.mark.asyncio
+async def test_unmounted_services_go_over_the_network():
+    sent = []
+
+    def network(request):
+        sent.append(str(request.url))
+        return httpx.Response(200, json={"via": "network"})
+
+    local = FastAPI()
+    local.get("/ping")(lambda: {"via": "asgi"})
+    service_routes.mount(8099, local)
+    transport = service_routes.transport()
+    transport.network = httpx.MockTransport(network)
+    try:
+        async with httpx.AsyncClient(transport=transport) as client:
+            inside = await client.get("http://localhost:8099/ping")
+            outside = await client.get("http://localhost:8098/ping")
+            remote = await client.get("http://example.com:8099/ping")
+    finally:
+        service_routes.unmount(8099)
+    assert inside.json() == {"via": "asgi"}
+    assert outside.json() == remote.json() == {"via": "network"}
+    assert len(sent) == 2
+
+
+@pytest.mark.asyncio
+async def test_services_call_each_other_in_process(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    apps = monolith.load_services(["logging_service", "chatgpt_service", "api_gateway"])
+    from top_secret.services.logging_service import main as logging_main
+
+    monkeypatch.setattr(logging_main.log_datagram_server, "udp_address", None)
+    executor = FastAPI()
+    executor.post("/commands/start")(lambda: {"process_id": 7})
+    executor.get("/commands/status")(
+        lambda process_id: {"running": False, "output": f"ran {process_id}"}
+    )
+    completion = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content='{"command": "ls"}'))]
+    )
+    monolith.mount_services(apps)
+    service_routes.mount(monolith.SERVICE_PORTS["command_executor_service"], executor)
+    app = monolith.create_app(apps)
+    try:
+        with patch(
+            "top_secret.services.chatgpt_service.main.OpenAIWrapper.get_completion",
+            new_callable=AsyncMock,
+            return_value=completion,
+        ):
+            async with app.router.lifespan_context(app):
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(
+                    transport=transport, base_url="http://test"
+                ) as client:
+                    started = await client.post(
+                        "/api_gateway/execute_command/",
+                        json={"verbal_command": "tidy up the downloads"},
+                    )
+                    job = f"/api_gateway/jobs/{started.json()['job_id']}"
+                    await client.get(f"{job}/events")
+                    response = await client.get(job)
+                    await log_client.flush()
+                    await logging_main.log_storage.flush()
+                    logs = await client.get(
+                        "/logging_service/logs", params={"service": "chatgpt_service"}
+                    )
+    finally:
+        for port in monolith.SERVICE_PORTS.values():
+            service_routes.unmount(port)
+    assert (response.json()["status"], response.json()["output"]) == (
+        "succeeded",
+        "ran 7",
+    )
+    messages = [record["message"] for record in logs.json()["records"]]
+    assert any(message.startswith("Received completion") for message in messages)
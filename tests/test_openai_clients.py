@@ -0,0 +1,45 @@
+# test_openai_clients.py
+
+import pytest
+from libraries.openai_clients import OpenAIClientRegistry
+from libraries.openai_wrapper_json import OpenAIWrapperJson
+from libraries.openai_wrapper_stream import OpenAIWrapperStream
+
+
+@pytest.mark.asyncio
+async def test_clients_are_cached_per_key_and_base_url():
+    registry = OpenAIClientRegistry()
+    client = registry.get("key-a")
+    assert registry.get("key-a") is client
+    assert registry.get("key-b") is not client
+    other = registry.get("key-a", "http://localhost:9999/v1")
+    assert other is not client
+    assert str(other.base_url).startswith("http://localhost:9999/v1")
+    await registry.aclose()
+
+
+@pytest.mark.asyncio
+async def test_clients_share_one_connection_pool():
+    registry = OpenAIClientRegistry(max_connections=7)
+    wrappers = [
+        OpenAIWrapperJson(api_key="key", clients=registry),
+        OpenAIWrapperStream(api_key="key", clients=registry),
+        OpenAIWrapperStream(api_key="other", clients=registry),
+    ]
+    assert wrappers[0].client is wrappers[1].client
+    assert {id(w.client._client) for w in wrappers} == {id(registry.http_client)}
+    http_client = registry.http_client
+    await registry.aclose()
+    assert http_client.is_closed
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_client_is_dropped():
+    registry = OpenAIClientRegistry(max_clients=2)
+    first = registry.get("a")
+    registry.get("b")
+    registry.get("a")
+    registry.get("c")
+    assert registry.get("a") is first
+    assert len(registry._clients) == 2
+    await registry.aclose()
@@ -0,0 +1,92 @@
+# test_rate_limiter.py
+
+import asyncio
+import pytest
+from libraries.rate_limiter import (
+    ModelLimiter,
+    RateLimiter,
+    RateLimitTimeout,
+    parse_reset,
+)
+
+
+def test_parse_reset():
+    assert parse_reset("1s") == 1.0
+    assert parse_reset("6m0s") == 360.0
+    assert parse_reset("20ms") == pytest.approx(0.02)
+    assert parse_reset("1h2m3.5s") == pytest.approx(3723.5)
+    assert parse_reset("2.5") == 2.5
+    assert parse_reset("soon") is None
+    assert parse_reset(None) is None
+
+
+@pytest.mark.asyncio
+async def test_requests_queue_beyond_max_concurrency():
+    limiter = ModelLimiter(max_concurrency=2)
+    peak = 0
+
+    async def request():
+        nonlocal peak
+        async with limiter.slot():
+            peak = max(peak, limiter.in_flight)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(request() for _ in range(6)))
+    stats = limiter.stats()
+    assert peak == 2
+    assert (stats["requests"], stats["waited"], stats["max_queued"]) == (6, 4, 4)
+    assert stats["in_flight"] == stats["queued"] == 0
+
+
+@pytest.mark.asyncio
+async def test_exhausted_budget_waits_for_the_reset():
+    limiter = ModelLimiter()
+    limiter.update(
+        {
+            "x-ratelimit-remaining-requests": "1",
+            "x-ratelimit-reset-requests": "50ms",
+            "x-ratelimit-remaining-tokens": "1000",
+            "x-ratelimit-reset-tokens": "1s",
+        }
+    )
+    await limiter.acquire(tokens=10)
+    limiter.release()
+    assert (limiter.remaining_requests, limiter.remaining_tokens) == (0, 990)
+    started = asyncio.get_running_loop().time()
+    await limiter.acquire()
+    assert asyncio.get_running_loop().time() - started >= 0.04
+    assert limiter.waited == 1
+
+
+@pytest.mark.asyncio
+async def test_backoff_follows_retry_after_and_times_out():
+    limiter = ModelLimiter(max_wait=0.05)
+    limiter.backoff({"retry-after": "1"})
+    with pytest.raises(RateLimitTimeout):
+        await limiter.acquire()
+    assert limiter.stats()["timeouts"] == limiter.stats()["throttled"] == 1
+
+
+@pytest.mark.asyncio
+async def test_jittered_backoff_is_bounded():
+    limiter = ModelLimiter(base_backoff=0.01, max_backoff=0.02)
+    limiter.backoff()
+    limiter.backoff()
+    started = asyncio.get_running_loop().time()
+    await limiter.acquire()
+    assert 0.005 <= asyncio.get_running_loop().time() - started < 0.5
+
+
+def test_limiters_are_per_model():
+    limiter = RateLimiter(max_concurrency=3)
+    assert limiter.for_model("a") is limiter.for_model("a")
+    assert limiter.for_model("b").max_concurrency == 3
+    assert set(limiter.stats()) == {"a", "b"}
+
+
+def test_custom_urls_have_their_own_limiters():
+    limiter = RateLimiter()
+    custom = limiter.for_model("a", "http://llm.local/v1")
+    assert custom is not limiter.for_model("a")
+    assert custom is limiter.for_model("a", "http://llm.local/v1")
+    assert set(limiter.stats()) == {"a", "a@http://llm.local/v1"}
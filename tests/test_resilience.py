@@ -0,0 +1,111 @@
+# test_resilience.py
+
+import httpx
+import pytest
+from libraries.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceeded,
+    RetryBudget,
+    Upstream,
+)
+from shared.deadline import Deadline
+
+
+def test_breaker_opens_on_failure_rate():
+    breaker = CircuitBreaker(window=10, min_calls=4, failure_rate=0.5)
+    for failed in (False, True, False):
+        breaker.record(failed, 0.1)
+    assert breaker.state == "closed"
+    breaker.record(True, 0.1)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert (breaker.opened, breaker.rejected) == (1, 1)
+
+
+def test_breaker_opens_on_slow_calls():
+    breaker = CircuitBreaker(min_calls=2, slow_call_seconds=1, slow_call_rate=0.5)
+    breaker.record(False, 0.1)
+    breaker.record(False, 2.0)
+    assert breaker.state == "open"
+
+
+def test_half_open_breaker_lets_one_trial_through():
+    breaker = CircuitBreaker(min_calls=1, open_seconds=30)
+    breaker.record(True, 0.1)
+    breaker._opened_at -= 31
+    assert breaker.state == "half_open"
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record(True, 0.1)
+    assert breaker.state == "open"
+    breaker._opened_at -= 31
+    breaker.before_call()
+    breaker.record(False, 0.1)
+    assert breaker.state == "closed"
+
+
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, max_tokens=1)
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+def upstream_client(responses, seen=None):
+    def handler(request):
+        if seen is not None:
+            seen.append(request)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return httpx.Response(response)
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.mark.asyncio
+async def test_idempotent_calls_are_retried():
+    upstream = Upstream("svc", timeout=1, base_backoff=0.001)
+    async with upstream_client([503, httpx.ConnectError("down"), 200]) as client:
+        response = await upstream.request(client, "GET", "http://svc/status")
+    assert response.status_code == 200
+    assert upstream.stats()["retries"] == 2
+
+
+@pytest.mark.asyncio
+async def test_other_calls_are_retried_only_if_never_sent():
+    upstream = Upstream("svc", timeout=1, base_backoff=0.001)
+    async with upstream_client([httpx.ConnectError("down"), 500, 200]) as client:
+        response = await upstream.request(
+            client, "POST", "http://svc/start", idempotent=False
+        )
+    assert response.status_code == 500
+    assert upstream.retries == 1
+
+
+@pytest.mark.asyncio
+async def test_retries_stop_when_the_budget_is_spent():
+    upstream = Upstream(
+        "svc", timeout=1, base_backoff=0.001, budget=RetryBudget(0.1, max_tokens=1)
+    )
+    async with upstream_client([500, 500, 500]) as client:
+        response = await upstream.request(client, "GET", "http://svc/status")
+    assert response.status_code == 500
+    assert (upstream.retries, upstream.retries_denied) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_deadline_is_sent_and_enforced():
+    upstream = Upstream("svc", timeout=1)
+    seen = []
+    async with upstream_client([200], seen) as client:
+        await upstream.request(client, "GET", "http://svc/", Deadline(2))
+        with pytest.raises(DeadlineExceeded):
+            await upstream.request(client, "GET", "http://svc/", Deadline(0))
+    assert 1000 < int(seen[0].headers["X-Request-Timeout-Ms"]) <= 2000
+    assert len(seen) == 1
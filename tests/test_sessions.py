@@ -0,0 +1,41 @@
+# test_sessions.py
+
+from libraries.sessions import SessionStore, message_tokens, trim_messages
+
+
+def message(role, words):
+    return {"role": role, "content": " ".join(["word"] * words)}
+
+
+def test_trim_keeps_system_and_newest_messages():
+    messages = [message("system", 5)] + [
+        message("user" if i % 2 else "assistant", 20) for i in range(10)
+    ]
+    budget = message_tokens(messages[0]) + 3 * message_tokens(messages[1])
+    trimmed, dropped = trim_messages(messages, budget)
+    assert trimmed == [messages[0]] + messages[-3:]
+    assert dropped == 7
+
+
+def test_trim_keeps_an_oversized_last_message():
+    messages = [message("user", 5), message("user", 500)]
+    assert trim_messages(messages, 10) == ([messages[1]], 1)
+
+
+def test_store_evicts_least_recently_used():
+    store = SessionStore(max_sessions=2)
+    first = store.create()
+    second = store.create()
+    assert store.get(first.session_id) is first
+    store.create()
+    assert store.get(second.session_id) is None
+    assert store.get(first.session_id) is first
+    assert (len(store), store.evicted) == (2, 1)
+
+
+def test_store_expires_idle_sessions():
+    store = SessionStore(ttl=60)
+    session = store.create([message("system", 1)])
+    session.last_used -= 61
+    assert store.get(session.session_id) is None
+    assert store.delete(session.session_id) is False
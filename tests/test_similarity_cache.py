@@ -0,0 +1,81 @@
+# test_similarity_cache.py
+
+import time
+import pytest
+from libraries.similarity_cache import SimilarityCache, jaccard, prompt_features
+from top_secret.api_gateway.main import translation_prompt
+
+
+def test_features_ignore_stopwords_and_plurals():
+    assert prompt_features("Show me the files in the folder") == prompt_features(
+        "show me files in this folder"
+    )
+    assert prompt_features("what is the") == frozenset()
+
+
+def test_jaccard():
+    a, b = frozenset("abc"), frozenset("bcd")
+    assert jaccard(a, b) == 0.5
+    assert jaccard(frozenset(), frozenset()) == 0.0
+
+
+def test_similar_prompt_matches():
+    cache = SimilarityCache(threshold=0.6)
+    cache.put("gpt", "list all files in the home directory", "ls ~")
+    match = cache.get("gpt", "please list all the files in my home directory")
+    assert match.value == "ls ~"
+    assert match.similarity >= 0.6
+    assert match.prompt == "list all files in the home directory"
+    assert cache.stats()["hits"] == 1
+
+
+def test_dissimilar_prompt_misses():
+    cache = SimilarityCache(threshold=0.8)
+    cache.put("gpt", "list all files in the home directory", "ls ~")
+    assert cache.get("gpt", "delete all files in the home directory") is None
+    assert cache.get("gpt", "what is the") is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_templated_prompts_need_the_same_words():
+    remove = translation_prompt("remove everything")
+    listing = translation_prompt("list files")
+    # The shared template alone makes the prompts look alike.
+    assert jaccard(prompt_features(remove), prompt_features(listing)) >= 0.8
+    cache = SimilarityCache(threshold=0.8)
+    cache.put("gpt", remove, "rm -rf *")
+    assert cache.get("gpt", listing) is None
+    cache.put("gpt", listing, "ls")
+    assert cache.get("gpt", translation_prompt("list the files")).value == "ls"
+
+
+def test_namespaces_are_separate():
+    cache = SimilarityCache()
+    cache.put("gpt-4", "list files", "ls")
+    assert cache.get("gpt-3.5-turbo", "list files") is None
+    assert cache.get("gpt-4", "list the files").value == "ls"
+
+
+def test_evicts_least_recently_used():
+    cache = SimilarityCache(max_entries=2)
+    cache.put("gpt", "list files", "ls")
+    cache.put("gpt", "show disk usage", "df -h")
+    assert cache.get("gpt", "list files") is not None
+    cache.put("gpt", "print working directory", "pwd")
+    assert cache.get("gpt", "show disk usage") is None
+    assert cache.get("gpt", "list files").value == "ls"
+    assert (cache.stats()["entries"], cache.evictions) == (2, 1)
+
+
+def test_expired_entries_miss(monkeypatch):
+    cache = SimilarityCache(ttl=60)
+    cache.put("gpt", "list files", "ls")
+    now = time.time()
+    monkeypatch.setattr("libraries.similarity_cache.time.time", lambda: now + 61)
+    assert cache.get("gpt", "list files") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_bands_must_divide_signature():
+    with pytest.raises(ValueError):
+        SimilarityCache(num_perm=64, bands=10)
@@ -0,0 +1,83 @@
+# test_single_flight.py
+
+import asyncio
+import pytest
+from libraries.single_flight import SingleFlight, StreamFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_upstream_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    results = await asyncio.gather(*(flight.run("k", fetch) for _ in range(5)))
+    assert results == ["result"] * 5
+    assert (len(calls), flight.coalesced) == (1, 4)
+    await flight.run("k", fetch)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    results = await asyncio.gather(
+        *(flight.run("k", fail) for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_leaving_caller_does_not_cancel_shared_call():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "result"
+
+    leader = asyncio.ensure_future(flight.run("k", fetch))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(flight.run("k", fetch))
+    await asyncio.sleep(0)
+    leader.cancel()
+    assert await follower == "result"
+
+
+@pytest.mark.asyncio
+async def test_late_stream_subscriber_replays_then_follows():
+    flight = StreamFlight()
+    started = []
+    release = asyncio.Event()
+
+    async def upstream():
+        started.append(1)
+        yield "a"
+        yield "ab"
+        await release.wait()
+        yield "abc"
+
+    async def collect(received):
+        async for chunk in flight.subscribe("k", upstream):
+            received.append(chunk)
+            if chunk == "ab" and not release.is_set():
+                await asyncio.sleep(0.01)
+
+    early, late = [], []
+    early_task = asyncio.ensure_future(collect(early))
+    while early != ["a", "ab"]:
+        await asyncio.sleep(0)
+    late_task = asyncio.ensure_future(collect(late))
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(early_task, late_task)
+    assert early == late == ["a", "ab", "abc"]
+    assert (len(started), flight.coalesced) == (1, 1)
@@ -0,0 +1,87 @@
+# test_translation_cache.py
+
+import time
+import pytest
+from libraries.translation_cache import TranslationCache, normalize_command
+
+
+def test_normalize_drops_case_punctuation_and_filler():
+    assert normalize_command("Please, show me the files in the folder!") == (
+        "show files in folder"
+    )
+    assert normalize_command("list ~/docs/*.txt.") == "list ~/docs/*.txt"
+    assert normalize_command("cd ..") == "cd .."
+    assert normalize_command("um, okay") == ""
+
+
+def test_normalize_keeps_the_case_of_paths():
+    assert normalize_command("Delete Foo.txt") == "delete Foo.txt"
+    assert normalize_command("delete foo.txt") == "delete foo.txt"
+    assert normalize_command("Open ~/Docs and Notes") == "open ~/Docs and notes"
+
+
+@pytest.mark.asyncio
+async def test_paths_differing_in_case_do_not_share_translations():
+    cache = TranslationCache()
+    await cache.put("delete Foo.txt", "rm Foo.txt")
+    assert await cache.get("delete foo.txt") is None
+    assert await cache.get("Delete Foo.txt") == "rm Foo.txt"
+
+
+@pytest.mark.asyncio
+async def test_lru_evicts_unpinned_entries_only():
+    cache = TranslationCache(max_entries=2)
+    await cache.put("where am i", "pwd", pinned=True)
+    await cache.put("list files", "ls")
+    await cache.put("disk usage", "df -h")
+    assert await cache.get("list files") == "ls"
+    await cache.put("who am i", "whoami")
+    assert await cache.get("disk usage") is None
+    assert await cache.get("Where am I?") == "pwd"
+    assert [e.key for e in cache.entries()] == ["list files", "who am i", "where am i"]
+    assert cache.stats()["pinned"] == 1
+
+
+@pytest.mark.asyncio
+async def test_unpinned_entries_expire(monkeypatch):
+    cache = TranslationCache(ttl=60)
+    await cache.put("list files", "ls")
+    await cache.put("where am i", "pwd", pinned=True)
+    now = time.time()
+    monkeypatch.setattr("libraries.translation_cache.time.time", lambda: now + 61)
+    assert await cache.get("list files") is None
+    assert await cache.get("where am i") == "pwd"
+
+
+@pytest.mark.asyncio
+async def test_persistent_tier_survives_restarts(tmp_path):
+    path = str(tmp_path / "translations.db")
+    cache = TranslationCache(path=path)
+    cache.open()
+    await cache.put("list files", "ls")
+    await cache.put("where am i", "pwd", pinned=True)
+    await cache.put("disk usage", "df -h")
+    assert await cache.evict("disk usage")
+    cache.close()
+
+    reopened = TranslationCache(path=path)
+    reopened.open()
+    assert [e.key for e in reopened.entries()] == ["where am i"]
+    assert await reopened.get("list the files") == "ls"
+    assert await reopened.get("disk usage") is None
+    assert reopened.stats()["disk_hits"] == 1
+    reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_persistent_tier_is_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr("libraries.translation_cache.PRUNE_INTERVAL", 1)
+    cache = TranslationCache(path=str(tmp_path / "translations.db"), max_rows=2)
+    cache.open()
+    for i, command in enumerate(("ls", "pwd", "df -h")):
+        monkeypatch.setattr("libraries.translation_cache.time.time", lambda: 1000.0 + i)
+        await cache.put(command, command)
+    await cache.put("where am i", "pwd", pinned=True)
+    rows = cache._db.execute("SELECT key, pinned FROM translations").fetchall()
+    cache.close()
+    assert sorted(rows) == [("df -h", 0), ("pwd", 0), ("where am i", 1)]
@@ -0,0 +1,242 @@
+import json
+import re
+import string
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Pattern, Tuple
+from libraries.translation_cache import command_words
+
+# Words standing for something named elsewhere ("is it running"), which a
+# path or name slot must not take literally.
+PRONOUNS = "it this that these those them something anything everything".split()
+_NOT_PRONOUN = r"(?!(?i:%s)$)" % "|".join(PRONOUNS)
+
+# Values a slot may take. They only allow characters that are safe unquoted in
+# a shell command, and may not start with "-" so they cannot pass options.
+# "pathlike" only takes words that look like paths (holding a /, . or ~), for
+# phrases such as "read {pathlike}" where any word would be taken as a file.
+SLOT_PATTERNS = {
+    "path": _NOT_PRONOUN + r"[\w.~/*][\w.~/*-]*",
+    "pathlike": _NOT_PRONOUN + r"(?=[\w.~/*-]*[/.~])[\w.~/*][\w.~/*-]*",
+    "name": _NOT_PRONOUN + r"[\w.][\w.-]*",
+    "count": r"\d{1,6}",
+}
+
+_SLOT = re.compile(r"^\{(\w+)\}$")
+_SLOT_TOKEN = re.compile(r"(\{\w+\})")
+
+
+def pattern_tokens(pattern: str) -> List[str]:
+    """
+    Splits a rule pattern into normalized words and `{slot}` tokens.
+    """
+    tokens = []
+    for part in _SLOT_TOKEN.split(pattern):
+        if _SLOT.match(part):
+            tokens.append(part)
+        else:
+            tokens.extend(word for word, _ in command_words(part))
+    return tokens
+
+
+class RuleMatch(NamedTuple):
+    """
+    The command a phrase translates to.
+    """
+
+    command: str
+    pattern: str
+    slots: Dict[str, str]
+
+
+class _Node:
+    """
+    A node of the pattern trie: the literal words and slots that may follow,
+    and the rules ending here.
+    """
+
+    __slots__ = ("words", "slots", "rules")
+
+    def __init__(self):
+        self.words: Dict[str, "_Node"] = {}
+        self.slots: List[Tuple[str, Pattern, "_Node"]] = []
+        self.rules: List[Tuple[str, str]] = []
+
+    def child(self, token: str, slot_patterns: Dict[str, Pattern]) -> "_Node":
+        """
+        Returns the child of a word or `{slot}` token, adding it if needed.
+        """
+        slot = _SLOT.match(token)
+        if slot is None:
+            return self.words.setdefault(token, _Node())
+        name = slot.group(1)
+        if name not in slot_patterns:
+            raise ValueError(f"Unknown slot {token}")
+        for slot_name, _, node in self.slots:
+            if slot_name == name:
+                return node
+        node = _Node()
+        self.slots.append((name, slot_patterns[name], node))
+        return node
+
+
+class CommandTranslator:
+    """
+    Translates common verbal commands to shell commands with local rules,
+    ahead of the LLM.
+
+    Each rule maps phrases such as "show last {count} lines of {path}" to a
+    command template such as "tail -n {count} {path}". Phrases are normalized
+    like the translation cache keys (case, punctuation and filler words
+    dropped) and compiled into a word trie; a `{slot}` matches one word, in
+    its original case, against its pattern in SLOT_PATTERNS or the config,
+    so "cat ./Makefile" keeps its capital. Literal words win
+    over slots, so "list files" is not read as "list {path}". A phrase
+    matching several commands equally well is ambiguous and, like a phrase
+    matching none, left to the LLM.
+
+    Attributes:
+        lookups (int): Phrases translated or not.
+        matched (int): Phrases translated by a rule.
+        ambiguous (int): Phrases matching several commands.
+        unmatched (int): Phrases matching no rule.
+    """
+
+    def __init__(
+        self,
+        rules: List[Dict[str, Any]],
+        slots: Optional[Dict[str, str]] = None,
+    ):
+        """
+        Compiles the rules.
+
+        Args:
+            rules (List[Dict[str, Any]]): Each has a "command" template and
+                the "patterns" translating to it.
+            slots (Optional[Dict[str, str]]): Slot patterns adding to or
+                overriding SLOT_PATTERNS.
+
+        Raises:
+            ValueError: If a pattern uses an unknown slot or lacks one its
+                command needs.
+        """
+        slot_patterns = {
+            name: re.compile(pattern)
+            for name, pattern in {**SLOT_PATTERNS, **(slots or {})}.items()
+        }
+        self._root = _Node()
+        self.patterns = 0
+        for rule in rules:
+            command = rule["command"]
+            needed = {f for _, f, _, _ in string.Formatter().parse(command) if f}
+            for pattern in rule["patterns"]:
+                tokens = pattern_tokens(pattern)
+                given = {m.group(1) for t in tokens if (m := _SLOT.match(t))}
+                if needed - given:
+                    raise ValueError(
+                        f"Pattern {pattern!r} lacks slots of {command!r}: "
+                        + ", ".join(sorted(needed - given))
+                    )
+                node = self._root
+                for token in tokens:
+                    node = node.child(token, slot_patterns)
+                node.rules.append((pattern, command))
+                self.patterns += 1
+        self.lookups = 0
+        self.matched = 0
+        self.ambiguous = 0
+        self.unmatched = 0
+        self._match_seconds = 0.0
+
+    @classmethod
+    def from_file(cls, path: str) -> "CommandTranslator":
+        """
+        Loads the rules from a JSON file with "rules" and optional "slots".
+        Performs blocking file I/O.
+        """
+        with open(path, encoding="utf-8") as file:
+            config = json.load(file)
+        return cls(config["rules"], config.get("slots"))
+
+    def translate(self, verbal_command: str) -> Optional[RuleMatch]:
+        """
+        Translates a verbal command.
+
+        Args:
+            verbal_command (str): The command as spoken.
+
+        Returns:
+            Optional[RuleMatch]: The command, or None if no rule or several
+            rules match.
+        """
+        started = time.perf_counter()
+        words = command_words(verbal_command)
+        matches: List[Tuple[int, str, str, Dict[str, str]]] = []
+        if words:
+            self._walk(self._root, words, 0, 0, {}, matches)
+        result = None
+        if matches:
+            best = max(literals for literals, _, _, _ in matches)
+            matches = [m for m in matches if m[0] == best]
+            commands = {command.format(**slots) for _, _, command, slots in matches}
+            if len(commands) == 1:
+                _, pattern, _, slots = matches[0]
+                result = RuleMatch(commands.pop(), pattern, slots)
+            else:
+                self.ambiguous += 1
+        else:
+            self.unmatched += 1
+        self.lookups += 1
+        if result is not None:
+            self.matched += 1
+        self._match_seconds += time.perf_counter() - started
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the counters of the translator.
+
+        Returns:
+            Dict[str, Any]: Counters, the coverage (share of phrases the rules
+            translated) and the mean translation time.
+        """
+        return {
+            "patterns": self.patterns,
+            "lookups": self.lookups,
+            "matched": self.matched,
+            "ambiguous": self.ambiguous,
+            "unmatched": self.unmatched,
+            "coverage": self.matched / self.lookups if self.lookups else 0.0,
+            "mean_microseconds": (
+                round(self._match_seconds / self.lookups * 1e6, 1)
+                if self.lookups
+                else 0.0
+            ),
+        }
+
+    def _walk(
+        self,
+        node: _Node,
+        words: List[Tuple[str, str]],
+        position: int,
+        literals: int,
+        slots: Dict[str, str],
+        matches: List,
+    ):
+        """
+        Collects the rules matching words[position:] from a node, with the
+        number of literal words they matched. Literal words are compared
+        normalized, slots are filled with the original text.
+        """
+        if position == len(words):
+            for pattern, command in node.rules:
+                matches.append((literals, pattern, command, dict(slots)))
+            return
+        word, text = words[position]
+        child = node.words.get(word)
+        if child is not None:
+            self._walk(child, words, position + 1, literals + 1, slots, matches)
+        for name, pattern, child in node.slots:
+            if pattern.fullmatch(text):
+                slots[name] = text
+                self._walk(child, words, position + 1, literals, slots, matches)
+                del slots[name]
@@ -0,0 +1,217 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+# Statuses of a job that is over
+FINISHED = ("succeeded", "failed")
+
+
+class TooManyJobs(Exception):
+    """
+    Raised when the store is full of jobs that are not over.
+    """
+
+
+class Job:
+    """
+    A verbal command being translated and executed in the background.
+
+    Every change is recorded as an event, so clients can follow the job from
+    its start whenever they connect.
+
+    Attributes:
+        job_id (str): The job id.
+        verbal_command (str): The command as spoken.
+        status (str): queued, translating, running, succeeded or failed.
+        command (Optional[str]): The translated command.
+        output (Optional[str]): The output of the command so far.
+        error (Optional[str]): Why the job failed.
+        events (List[dict]): The progress events, oldest first.
+        finished_at (Optional[float]): When the job ended (monotonic seconds).
+        task (Optional[asyncio.Task]): The task running the job.
+    """
+
+    def __init__(self, job_id: str, verbal_command: str):
+        self.job_id = job_id
+        self.verbal_command = verbal_command
+        self.status = "queued"
+        self.command: Optional[str] = None
+        self.output: Optional[str] = None
+        self.error: Optional[str] = None
+        self.events: List[dict] = [{"type": "status", "status": "queued"}]
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        """
+        Returns whether the job is over.
+        """
+        return self.status in FINISHED
+
+    def set_status(self, status: str):
+        """
+        Moves the job to a status.
+        """
+        self.status = status
+        if self.finished:
+            self.finished_at = time.monotonic()
+        self._add_event({"type": "status", "status": status})
+
+    def set_command(self, command: str, source: str = "llm"):
+        """
+        Records the translated command, and where it came from: "rules",
+        "cache" or "llm".
+        """
+        self.command = command
+        self._add_event({"type": "command", "command": command, "source": source})
+
+    def set_output(self, output: str):
+        """
+        Records the output of the command so far, if it changed.
+
+        The event only carries the text appended since the previous output,
+        so a long command does not copy its whole output into every event.
+        An output that does not extend the previous one is sent in full,
+        marked with "replace".
+        """
+        if output == self.output:
+            return
+        previous, self.output = self.output or "", output
+        if output.startswith(previous):
+            self._add_event({"type": "output", "output": output[len(previous) :]})
+        else:
+            self._add_event({"type": "output", "output": output, "replace": True})
+
+    def fail(self, error: str):
+        """
+        Ends the job with an error.
+        """
+        self.error = error
+        self._add_event({"type": "error", "detail": error})
+        self.set_status("failed")
+
+    async def follow(self) -> AsyncIterator[dict]:
+        """
+        Yields the events of the job, past ones first, until it is over.
+        """
+        position = 0
+        while True:
+            changed = self._changed
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+            if self.finished:
+                return
+            await changed.wait()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns the state of the job.
+        """
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "verbal_command": self.verbal_command,
+            "command": self.command,
+            "output": self.output,
+            "error": self.error,
+        }
+
+    def _add_event(self, event: dict):
+        """
+        Records an event and wakes the followers up.
+        """
+        self.events.append(event)
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+
+class JobStore:
+    """
+    Keeps jobs by id, in memory.
+
+    The store is bounded: beyond `max_jobs`, the oldest finished job is
+    evicted, and jobs finished for more than `ttl` seconds are forgotten.
+    Jobs that are not over are never evicted, as their tasks would keep
+    running unseen; new jobs are refused instead, which also bounds the
+    number of jobs running at once.
+
+    Attributes:
+        max_jobs (int): Maximum number of jobs.
+        ttl (float): Seconds a finished job is kept; 0 keeps it until evicted.
+        evicted (int): Number of jobs evicted or expired.
+    """
+
+    def __init__(self, max_jobs: int = 1000, ttl: float = 3600):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.evicted = 0
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def __iter__(self):
+        return iter(list(self._jobs.values()))
+
+    def create(self, verbal_command: str) -> Job:
+        """
+        Registers a job.
+
+        Args:
+            verbal_command (str): The command as spoken.
+
+        Returns:
+            Job: The new, queued job.
+
+        Raises:
+            TooManyJobs: If `max_jobs` jobs are not over.
+        """
+        self._expire()
+        while len(self._jobs) >= self.max_jobs:
+            oldest = next((j.job_id for j in self._jobs.values() if j.finished), None)
+            if oldest is None:
+                raise TooManyJobs(f"{len(self._jobs)} jobs are already running")
+            del self._jobs[oldest]
+            self.evicted += 1
+        job = Job(uuid.uuid4().hex, verbal_command)
+        self._jobs[job.job_id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """
+        Returns a job.
+
+        Args:
+            job_id (str): The job id.
+
+        Returns:
+            Optional[Job]: The job, or None if unknown or expired.
+        """
+        job = self._jobs.get(job_id)
+        if job is not None and self._expired(job, time.monotonic()):
+            del self._jobs[job_id]
+            self.evicted += 1
+            return None
+        return job
+
+    def _expired(self, job: Job, now: float) -> bool:
+        """
+        Returns whether a job finished more than `ttl` seconds ago.
+        """
+        return bool(self.ttl) and (
+            job.finished_at is not None and now - job.finished_at > self.ttl
+        )
+
+    def _expire(self):
+        """
+        Forgets the expired jobs.
+        """
+        now = time.monotonic()
+        for job_id in [j.job_id for j in self._jobs.values() if self._expired(j, now)]:
+            del self._jobs[job_id]
+            self.evicted += 1
@@ -0,0 +1,340 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+import httpx
+from shared.deadline import DEADLINE_HEADER, Deadline
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when a call is refused because the upstream's circuit is open.
+    """
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when the end-to-end deadline passed before a call could be made.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream that keeps failing or answering slowly.
+
+    The outcomes of the last `window` calls are kept. Once at least
+    `min_calls` are known, the circuit opens if the share of failed calls
+    reaches `failure_rate` or the share of calls slower than
+    `slow_call_seconds` reaches `slow_call_rate`. Calls are then refused for
+    `open_seconds`, after which one trial call is let through (half open):
+    its success closes the circuit, its failure opens it again.
+
+    Attributes:
+        state (str): closed, open or half_open.
+        opened (int): Number of times the circuit opened.
+        rejected (int): Calls refused while it was open.
+    """
+
+    def __init__(
+        self,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 10.0,
+        slow_call_rate: float = 0.5,
+        open_seconds: float = 30.0,
+    ):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.opened = 0
+        self.rejected = 0
+        self._calls: Deque[Tuple[bool, bool]] = deque(maxlen=window)
+        self._state = "closed"
+        self._opened_at = 0.0
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        """
+        Returns the state, moving from open to half open once `open_seconds`
+        have passed.
+        """
+        if (
+            self._state == "open"
+            and time.monotonic() - self._opened_at >= self.open_seconds
+        ):
+            self._state = "half_open"
+        return self._state
+
+    def before_call(self):
+        """
+        Takes permission to call the upstream.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half open with its
+                trial call in flight.
+        """
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half_open" and not self._trial:
+            self._trial = True
+            return
+        self.rejected += 1
+        raise CircuitOpenError("Circuit open")
+
+    def record(self, failed: bool, seconds: float):
+        """
+        Records the outcome of a call.
+
+        Args:
+            failed (bool): Whether the call failed.
+            seconds (float): How long it took.
+        """
+        slow = seconds >= self.slow_call_seconds
+        if self._state == "half_open":
+            self._trial = False
+            if failed or slow:
+                self._open()
+            else:
+                self._state = "closed"
+                self._calls.clear()
+            return
+        self._calls.append((failed, slow))
+        if self._state == "closed" and len(self._calls) >= self.min_calls:
+            calls = len(self._calls)
+            failing = sum(f for f, _ in self._calls) >= self.failure_rate * calls
+            slow = sum(s for _, s in self._calls) >= self.slow_call_rate * calls
+            if failing or slow:
+                self._open()
+
+    def abandon(self):
+        """
+        Gives back the permission of a call that was not made or whose
+        outcome is unknown (e.g. cancelled).
+        """
+        if self._state == "half_open":
+            self._trial = False
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the state and counters of the breaker.
+        """
+        calls = len(self._calls)
+        return {
+            "state": self.state,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "window_calls": calls,
+            "failure_rate": (
+                sum(failed for failed, _ in self._calls) / calls if calls else 0.0
+            ),
+            "slow_call_rate": (
+                sum(slow for _, slow in self._calls) / calls if calls else 0.0
+            ),
+        }
+
+    def _open(self):
+        """
+        Opens the circuit.
+        """
+        self._state = "open"
+        self._opened_at = time.monotonic()
+        self._calls.clear()
+        self.opened += 1
+
+
+class RetryBudget:
+    """
+    Bounds the retries to a share of the requests, so retries cannot pile
+    extra load onto an upstream that is already struggling.
+
+    Every request deposits `ratio` tokens, up to `max_tokens`, and every
+    retry spends one.
+
+    Attributes:
+        ratio (float): Retries allowed per request, in the long run.
+        max_tokens (float): Largest burst of retries.
+        tokens (float): Retries currently allowed.
+    """
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self):
+        """
+        Credits a request.
+        """
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """
+        Spends a retry.
+
+        Returns:
+            bool: Whether the retry is allowed.
+        """
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Upstream:
+    """
+    Calls one upstream service with a timeout, a circuit breaker, budgeted
+    retries with jittered backoff, and the caller's deadline.
+
+    Idempotent calls are retried after transport errors and 5xx responses;
+    other calls only when the connection could not be made, so they were
+    never received. The deadline caps the timeout of each attempt and is
+    sent downstream in DEADLINE_HEADER.
+
+    Attributes:
+        name (str): Name of the upstream in the stats.
+        timeout (float): Seconds an attempt may take.
+        connect_timeout (float): Seconds connecting may take.
+        max_retries (int): Retries of a call at most.
+        base_backoff (float): Backoff before the first retry, doubled each
+            time.
+        max_backoff (float): Longest backoff.
+        breaker (CircuitBreaker): The circuit breaker.
+        budget (RetryBudget): The retry budget.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float,
+        connect_timeout: float = 2.0,
+        max_retries: int = 2,
+        base_backoff: float = 0.1,
+        max_backoff: float = 2.0,
+        breaker: Optional[CircuitBreaker] = None,
+        budget: Optional[RetryBudget] = None,
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.budget = budget or RetryBudget()
+        self.requests = 0
+        self.retries = 0
+        self.retries_denied = 0
+        self.deadlines_exceeded = 0
+
+    async def request(
+        self,
+        client: httpx.AsyncClient,
+        method: str,
+        url: str,
+        deadline: Optional[Deadline] = None,
+        idempotent: bool = True,
+        **kwargs,
+    ) -> httpx.Response:
+        """
+        Sends a request, retrying it if allowed.
+
+        Args:
+            client (httpx.AsyncClient): The HTTP client.
+            method (str): The HTTP method.
+            url (str): The URL.
+            deadline (Optional[Deadline]): When the caller gives up.
+            idempotent (bool): Whether the request may be repeated.
+            **kwargs: Arguments of `client.request`, e.g. `json`.
+
+        Returns:
+            httpx.Response: The last response, possibly a 5xx one.
+
+        Raises:
+            CircuitOpenError: If the circuit is open.
+            DeadlineExceeded: If the deadline passed before an attempt.
+            httpx.TransportError: If the last attempt failed to get a response.
+        """
+        self.requests += 1
+        self.budget.deposit()
+        headers = dict(kwargs.pop("headers", None) or {})
+        attempt = 0
+        while True:
+            timeout = self.timeout
+            if deadline is not None:
+                if deadline.expired:
+                    self.deadlines_exceeded += 1
+                    raise DeadlineExceeded(f"Deadline exceeded calling {self.name}")
+                timeout = min(timeout, deadline.remaining())
+                headers[DEADLINE_HEADER] = deadline.header_value()
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                raise CircuitOpenError(f"Circuit of {self.name} is open") from None
+            started = time.monotonic()
+            try:
+                response = await client.request(
+                    method,
+                    url,
+                    headers=headers,
+                    timeout=httpx.Timeout(
+                        timeout, connect=min(self.connect_timeout, timeout)
+                    ),
+                    **kwargs,
+                )
+            except httpx.TransportError as e:
+                self.breaker.record(True, time.monotonic() - started)
+                error, response = e, None
+                retryable = idempotent or isinstance(
+                    e, (httpx.ConnectError, httpx.ConnectTimeout)
+                )
+            except BaseException:
+                self.breaker.abandon()
+                raise
+            else:
+                failed = response.status_code >= 500
+                self.breaker.record(failed, time.monotonic() - started)
+                if not failed:
+                    return response
+                error, retryable = None, idempotent
+            delay = self._backoff(attempt)
+            if (
+                not retryable
+                or attempt >= self.max_retries
+                or (deadline is not None and deadline.remaining() <= delay)
+            ):
+                break
+            if not self.budget.withdraw():
+                self.retries_denied += 1
+                break
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the counters of the upstream and of its circuit breaker.
+        """
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "retries_denied": self.retries_denied,
+            "retry_tokens": round(self.budget.tokens, 2),
+            "deadlines_exceeded": self.deadlines_exceeded,
+            "breaker": self.breaker.stats(),
+        }
+
+    def _backoff(self, attempt: int) -> float:
+        """
+        Returns the jittered delay before a retry.
+        """
+        ceiling = min(self.max_backoff, self.base_backoff * 2**attempt)
+        return random.uniform(ceiling / 2, ceiling)
@@ -0,0 +1,391 @@
+import asyncio
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Words that make a request polite or chatty without changing the command.
+FILLER_WORDS = frozenset(
+    "a an the please kindly could can would will you me for just hey hi ok "
+    "okay um uh so now".split()
+)
+
+# Writes between two prunings of the persistent tier
+PRUNE_INTERVAL = 100
+
+_WORD = re.compile(r"[a-z0-9_./~*-]+", re.IGNORECASE | re.ASCII)
+
+# Characters marking a word as a path, whose case matters
+PATH_CHARACTERS = frozenset("/.~")
+
+
+def command_words(verbal_command: str) -> List[Tuple[str, str]]:
+    """
+    Splits a verbal command into its normalized words, each with the text it
+    was read from in its original case (e.g. for paths).
+
+    Args:
+        verbal_command (str): The command as spoken.
+
+    Returns:
+        List[Tuple[str, str]]: The normalized words and their original text.
+    """
+    words = []
+    for text in _WORD.findall(verbal_command):
+        if text.strip("."):
+            text = text.rstrip(".")
+        word = text.lower()
+        if word and word not in FILLER_WORDS:
+            words.append((word, text))
+    return words
+
+
+def normalize_command(verbal_command: str) -> str:
+    """
+    Returns the cache key of a verbal command.
+
+    The command is lowercased, punctuation and filler words are dropped and
+    whitespace is collapsed, so "Please, show me the files in the folder!"
+    and "show files in folder" share a key. Path characters (/ . ~ - _ *)
+    are kept inside words; sentence-ending dots are not. Words holding a
+    /, . or ~ are paths and keep their case, so "delete Foo.txt" and
+    "delete foo.txt" get different keys.
+
+    Args:
+        verbal_command (str): The command as spoken.
+
+    Returns:
+        str: The normalized command.
+    """
+    return " ".join(
+        text if PATH_CHARACTERS.intersection(text) else word
+        for word, text in command_words(verbal_command)
+    )
+
+
+class TranslationEntry:
+    """
+    A cached translation.
+
+    Attributes:
+        key (str): The normalized verbal command.
+        verbal_command (str): The verbal command it was first stored for.
+        command (str): The shell command.
+        expires_at (float): When the entry expires (epoch seconds).
+        pinned (bool): Pinned entries neither expire nor get evicted.
+        hits (int): Lookups the entry answered since it was loaded.
+    """
+
+    __slots__ = ("key", "verbal_command", "command", "expires_at", "pinned", "hits")
+
+    def __init__(self, key, verbal_command, command, expires_at, pinned=False):
+        self.key = key
+        self.verbal_command = verbal_command
+        self.command = command
+        self.expires_at = expires_at
+        self.pinned = pinned
+        self.hits = 0
+
+    def fresh(self, now: float) -> bool:
+        """
+        Returns whether the entry may still be used.
+        """
+        return self.pinned or self.expires_at > now
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns the entry as shown by the admin endpoints.
+        """
+        return {
+            "key": self.key,
+            "verbal_command": self.verbal_command,
+            "command": self.command,
+            "pinned": self.pinned,
+            "hits": self.hits,
+            "expires_at": None if self.pinned else self.expires_at,
+        }
+
+
+class TranslationCache:
+    """
+    Caches the shell command of each normalized verbal command, so repeated
+    commands skip the LLM.
+
+    Entries live in a bounded in-memory LRU with a TTL, backed by an optional
+    SQLite file that survives restarts. Lookups check memory first, then the
+    file; entries found in the file are promoted to memory. Pinned entries
+    are always kept in memory and never expire. The file keeps the
+    `max_rows` most recent unpinned entries, trimmed every PRUNE_INTERVAL
+    writes. File access runs in worker threads.
+
+    Attributes:
+        max_entries (int): Maximum number of unpinned entries in memory.
+        ttl (float): Seconds after which an unpinned entry expires.
+        path (Optional[str]): SQLite file of the persistent tier, or None.
+        max_rows (int): Maximum number of unpinned entries in the file.
+        hits (int): Lookups answered from memory or from the file.
+        disk_hits (int): Lookups answered from the file.
+        misses (int): Lookups that found no fresh entry.
+        stores (int): Translations stored.
+        evictions (int): Entries evicted from memory or by an admin.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 86400,
+        path: Optional[str] = None,
+        max_rows: int = 100000,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.max_rows = max_rows
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, TranslationEntry]" = OrderedDict()
+        # The unpinned keys, least recently used first, for O(1) eviction.
+        self._lru: "OrderedDict[str, None]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._writes = 0
+
+    def open(self):
+        """
+        Opens the persistent tier, if configured, and loads the pinned
+        entries. Performs blocking file I/O.
+        """
+        if self.path is None or self._db is not None:
+            return
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            "key TEXT PRIMARY KEY, verbal_command TEXT NOT NULL, "
+            "command TEXT NOT NULL, expires_at REAL NOT NULL, "
+            "pinned INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._prune(db)
+        db.commit()
+        for row in db.execute(
+            "SELECT key, verbal_command, command, expires_at, pinned "
+            "FROM translations WHERE pinned = 1"
+        ):
+            self._remember(TranslationEntry(*row[:4], pinned=True))
+        self._db = db
+
+    def close(self):
+        """
+        Closes the persistent tier. Performs blocking file I/O.
+        """
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    async def get(self, verbal_command: str) -> Optional[str]:
+        """
+        Looks the translation of a verbal command up.
+
+        Args:
+            verbal_command (str): The command as spoken.
+
+        Returns:
+            Optional[str]: The shell command, or None.
+        """
+        key = normalize_command(verbal_command)
+        if not key:
+            self.misses += 1
+            return None
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and not entry.fresh(now):
+            self._forget(key)
+            entry = None
+        if entry is None and self._db is not None:
+            entry = await asyncio.to_thread(self._read, key, now)
+            if entry is not None:
+                self._remember(entry)
+                self.disk_hits += 1
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        if key in self._lru:
+            self._lru.move_to_end(key)
+        entry.hits += 1
+        self.hits += 1
+        return entry.command
+
+    async def put(
+        self, verbal_command: str, command: str, pinned: bool = False
+    ) -> Optional[TranslationEntry]:
+        """
+        Stores the translation of a verbal command, in memory and in the
+        persistent tier.
+
+        Args:
+            verbal_command (str): The command as spoken.
+            command (str): The shell command.
+            pinned (bool): Keep the entry until it is unpinned or evicted.
+
+        Returns:
+            Optional[TranslationEntry]: The stored entry, or None if the
+            command is only filler words.
+        """
+        key = normalize_command(verbal_command)
+        if not key:
+            return None
+        entry = TranslationEntry(
+            key,
+            verbal_command,
+            command,
+            time.time() + self.ttl,
+            pinned,
+        )
+        self._remember(entry)
+        self.stores += 1
+        if self._db is not None:
+            await asyncio.to_thread(self._write, entry)
+        return entry
+
+    async def evict(self, verbal_command: str) -> bool:
+        """
+        Removes the translation of a verbal command, pinned or not.
+
+        Returns:
+            bool: Whether there was one.
+        """
+        key = normalize_command(verbal_command)
+        removed = self._forget(key) is not None
+        if self._db is not None:
+            removed = await asyncio.to_thread(self._delete, key) or removed
+        if removed:
+            self.evictions += 1
+        return removed
+
+    def entries(self) -> List[TranslationEntry]:
+        """
+        Returns the entries in memory, least recently used first.
+        """
+        return list(self._entries.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the counters of the cache.
+
+        Returns:
+            Dict[str, Any]: Counters, sizes and the hit ratio.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "pinned": len(self._entries) - len(self._lru),
+            "persistent": self._db is not None,
+        }
+
+    def _remember(self, entry: TranslationEntry):
+        """
+        Adds an entry to the in-memory LRU, evicting the least recently used
+        unpinned entries.
+        """
+        self._forget(entry.key)
+        self._entries[entry.key] = entry
+        if not entry.pinned:
+            self._lru[entry.key] = None
+            while len(self._lru) > self.max_entries:
+                key, _ = self._lru.popitem(last=False)
+                del self._entries[key]
+                self.evictions += 1
+
+    def _forget(self, key: str) -> Optional[TranslationEntry]:
+        """
+        Removes an entry from memory.
+
+        Returns:
+            Optional[TranslationEntry]: The entry, or None if there was none.
+        """
+        self._lru.pop(key, None)
+        return self._entries.pop(key, None)
+
+    def _read(self, key: str, now: float) -> Optional[TranslationEntry]:
+        """
+        Reads a fresh entry from the file. Runs in a worker thread.
+        """
+        with self._db_lock:
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT key, verbal_command, command, expires_at, pinned "
+                "FROM translations WHERE key = ? AND (pinned = 1 OR expires_at > ?)",
+                (key, now),
+            ).fetchone()
+        if row is None:
+            return None
+        return TranslationEntry(*row[:4], pinned=bool(row[4]))
+
+    def _write(self, entry: TranslationEntry):
+        """
+        Writes an entry to the file, pruning it every PRUNE_INTERVAL writes.
+        Runs in a worker thread.
+        """
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO translations "
+                "(key, verbal_command, command, expires_at, pinned) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    entry.key,
+                    entry.verbal_command,
+                    entry.command,
+                    entry.expires_at,
+                    int(entry.pinned),
+                ),
+            )
+            self._writes += 1
+            if self._writes % PRUNE_INTERVAL == 0:
+                self._prune(self._db)
+            self._db.commit()
+
+    def _prune(self, db: sqlite3.Connection):
+        """
+        Deletes the expired unpinned entries from the file, and the oldest
+        ones beyond `max_rows`.
+        """
+        db.execute(
+            "DELETE FROM translations WHERE pinned = 0 AND expires_at <= ?",
+            (time.time(),),
+        )
+        db.execute(
+            "DELETE FROM translations WHERE key IN ("
+            "SELECT key FROM translations WHERE pinned = 0 "
+            "ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_rows,),
+        )
+
+    def _delete(self, key: str) -> bool:
+        """
+        Deletes an entry from the file. Runs in a worker thread.
+        """
+        with self._db_lock:
+            if self._db is None:
+                return False
+            deleted = self._db.execute(
+                "DELETE FROM translations WHERE key = ?", (key,)
+            ).rowcount
+            self._db.commit()
+        return deleted > 0
@@ -1,89 +1,615 @@
-from fastapi import FastAPI, HTTPException
-import requests
+import asyncio
+import hmac
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, Tuple
+from fastapi import (
+    FastAPI,
+    Header,
+    HTTPException,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from fastapi.responses import StreamingResponse
+import httpx
 import json
 from pydantic import BaseModel
+from libraries.command_rules import CommandTranslator
+from libraries.jobs import Job, JobStore, TooManyJobs
+from libraries.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceeded,
+    RetryBudget,
+    Upstream,
+)
+from libraries.translation_cache import TranslationCache
+from shared.deadline import DEADLINE_HEADER, Deadline
+from shared.transport import service_routes
 
 
-app = FastAPI()
+def env_flag(name: str, default: str) -> bool:
+    """
+    Reads a boolean setting from the environment.
+    """
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
 
 # Configuration for the microservices endpoints
 COMMAND_SERVICE_URL = "http://localhost:8003"
 OPENAI_SERVICE_URL = "http://localhost:8001/completion"
 
+# Connection pool shared by the calls to the upstream services
+GATEWAY_MAX_CONNECTIONS = int(os.getenv("GATEWAY_MAX_CONNECTIONS", "100"))
+GATEWAY_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("GATEWAY_MAX_KEEPALIVE_CONNECTIONS", "20")
+)
+GATEWAY_KEEPALIVE_EXPIRY = float(os.getenv("GATEWAY_KEEPALIVE_EXPIRY", "30"))
+GATEWAY_CONNECT_TIMEOUT = float(os.getenv("GATEWAY_CONNECT_TIMEOUT", "2"))
+
+# Seconds each upstream may take to answer; completions are the slow ones
+OPENAI_SERVICE_TIMEOUT = float(os.getenv("OPENAI_SERVICE_TIMEOUT", "60"))
+COMMAND_SERVICE_TIMEOUT = float(os.getenv("COMMAND_SERVICE_TIMEOUT", "30"))
+
+# Calls slower than this count against the upstream's circuit breaker
+OPENAI_SERVICE_SLOW_CALL = float(os.getenv("OPENAI_SERVICE_SLOW_CALL", "20"))
+COMMAND_SERVICE_SLOW_CALL = float(os.getenv("COMMAND_SERVICE_SLOW_CALL", "5"))
+
+# Circuit breakers: open on the failure or slow-call rate of the last calls
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_CALL_RATE = float(os.getenv("BREAKER_SLOW_CALL_RATE", "0.5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+
+# Retries of failed upstream calls, at most RETRY_BUDGET_RATIO per request
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MAX_TOKENS = float(os.getenv("RETRY_BUDGET_MAX_TOKENS", "10"))
+
+# Seconds a job may take end to end, unless the caller sets a shorter deadline
+GATEWAY_DEADLINE = float(os.getenv("GATEWAY_DEADLINE", "360"))
+
+# Background jobs of /execute_command
+JOB_MAX_JOBS = int(os.getenv("JOB_MAX_JOBS", "1000"))
+JOB_TTL = float(os.getenv("JOB_TTL", "3600"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+JOB_COMMAND_TIMEOUT = float(os.getenv("JOB_COMMAND_TIMEOUT", "300"))
+
+# Cache of the shell command of each verbal command; empty path keeps it in memory
+TRANSLATION_CACHE_ENABLED = env_flag("TRANSLATION_CACHE_ENABLED", "true")
+TRANSLATION_CACHE_MAX_ENTRIES = int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", "1024"))
+TRANSLATION_CACHE_TTL = float(os.getenv("TRANSLATION_CACHE_TTL", "86400"))
+TRANSLATION_CACHE_PATH = os.getenv("TRANSLATION_CACHE_PATH", "./data/translations.db")
+TRANSLATION_CACHE_MAX_ROWS = int(os.getenv("TRANSLATION_CACHE_MAX_ROWS", "100000"))
+# Token the /translations admin endpoints require in ADMIN_TOKEN_HEADER; empty
+# (the default) disables them, as pinned translations are executed as given
+TRANSLATION_ADMIN_TOKEN = os.getenv("TRANSLATION_ADMIN_TOKEN", "")
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+
+# Local rules translating common verbal commands without the LLM
+TRANSLATOR_ENABLED = env_flag("TRANSLATOR_ENABLED", "true")
+TRANSLATOR_RULES_PATH = os.getenv(
+    "TRANSLATOR_RULES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "command_rules.json"),
+)
+
+http_client: Optional[httpx.AsyncClient] = None
+jobs = JobStore(max_jobs=JOB_MAX_JOBS, ttl=JOB_TTL)
+translation_cache = (
+    TranslationCache(
+        max_entries=TRANSLATION_CACHE_MAX_ENTRIES,
+        ttl=TRANSLATION_CACHE_TTL,
+        path=TRANSLATION_CACHE_PATH or None,
+        max_rows=TRANSLATION_CACHE_MAX_ROWS,
+    )
+    if TRANSLATION_CACHE_ENABLED
+    else None
+)
+command_translator = (
+    CommandTranslator.from_file(TRANSLATOR_RULES_PATH) if TRANSLATOR_ENABLED else None
+)
+
+
+def create_upstream(name: str, timeout: float, slow_call_seconds: float) -> Upstream:
+    """
+    Creates the circuit breaker and retry budget of an upstream service.
+    """
+    return Upstream(
+        name,
+        timeout,
+        connect_timeout=GATEWAY_CONNECT_TIMEOUT,
+        max_retries=UPSTREAM_MAX_RETRIES,
+        breaker=CircuitBreaker(
+            window=BREAKER_WINDOW,
+            min_calls=BREAKER_MIN_CALLS,
+            failure_rate=BREAKER_FAILURE_RATE,
+            slow_call_seconds=slow_call_seconds,
+            slow_call_rate=BREAKER_SLOW_CALL_RATE,
+            open_seconds=BREAKER_OPEN_SECONDS,
+        ),
+        budget=RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_MAX_TOKENS),
+    )
+
+
+openai_upstream = create_upstream(
+    "chatgpt_service", OPENAI_SERVICE_TIMEOUT, OPENAI_SERVICE_SLOW_CALL
+)
+command_upstream = create_upstream(
+    "command_executor_service", COMMAND_SERVICE_TIMEOUT, COMMAND_SERVICE_SLOW_CALL
+)
+
+
+def upstream_client() -> httpx.AsyncClient:
+    """
+    Returns the HTTP client shared by the calls to the upstream services,
+    opening it if needed.
+
+    Its connections are pooled and kept alive between requests. Services
+    mounted in this process (see `top_secret.monolith`) are called without
+    going over TCP.
+
+    Returns:
+        httpx.AsyncClient: The pooled client.
+    """
+    global http_client
+    if http_client is None or http_client.is_closed:
+        limits = httpx.Limits(
+            max_connections=GATEWAY_MAX_CONNECTIONS,
+            max_keepalive_connections=GATEWAY_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=GATEWAY_KEEPALIVE_EXPIRY,
+        )
+        http_client = httpx.AsyncClient(
+            transport=service_routes.transport(limits=limits),
+            timeout=httpx.Timeout(
+                COMMAND_SERVICE_TIMEOUT, connect=GATEWAY_CONNECT_TIMEOUT
+            ),
+        )
+    return http_client
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Opens the upstream connection pool and the translation cache, and on
+    shutdown cancels the running jobs and closes them.
+    """
+    upstream_client()
+    if translation_cache is not None:
+        if translation_cache.path:
+            os.makedirs(
+                os.path.dirname(os.path.abspath(translation_cache.path)), exist_ok=True
+            )
+        await asyncio.to_thread(translation_cache.open)
+    yield
+    tasks = [job.task for job in jobs if job.task is not None and not job.task.done()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if translation_cache is not None:
+        await asyncio.to_thread(translation_cache.close)
+    if http_client is not None:
+        await http_client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def upstream_http_error(e: Exception) -> HTTPException:
+    """
+    Returns the error reported for a failed upstream call: 503 while its
+    circuit is open, 504 on timeouts and 400 otherwise.
+    """
+    if isinstance(e, CircuitOpenError):
+        return HTTPException(status_code=503, detail=str(e))
+    if isinstance(e, (DeadlineExceeded, httpx.TimeoutException)):
+        return HTTPException(status_code=504, detail=str(e))
+    return HTTPException(status_code=400, detail=str(e))
+
 
 class ClientCommandExecutor:
     @staticmethod
-    def start_command(command):
-        """Send a request to start a command."""
+    async def start_command(
+        client: httpx.AsyncClient, command, deadline: Optional[Deadline] = None
+    ):
+        """Send a request to start a command; it is not retried once sent."""
         try:
-            response = requests.post(
-                f"{COMMAND_SERVICE_URL}/commands/start", json={"command": command}
+            response = await command_upstream.request(
+                client,
+                "POST",
+                f"{COMMAND_SERVICE_URL}/commands/start",
+                deadline,
+                idempotent=False,
+                json={"command": command},
             )
             response.raise_for_status()
             return response.json()
-        except requests.RequestException as e:
-            raise HTTPException(status_code=400, detail=str(e))
+        except (httpx.HTTPError, CircuitOpenError, DeadlineExceeded) as e:
+            raise upstream_http_error(e)
 
     @staticmethod
-    def get_command_status(process_id):
+    async def get_command_status(
+        client: httpx.AsyncClient, process_id, deadline: Optional[Deadline] = None
+    ):
         """Send a request to get the status of a command."""
         try:
-            response = requests.get(
+            response = await command_upstream.request(
+                client,
+                "GET",
                 f"{COMMAND_SERVICE_URL}/commands/status",
+                deadline,
                 params={"process_id": process_id},
             )
             response.raise_for_status()
             return response.json()
-        except requests.RequestException as e:
-            raise HTTPException(status_code=400, detail=str(e))
+        except (httpx.HTTPError, CircuitOpenError, DeadlineExceeded) as e:
+            raise upstream_http_error(e)
 
 
 class CommandRequest(BaseModel):
     verbal_command: str
 
 
-@app.post("/execute_command/")
-async def execute_command(request: CommandRequest):
-    verbal_command = request.verbal_command
-    print("Received verbal command:", verbal_command)
+class TranslationRequest(BaseModel):
+    """
+    Pydantic model for setting a cached translation; pinned translations
+    never expire nor get evicted by newer ones.
+    """
+
+    verbal_command: str
+    command: str
+    pinned: bool = True
+
+
+@app.post("/execute_command/", status_code=status.HTTP_202_ACCEPTED)
+async def execute_command(
+    request: CommandRequest,
+    timeout_ms: Optional[str] = Header(None, alias=DEADLINE_HEADER),
+):
+    """
+    Starts translating and executing a verbal command in the background.
+
+    The job can then be looked up at /jobs/{job_id}, and its progress
+    followed at /jobs/{job_id}/events (Server-Sent Events) or
+    /jobs/{job_id}/ws (WebSocket).
+
+    The job must be over within GATEWAY_DEADLINE seconds, or the
+    milliseconds of the X-Request-Timeout-Ms header if shorter. The time left
+    is sent to the upstream services in the same header, so they can give up
+    too.
+
+    Args:
+        request (CommandRequest): The verbal command.
+        timeout_ms (Optional[str]): The caller's deadline, if any.
+
+    Returns:
+        dict: The job id and status.
+
+    Raises:
+        HTTPException: 503 if JOB_MAX_JOBS jobs are not over yet.
+    """
+    print("Received verbal command:", request.verbal_command)
+    deadline = Deadline(GATEWAY_DEADLINE)
+    requested = Deadline.from_header(timeout_ms)
+    if requested is not None and requested.expires_at < deadline.expires_at:
+        deadline = requested
+    try:
+        job = jobs.create(request.verbal_command)
+    except TooManyJobs as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e)
+        ) from e
+    job.task = asyncio.create_task(run_job(job, deadline))
+    return {"job_id": job.job_id, "status": job.status}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Returns the status of a job, and its command and output once known.
+
+    Raises:
+        HTTPException: If the job is unknown or expired.
+    """
+    return find_job(job_id).to_dict()
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Streams the progress of a job as Server-Sent Events, from its start.
+
+    Each event is a `data:` line with a JSON object: {"type": "status"},
+    {"type": "command"}, {"type": "output"} or {"type": "error"}. Output
+    events carry the text appended since the previous one, or the whole
+    output with "replace": true if it changed otherwise. The stream ends
+    when the job is over.
+
+    Raises:
+        HTTPException: If the job is unknown or expired.
+    """
+    job = find_job(job_id)
+
+    async def events() -> AsyncIterator[str]:
+        async for event in job.follow():
+            yield f"data: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
+
+
+@app.websocket("/jobs/{job_id}/ws")
+async def job_websocket(websocket: WebSocket, job_id: str):
+    """
+    Sends the progress of a job over a WebSocket, one JSON event per frame
+    as in /jobs/{job_id}/events, and closes it when the job is over.
+    """
+    await websocket.accept()
+    job = jobs.get(job_id)
+    if job is None:
+        await websocket.send_json({"type": "error", "detail": "Job not found"})
+        await websocket.close(code=1008)
+        return
+    try:
+        async for event in job.follow():
+            await websocket.send_json(event)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+
+def find_job(job_id: str) -> Job:
+    """
+    Returns a job, or raises a 404 error.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+def translation_prompt(verbal_command: str) -> str:
+    """
+    Returns the prompt asking the LLM for the linux command of a verbal command.
+    """
+    return f"""
+            convert the following verbal command to a linux command
+            and return the answer in valid json:
+            "{verbal_command}"
+
+            You must return valid json. The json must contain a key called "command"
+            and the value must be a valid linux command.
+            Example verbal command: "show me the files in the folder"
+            Example response: {{"command": "ls"}}
+            """
+
+
+async def translate_command(
+    client: httpx.AsyncClient, verbal_command: str, deadline: Optional[Deadline] = None
+) -> str:
+    """
+    Asks the chatgpt service for the linux command of a verbal command.
+
+    Raises:
+        HTTPException: If the service fails.
+        httpx.HTTPError: If it cannot be reached.
+        CircuitOpenError: If its circuit is open.
+        DeadlineExceeded: If the deadline passed.
+    """
+    # The data to send in the POST request. Prompts differing only in the
+    # command must not share completions in the similarity cache.
+    data = {
+        "prompt": translation_prompt(verbal_command),
+        "streaming": False,
+        "similar": False,
+        "model": "gpt-3.5-turbo",
+    }
+    response = await openai_upstream.request(
+        client, "POST", OPENAI_SERVICE_URL, deadline, json=data
+    )
+    if response.status_code != 200:
+        print("Error:", response.status_code, response.text)
+        raise HTTPException(status_code=response.status_code, detail=response.text)
+    json_resp = response.json()["completion"]
+    return json.loads(json_resp)["command"]
+
+
+async def local_translation(verbal_command: str) -> Tuple[Optional[str], str]:
+    """
+    Translates a verbal command without the LLM, with the local rules first
+    and then the translation cache.
+
+    Returns:
+        Tuple[Optional[str], str]: The command, or None, and where it came
+        from ("rules" or "cache").
+    """
+    if command_translator is not None:
+        match = command_translator.translate(verbal_command)
+        if match is not None:
+            return match.command, "rules"
+    if translation_cache is not None:
+        command = await translation_cache.get(verbal_command)
+        if command is not None:
+            return command, "cache"
+    return None, "llm"
+
+
+async def run_job(job: Job, deadline: Optional[Deadline] = None):
+    """
+    Translates and executes the command of a job, recording its progress.
+
+    Commands are translated by the local rules or the translation cache if
+    they can, by the LLM otherwise. The command status is polled every
+    JOB_POLL_INTERVAL seconds until it stops running; the job fails if it
+    still runs after JOB_COMMAND_TIMEOUT, or when the deadline passes.
+    """
+    client = upstream_client()
+    deadline = deadline or Deadline(GATEWAY_DEADLINE)
     try:
-        # The data to send in the POST request
-        data = {
-            "prompt": f"""
-                convert the following verbal command to a linux command
-                and return the answer in valid json:
-                "{verbal_command}"
-
-                You must return valid json. The json must contain a key called "command"
-                and the value must be a valid linux command.
-                Example verbal command: "show me the files in the folder"
-                Example response: {{"command": "ls"}}
-                """,
-            "streaming": False,
-            "model": "gpt-3.5-turbo",
-        }
-
-        response = requests.post(OPENAI_SERVICE_URL, json=data)
-
-        # Check if the request was successful
-        if response.status_code == 200:
-            json_resp = response.json()["completion"]
-            command = json.loads(json_resp)["command"]
-            print(command)
-
-            # Start the command
-            start_response = ClientCommandExecutor.start_command(command)
-            process_id = start_response.get("process_id")
-
-            # Get command status
-            status_response = ClientCommandExecutor.get_command_status(process_id)
+        job.set_status("translating")
+        command, source = await local_translation(job.verbal_command)
+        if command is None:
+            command = await translate_command(client, job.verbal_command, deadline)
+        job.set_command(command, source)
+
+        job.set_status("running")
+        start_response = await ClientCommandExecutor.start_command(
+            client, command, deadline
+        )
+        process_id = start_response.get("process_id")
+        polling = Deadline(JOB_COMMAND_TIMEOUT)
+        while True:
+            status_response = await ClientCommandExecutor.get_command_status(
+                client, process_id, deadline
+            )
+            if status_response.get("output") is not None:
+                job.set_output(status_response["output"])
             if not status_response.get("running", True):
-                return {"output": status_response["output"]}
-            else:
-                return {"status": "Command is still running"}
-        else:
-            print("Error:", response.status_code, response.text)
-            raise HTTPException(status_code=response.status_code, detail=response.text)
-
-    except requests.RequestException as e:
-        raise HTTPException(status_code=500, detail=str(e))
+                break
+            if polling.expired:
+                job.fail(f"Command still running after {JOB_COMMAND_TIMEOUT:g}s")
+                return
+            if deadline.remaining() <= JOB_POLL_INTERVAL:
+                job.fail("Deadline exceeded while the command was running")
+                return
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+        # Only translations that ran are remembered. The command did run, so
+        # failing to remember it does not fail the job.
+        if translation_cache is not None and source == "llm":
+            try:
+                await translation_cache.put(job.verbal_command, command)
+            except Exception as e:
+                print(f"Could not cache the translation: {type(e).__name__}: {e}")
+        job.set_status("succeeded")
+    except asyncio.CancelledError:
+        job.fail("Gateway shutting down")
+        raise
+    except HTTPException as e:
+        job.fail(str(e.detail))
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        job.fail(str(e))
+    except (httpx.HTTPError, ValueError, KeyError, TypeError) as e:
+        job.fail(f"{type(e).__name__}: {e}")
+    except Exception as e:
+        # Any other error still ends the job, so its followers stop waiting.
+        job.fail(f"Unexpected error: {type(e).__name__}: {e}")
+
+
+@app.get("/translations")
+async def list_translations(
+    admin_token: Optional[str] = Header(None, alias=ADMIN_TOKEN_HEADER)
+):
+    """
+    Lists the cached translations in memory, least recently used first.
+    """
+    require_admin(admin_token)
+    cache = require_translation_cache()
+    return {"translations": [entry.to_dict() for entry in cache.entries()]}
+
+
+@app.get("/translations/stats")
+async def translation_stats():
+    """
+    Endpoint for reading the counters of the translation cache.
+
+    Returns:
+        A JSON object with hits, disk hits, misses, stores, evictions, the hit
+        ratio and the number of entries, or {"enabled": false}.
+    """
+    if translation_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **translation_cache.stats()}
+
+
+@app.put("/translations")
+async def put_translation(
+    request: TranslationRequest,
+    admin_token: Optional[str] = Header(None, alias=ADMIN_TOKEN_HEADER),
+):
+    """
+    Sets the translation of a verbal command, pinned by default; setting it
+    again with `pinned` false unpins it.
+
+    Returns:
+        dict: The cached entry.
+
+    Raises:
+        HTTPException: If the admin token is wrong, the cache is disabled, or
+            the verbal command is only filler words.
+    """
+    require_admin(admin_token)
+    cache = require_translation_cache()
+    entry = await cache.put(request.verbal_command, request.command, request.pinned)
+    if entry is None:
+        raise HTTPException(status_code=422, detail="Verbal command is empty")
+    return entry.to_dict()
+
+
+@app.delete("/translations", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_translation(
+    verbal_command: str,
+    admin_token: Optional[str] = Header(None, alias=ADMIN_TOKEN_HEADER),
+):
+    """
+    Evicts the translation of a verbal command, pinned or not.
+
+    Raises:
+        HTTPException: If the admin token is wrong, the cache is disabled or
+            has no such translation.
+    """
+    require_admin(admin_token)
+    cache = require_translation_cache()
+    if not await cache.evict(verbal_command):
+        raise HTTPException(status_code=404, detail="Translation not found")
+
+
+def require_admin(admin_token: Optional[str]):
+    """
+    Checks the token of an admin request.
+
+    Raises:
+        HTTPException: 403 if TRANSLATION_ADMIN_TOKEN is unset (admin
+            endpoints disabled) or the token does not match it.
+    """
+    if not TRANSLATION_ADMIN_TOKEN or not hmac.compare_digest(
+        (admin_token or "").encode(), TRANSLATION_ADMIN_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+def require_translation_cache() -> TranslationCache:
+    """
+    Returns the translation cache, or raises a 404 error if it is disabled.
+    """
+    if translation_cache is None:
+        raise HTTPException(status_code=404, detail="Translation cache disabled")
+    return translation_cache
+
+
+@app.get("/translator/stats")
+async def translator_stats():
+    """
+    Endpoint for reading the counters of the local rule translator.
+
+    Returns:
+        A JSON object with the number of patterns, the phrases matched,
+        ambiguous and unmatched, the coverage and the mean translation time,
+        or {"enabled": false}.
+    """
+    if command_translator is None:
+        return {"enabled": False}
+    return {"enabled": True, **command_translator.stats()}
+
+
+@app.get("/upstreams/stats")
+async def upstream_stats():
+    """
+    Endpoint for reading the retries and circuit breaker state of each
+    upstream service.
+    """
+    return {
+        upstream.name: upstream.stats()
+        for upstream in (openai_upstream, command_upstream)
+    }
@@ -0,0 +1,192 @@
+"""
+Runs several services in one process.
+
+Each service app is imported and registered with the shared service routes,
+so the calls between services (e.g. gateway -> chatgpt_service, any service ->
+logging_service) go straight to the other app through ASGI instead of over
+localhost TCP. The usual URLs (http://localhost:8001, ...) keep working: in
+the one service per process deployment nothing is mounted and they go over
+the network as before.
+
+    python -m top_secret.monolith                 # every service on its port
+    python -m top_secret.monolith --port 8000     # one port, /<service>/...
+
+MONOLITH_SERVICES (comma-separated) selects the services; they start in the
+given order and stop in reverse, so logging_service should come first.
+"""
+
+import argparse
+import asyncio
+import importlib
+import os
+import signal
+import sys
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Dict, List, Optional
+from fastapi import FastAPI
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Port each service listens on when it runs alone
+SERVICE_PORTS = {
+    "chatgpt_service": 8001,
+    "logging_service": 8002,
+    "command_executor_service": 8003,
+    "api_gateway": 8004,
+    "texttospeech_service": 8006,
+    "webpage_scraper_service": 8007,
+    "text_summarizer_service": 8008,
+    "function_calling_service": 8009,
+}
+
+MONOLITH_SERVICES = os.getenv(
+    "MONOLITH_SERVICES",
+    "logging_service,chatgpt_service,command_executor_service,api_gateway",
+)
+MONOLITH_HOST = os.getenv("MONOLITH_HOST", "0.0.0.0")
+
+
+def service_directory(name: str) -> str:
+    """
+    Returns the directory of a service, i.e. its working directory in its
+    image.
+    """
+    if name == "api_gateway":
+        return os.path.join(ROOT, "api_gateway")
+    return os.path.join(ROOT, "services", name)
+
+
+def load_services(names: List[str]) -> Dict[str, FastAPI]:
+    """
+    Imports the apps of services.
+
+    Every service directory goes on sys.path, as services import their
+    helpers as top-level modules (`libraries.*`, `shared.*`).
+
+    Args:
+        names (List[str]): The services, among SERVICE_PORTS.
+
+    Returns:
+        Dict[str, FastAPI]: The app of each service, in the given order.
+
+    Raises:
+        ValueError: If a service is unknown.
+    """
+    unknown = [name for name in names if name not in SERVICE_PORTS]
+    if unknown:
+        raise ValueError(f"Unknown services: {', '.join(unknown)}")
+    for path in [ROOT, os.path.dirname(ROOT)] + [service_directory(n) for n in names]:
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    apps = {}
+    for name in names:
+        package = "api_gateway" if name == "api_gateway" else f"services.{name}"
+        apps[name] = importlib.import_module(f"top_secret.{package}.main").app
+    return apps
+
+
+def mount_services(apps: Dict[str, FastAPI]):
+    """
+    Routes the calls to the services' usual ports to their apps in process.
+    """
+    from shared.transport import service_routes
+
+    for name, app in apps.items():
+        service_routes.mount(SERVICE_PORTS[name], app)
+
+
+@asynccontextmanager
+async def run_lifespans(apps: Dict[str, FastAPI]):
+    """
+    Starts the services in order and stops them in reverse order.
+    """
+    async with AsyncExitStack() as stack:
+        for app in apps.values():
+            await stack.enter_async_context(app.router.lifespan_context(app))
+        yield
+
+
+def create_app(apps: Dict[str, FastAPI]) -> FastAPI:
+    """
+    Combines services into one app, each under /<service name>.
+
+    Args:
+        apps (Dict[str, FastAPI]): The app of each service.
+
+    Returns:
+        FastAPI: The combined app; its lifespan runs those of the services.
+    """
+
+    @asynccontextmanager
+    async def lifespan(_: FastAPI):
+        async with run_lifespans(apps):
+            yield
+
+    monolith = FastAPI(lifespan=lifespan)
+    for name, app in apps.items():
+        monolith.mount(f"/{name}", app)
+    return monolith
+
+
+async def serve(
+    names: List[str], host: str = MONOLITH_HOST, port: Optional[int] = None
+):
+    """
+    Serves services from this process.
+
+    Args:
+        names (List[str]): The services.
+        host (str): The interface to listen on.
+        port (Optional[int]): Serve every service on this port, under
+            /<service name>; by default each service gets its usual port.
+    """
+    import uvicorn
+
+    apps = load_services(names)
+    mount_services(apps)
+    if port is not None:
+        await uvicorn.Server(uvicorn.Config(create_app(apps), host, port)).serve()
+        return
+
+    class Server(uvicorn.Server):
+        def install_signal_handlers(self):
+            # The servers share the process, so the launcher handles signals.
+            pass
+
+    servers = [
+        Server(uvicorn.Config(app, host, SERVICE_PORTS[name], lifespan="off"))
+        for name, app in apps.items()
+    ]
+
+    def shut_down():
+        for server in servers:
+            server.should_exit = True
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, shut_down)
+    async with run_lifespans(apps):
+        await asyncio.gather(*(server.serve() for server in servers))
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Runs the launcher from the command line.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--services",
+        default=MONOLITH_SERVICES,
+        help="comma-separated services, started in this order",
+    )
+    parser.add_argument("--host", default=MONOLITH_HOST)
+    parser.add_argument(
+        "--port", type=int, help="serve everything on one port, under /<service>"
+    )
+    args = parser.parse_args(argv)
+    names = [name.strip() for name in args.services.split(",") if name.strip()]
+    asyncio.run(serve(names, args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Per-request cache control: use the cache, skip it entirely, or skip the
+# lookup but store the fresh response.
+CACHE_MODES = ("use", "bypass", "refresh")
+
+
+def normalize_messages(messages: List[dict]) -> List[dict]:
+    """
+    Normalizes chat messages so that insignificant differences share a key.
+
+    Line endings are unified and surrounding whitespace is stripped from the
+    content; roles and other keys are kept as they are.
+
+    Args:
+        messages (List[dict]): The chat messages.
+
+    Returns:
+        List[dict]: The normalized messages.
+    """
+    normalized = []
+    for message in messages:
+        message = dict(message)
+        if isinstance(message.get("content"), str):
+            message["content"] = message["content"].replace("\r\n", "\n").strip()
+        normalized.append(message)
+    return normalized
+
+
+def cache_key(model: str, messages: List[dict], **params) -> str:
+    """
+    Derives the cache key of a completion request.
+
+    Args:
+        model (str): The model.
+        messages (List[dict]): The chat messages.
+        **params: Other parameters that change the response, e.g. the base URL
+         or the temperature. None values are ignored.
+
+    Returns:
+        str: A SHA-256 hex digest.
+    """
+    canonical = json.dumps(
+        {
+            "model": model,
+            "messages": normalize_messages(messages),
+            "params": {k: v for k, v in params.items() if v is not None},
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def cache_mode(value: Optional[str], cache_control: Optional[str] = None) -> str:
+    """
+    Resolves the cache mode of a request.
+
+    Args:
+        value (Optional[str]): Mode given in the request body, one of
+         CACHE_MODES.
+        cache_control (Optional[str]): The Cache-Control header; "no-store"
+         means bypass and "no-cache" means refresh.
+
+    Returns:
+        str: One of CACHE_MODES.
+    """
+    if value is not None:
+        return value
+    directives = {d.strip().lower() for d in (cache_control or "").split(",")}
+    if "no-store" in directives:
+        return "bypass"
+    if "no-cache" in directives:
+        return "refresh"
+    return "use"
+
+
+class CompletionCache:
+    """
+    Caches completion responses in a bounded in-memory LRU with a TTL, backed
+    by an optional SQLite file that survives restarts.
+
+    Lookups check memory first, then the file; entries found in the file are
+    promoted to memory. File access runs in worker threads.
+
+    Attributes:
+        max_entries (int): Maximum number of entries kept in memory.
+        ttl (float): Seconds after which an entry expires.
+        path (Optional[str]): SQLite file of the persistent tier, or None.
+        max_disk_entries (int): Maximum number of entries kept in the file.
+        hits (int): Lookups answered from memory or from the file.
+        disk_hits (int): Lookups answered from the file.
+        misses (int): Lookups that found no fresh entry.
+        stores (int): Entries stored.
+        bypasses (int): Requests that skipped the cache.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 3600,
+        path: Optional[str] = None,
+        max_disk_entries: int = 100_000,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.bypasses = 0
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._writes = 0
+
+    def open(self):
+        """
+        Opens the persistent tier, if configured. Performs blocking file I/O.
+        """
+        if self.path is None or self._db is not None:
+            return
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        db.execute(
+            "CREATE INDEX IF NOT EXISTS completions_expiry "
+            "ON completions (expires_at)"
+        )
+        db.execute("DELETE FROM completions WHERE expires_at <= ?", (time.time(),))
+        db.commit()
+        self._db = db
+
+    def close(self):
+        """
+        Closes the persistent tier. Performs blocking file I/O.
+        """
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    async def get(self, key: str) -> Optional[Any]:
+        """
+        Looks a fresh entry up.
+
+        Args:
+            key (str): The key from `cache_key`.
+
+        Returns:
+            Optional[Any]: The cached response, or None.
+        """
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+        if self._db is not None:
+            row = await asyncio.to_thread(self._read, key, now)
+            if row is not None:
+                expires_at, value = row
+                self._remember(key, expires_at, value)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, value: Any):
+        """
+        Stores an entry in memory and in the persistent tier.
+
+        Args:
+            key (str): The key from `cache_key`.
+            value (Any): A JSON-serializable response.
+        """
+        expires_at = time.time() + self.ttl
+        self._remember(key, expires_at, value)
+        self.stores += 1
+        if self._db is not None:
+            await asyncio.to_thread(self._write, key, expires_at, value)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the counters of the cache.
+
+        Returns:
+            Dict[str, Any]: Counters, sizes and the hit ratio.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "bypasses": self.bypasses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "persistent": self._db is not None,
+        }
+
+    def _remember(self, key: str, expires_at: float, value: Any):
+        """
+        Adds an entry to the in-memory LRU, evicting the least recently used.
+        """
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _read(self, key: str, now: float) -> Optional[Tuple[float, Any]]:
+        """
+        Reads a fresh entry from the file. Runs in a worker thread.
+        """
+        with self._db_lock:
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT expires_at, value FROM completions "
+                "WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _write(self, key: str, expires_at: float, value: Any):
+        """
+        Writes an entry to the file, trimming the file now and then. Runs in a
+        worker thread.
+        """
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO completions (key, value, expires_at) "
+                "VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._db.execute(
+                    "DELETE FROM completions WHERE expires_at <= ?", (time.time(),)
+                )
+                self._db.execute(
+                    "DELETE FROM completions WHERE key IN (SELECT key FROM "
+                    "completions ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,),
+                )
+            self._db.commit()
@@ -0,0 +1,126 @@
+import importlib.util
+from collections import OrderedDict
+from typing import Optional, Tuple
+import httpx
+from openai import AsyncOpenAI
+
+# HTTP/2 needs the optional h2 package (httpx[http2]).
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+ClientKey = Tuple[Optional[str], Optional[str]]
+
+
+class OpenAIClientRegistry:
+    """
+    Process-wide registry of OpenAI clients sharing one connection pool.
+
+    Clients are keyed by (api key, base URL) and created on first use. All of
+    them send their requests through a single `httpx.AsyncClient`, so
+    connections (and their TLS sessions) are kept alive and reused across
+    requests instead of being opened for every completion and never closed.
+
+    Attributes:
+        max_connections (int): Maximum number of open connections.
+        max_keepalive_connections (int): Maximum number of idle connections
+            kept alive.
+        keepalive_expiry (float): Seconds after which an idle connection is
+            closed.
+        http2 (bool): Whether to negotiate HTTP/2; ignored when the h2 package
+            is not installed.
+        timeout (httpx.Timeout): Default timeout of the requests.
+        max_retries (int): Default number of retries of the OpenAI SDK.
+        max_clients (int): Maximum number of cached clients; the least recently
+            used one is dropped beyond it.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = True,
+        timeout: httpx.Timeout = httpx.Timeout(60.0, connect=5.0),
+        max_retries: int = 2,
+        max_clients: int = 32,
+    ):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_clients = max_clients
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._clients: "OrderedDict[ClientKey, AsyncOpenAI]" = OrderedDict()
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """
+        Returns the shared HTTP client, opening it if needed.
+
+        Returns:
+            httpx.AsyncClient: The pooled client.
+        """
+        self.start()
+        return self._http_client
+
+    def start(self):
+        """
+        Opens the shared HTTP client, unless it is already open.
+        """
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = httpx.AsyncClient(
+                http2=self.http2,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+            )
+            self._clients.clear()
+
+    def get(
+        self, api_key: Optional[str] = None, base_url: Optional[str] = None
+    ) -> AsyncOpenAI:
+        """
+        Returns the client of an API key and base URL, creating it if needed.
+
+        Args:
+            api_key (Optional[str]): The API key; defaults to OPENAI_API_KEY.
+            base_url (Optional[str]): The API URL; defaults to OpenAI's.
+
+        Returns:
+            AsyncOpenAI: The client, sharing the registry's connection pool.
+        """
+        http_client = self.http_client
+        key = (api_key, base_url)
+        client = self._clients.get(key)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=self.timeout,
+                max_retries=self.max_retries,
+                http_client=http_client,
+            )
+            self._clients[key] = client
+            if len(self._clients) > self.max_clients:
+                # The pool belongs to the registry, so nothing needs closing.
+                self._clients.popitem(last=False)
+        else:
+            self._clients.move_to_end(key)
+        return client
+
+    async def aclose(self):
+        """
+        Forgets the clients and closes the shared connection pool.
+        """
+        self._clients.clear()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+
+# Registry used by the wrappers when none is given, e.g. outside the service.
+default_registry = OpenAIClientRegistry()
@@ -1,14 +1,14 @@
 import os
-from openai import AsyncOpenAI
 from dotenv import load_dotenv
+from libraries.openai_clients import default_registry
 
 load_dotenv()
 
 
 class OpenAIWrapperFunction:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, base_url=None, clients=None):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
-        self.client = AsyncOpenAI(api_key=self.api_key)
+        self.client = (clients or default_registry).get(self.api_key, base_url)
 
     async def create_completion(self, model, messages, functions=None, **kwargs):
         return await self.client.chat.completions.create(
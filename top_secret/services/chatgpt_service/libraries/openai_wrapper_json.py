@@ -1,15 +1,20 @@
 from typing import List, Optional
-from openai import AsyncOpenAI
 import os
 from dotenv import load_dotenv
+from libraries.openai_clients import OpenAIClientRegistry, default_registry
 
 load_dotenv()
 
 
 class OpenAIWrapperJson:
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        clients: Optional[OpenAIClientRegistry] = None,
+    ):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
-        self.client = AsyncOpenAI(api_key=self.api_key)
+        self.client = (clients or default_registry).get(self.api_key, base_url)
 
     async def create_completion(
         self,
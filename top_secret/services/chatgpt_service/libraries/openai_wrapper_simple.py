@@ -1,23 +1,16 @@
 import httpx
 import logging
+from contextlib import nullcontext
+from typing import Optional
 from fastapi import HTTPException, status
 from openai import (
-    AsyncOpenAI,
     APIConnectionError,
     RateLimitError,
     APIStatusError,
 )
-
-
-def send_log(message: str):
-    url = "http://localhost:8000/log"
-    data = {"message": message}
-    try:
-        with httpx.Client() as client:
-            response = client.post(url, json=data)
-            return response.json()
-    except httpx.RequestError as e:
-        print(f"An error occurred: {e}")
+from shared.logger import send_log
+from libraries.openai_clients import OpenAIClientRegistry, default_registry
+from libraries.rate_limiter import RateLimiter, RateLimitTimeout, estimate_tokens
 
 
 # Define the wrapper class for OpenAI SDK
@@ -29,25 +22,38 @@ class OpenAIWrapper:
 
     Attributes:
     - client (AsyncOpenAI): An instance of the AsyncOpenAI client for API interactions.
+    - limiter (RateLimiter): Paces the requests per model and API URL, if given.
     """
 
-    def __init__(self, api_key: str, base_url: str = None):
-        http_client = httpx.AsyncClient()
-        if base_url:
-            http_client.base_url = base_url
-        self.client = AsyncOpenAI(
-            api_key=api_key,
-            max_retries=2,
-            timeout=httpx.Timeout(10.0, read=5.0, write=10.0, connect=2.0),
-            http_client=http_client,
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = None,
+        clients: Optional[OpenAIClientRegistry] = None,
+        limiter: Optional[RateLimiter] = None,
+    ):
+        self.limiter = limiter
+        self.base_url = base_url
+        self.client = (
+            (clients or default_registry)
+            .get(api_key, base_url)
+            .with_options(
+                max_retries=2,
+                timeout=httpx.Timeout(10.0, read=5.0, write=10.0, connect=2.0),
+            )
         )
 
     async def get_completion(self, prompt: str, model: str = "gpt-3.5-turbo"):
+        limiter = self.limiter.for_model(model, self.base_url) if self.limiter else None
+        slot = limiter.slot(estimate_tokens(prompt)) if limiter else nullcontext()
         try:
-            response = await self.client.chat.completions.with_raw_response.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-            )
+            async with slot:
+                response = await self.client.chat.completions.with_raw_response.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                )
+                if limiter:
+                    limiter.update(response.headers)
             # Log all headers
             for header, value in response.headers.items():
                 logging.debug(f"{header}: {value}")
@@ -56,19 +62,27 @@ class OpenAIWrapper:
             return completion
 
         except APIConnectionError as e:
-            send_log(f"APIConnectionError: {str(e)}")
+            send_log(f"APIConnectionError: {str(e)}", level="ERROR")
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail="The server could not be reached",
             ) from e
+        except RateLimitTimeout as e:
+            send_log(f"RateLimitTimeout: {str(e)}", level="WARNING")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests are queued for this model.",
+            ) from e
         except RateLimitError as e:
-            send_log(f"RateLimitError: {str(e)}")
+            send_log(f"RateLimitError: {str(e)}", level="WARNING")
+            if limiter:
+                limiter.backoff(e.response.headers)
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                 detail="A 429 status code was received; we should back off a bit.",
             ) from e
         except APIStatusError as e:
-            send_log(f"APIStatusError: {str(e)}")
+            send_log(f"APIStatusError: {str(e)}", level="ERROR")
             raise HTTPException(
                 status_code=e.status_code,
                 detail=f"Non-200-range status code received: {e.status_code}",
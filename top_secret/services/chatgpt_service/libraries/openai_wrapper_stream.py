@@ -1,28 +1,90 @@
 import os
 
-from openai import AsyncOpenAI
-from typing import List, Dict, Union, AsyncGenerator
+from contextlib import nullcontext
+from typing import Any, List, Dict, Optional, Union, AsyncGenerator
 from dotenv import load_dotenv
+from fastapi import HTTPException, status
+from openai import RateLimitError
+from shared.logger import send_log
+from libraries.openai_clients import OpenAIClientRegistry, default_registry
+from libraries.rate_limiter import RateLimiter, RateLimitTimeout, estimate_tokens
 
 load_dotenv()
 
 
 class OpenAIWrapperStream:
-    def __init__(self, api_key: str = None):
+    def __init__(
+        self,
+        api_key: str = None,
+        base_url: str = None,
+        clients: Optional[OpenAIClientRegistry] = None,
+        limiter: Optional[RateLimiter] = None,
+    ):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
-        self.client = AsyncOpenAI(api_key=self.api_key)
+        self.base_url = base_url
+        self.limiter = limiter
+        self.client = (clients or default_registry).get(self.api_key, base_url)
+
+    async def create_chat_completion_deltas(
+        self, messages: List[Dict[str, Union[str, int]]], model: str = "gpt-3.5-turbo"
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Streams a chat completion as it is generated.
+
+        Yields {"type": "delta", "content": ...} with the text of each chunk,
+        then one {"type": "done", "finish_reason": ..., "usage": ...} event.
+        The usage is None when the API does not report it.
+
+        With a limiter, the stream holds a slot of the model until it ends,
+        and its rate-limit headers resynchronize the budget.
+
+        Raises:
+            HTTPException: If no slot freed up in time (429).
+        """
+        limiter = self.limiter.for_model(model, self.base_url) if self.limiter else None
+        tokens = sum(estimate_tokens(str(m.get("content") or "")) for m in messages)
+        slot = limiter.slot(tokens) if limiter else nullcontext()
+        try:
+            async with slot:
+                try:
+                    stream = await self.client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        stream=True,
+                        extra_body={"stream_options": {"include_usage": True}},
+                    )
+                except RateLimitError as e:
+                    if limiter:
+                        limiter.backoff(e.response.headers)
+                    raise
+                response = getattr(stream, "response", None)
+                if limiter and response is not None:
+                    limiter.update(response.headers)
+                finish_reason = None
+                usage = None
+                async for chunk in stream:
+                    # The usage arrives in a last chunk without choices.
+                    if getattr(chunk, "usage", None):
+                        usage = dict(chunk.usage)
+                    if not chunk.choices:
+                        continue
+                    choice = chunk.choices[0]
+                    finish_reason = choice.finish_reason or finish_reason
+                    if choice.delta.content:
+                        yield {"type": "delta", "content": choice.delta.content}
+                yield {"type": "done", "finish_reason": finish_reason, "usage": usage}
+        except RateLimitTimeout as e:
+            send_log(f"RateLimitTimeout: {str(e)}", level="WARNING")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests are queued for this model.",
+            ) from e
 
     async def create_chat_completion_stream(
         self, messages: List[Dict[str, Union[str, int]]], model: str = "gpt-3.5-turbo"
     ) -> AsyncGenerator[str, None]:
-        stream = await self.client.chat.completions.create(
-            model=model,
-            messages=messages,
-            stream=True,
-        )
         all_content = ""
-        async for chunk in stream:
-            content = chunk.choices[0].delta.content
-            if content:
-                all_content += content
+        async for event in self.create_chat_completion_deltas(messages, model):
+            if event["type"] == "delta":
+                all_content += event["content"]
                 yield all_content
@@ -0,0 +1,296 @@
+import asyncio
+import random
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Mapping, Optional, Tuple
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """
+    Parses a reset duration of the rate-limit headers, e.g. "1s", "6m0s" or
+    "20ms".
+
+    Args:
+        value (Optional[str]): The header value.
+
+    Returns:
+        Optional[float]: The duration in seconds, or None if it is missing or
+        malformed.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts or "".join(n + u for n, u in parts) != value.strip():
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def _int_header(headers: Mapping[str, str], name: str) -> Optional[int]:
+    """
+    Reads an integer header, ignoring malformed values.
+    """
+    try:
+        return int(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimates the number of tokens of a prompt (about four characters
+    per token).
+    """
+    return len(text) // 4 + 1
+
+
+class RateLimitTimeout(Exception):
+    """
+    Raised when a request waited longer than allowed for a slot.
+    """
+
+
+class ModelLimiter:
+    """
+    Paces the requests of one model to the limits reported by the provider.
+
+    A request takes a slot before it is sent. It waits while the maximum
+    number of requests is in flight, while the remaining requests or tokens
+    of the current window (from the `x-ratelimit-remaining-*` headers) are
+    used up until the window resets, and while backing off after a 429.
+    Slots are reserved against the remaining budget when taken, so
+    concurrent requests do not all spend the same stale budget; every
+    response resynchronizes it.
+
+    Attributes:
+        max_concurrency (int): Maximum number of requests in flight.
+        max_wait (float): Seconds a request may wait for a slot.
+        base_backoff (float): First backoff after a 429, doubled each time.
+        max_backoff (float): Longest backoff.
+        in_flight (int): Requests in flight.
+        queued (int): Requests waiting for a slot.
+        remaining_requests (Optional[int]): Requests left in the window.
+        remaining_tokens (Optional[int]): Tokens left in the window.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        max_wait: float = 30.0,
+        base_backoff: float = 0.5,
+        max_backoff: float = 30.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_wait = max_wait
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.in_flight = 0
+        self.queued = 0
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        self.requests = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self.max_queued = 0
+        self.throttled = 0
+        self.timeouts = 0
+        self._requests_reset_at = 0.0
+        self._tokens_reset_at = 0.0
+        self._backoff_until = 0.0
+        self._failures = 0
+        self._changed = asyncio.Event()
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0) -> AsyncIterator[None]:
+        """
+        Waits for a slot and holds it while the request runs.
+
+        Args:
+            tokens (int): Estimated tokens of the request.
+
+        Raises:
+            RateLimitTimeout: If no slot freed up within `max_wait`.
+        """
+        await self.acquire(tokens)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, tokens: int = 0):
+        """
+        Waits until a request of `tokens` tokens may be sent and takes a slot.
+
+        Raises:
+            RateLimitTimeout: If no slot freed up within `max_wait`.
+        """
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        delay = self._delay(tokens, started)
+        if delay != 0:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+            try:
+                while delay != 0:
+                    now = time.monotonic()
+                    if now >= deadline:
+                        self.timeouts += 1
+                        raise RateLimitTimeout(
+                            f"No request slot within {self.max_wait:g}s"
+                        )
+                    timeout = deadline - now
+                    if delay is not None:
+                        timeout = min(delay, timeout)
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    delay = self._delay(tokens, time.monotonic())
+            finally:
+                self.queued -= 1
+            self.waited += 1
+            self.wait_seconds += time.monotonic() - started
+        self.in_flight += 1
+        self.requests += 1
+        if self.remaining_requests is not None:
+            self.remaining_requests -= 1
+        if self.remaining_tokens is not None:
+            self.remaining_tokens -= tokens
+
+    def release(self):
+        """
+        Frees a slot.
+        """
+        self.in_flight -= 1
+        self._notify()
+
+    def update(self, headers: Mapping[str, str]):
+        """
+        Resynchronizes the budget with the rate-limit headers of a response.
+
+        Args:
+            headers (Mapping[str, str]): The response headers.
+        """
+        now = time.monotonic()
+        remaining = _int_header(headers, "x-ratelimit-remaining-requests")
+        if remaining is not None:
+            self.remaining_requests = remaining
+            reset = parse_reset(headers.get("x-ratelimit-reset-requests"))
+            self._requests_reset_at = now + (reset or 0.0)
+        remaining = _int_header(headers, "x-ratelimit-remaining-tokens")
+        if remaining is not None:
+            self.remaining_tokens = remaining
+            reset = parse_reset(headers.get("x-ratelimit-reset-tokens"))
+            self._tokens_reset_at = now + (reset or 0.0)
+        self._failures = 0
+        self._notify()
+
+    def backoff(self, headers: Optional[Mapping[str, str]] = None):
+        """
+        Holds the requests back after a 429, for the Retry-After delay if the
+        provider sent one, else for a jittered exponential backoff.
+
+        Args:
+            headers (Optional[Mapping[str, str]]): The 429 response headers.
+        """
+        self.throttled += 1
+        self._failures += 1
+        delay = parse_reset((headers or {}).get("retry-after"))
+        if delay is None:
+            ceiling = min(self.max_backoff, self.base_backoff * 2**self._failures)
+            delay = random.uniform(ceiling / 2, ceiling)
+        self._backoff_until = max(self._backoff_until, time.monotonic() + delay)
+        self._notify()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the counters of the limiter.
+
+        Returns:
+            Dict[str, Any]: Queue depth, wait times and budget.
+        """
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "requests": self.requests,
+            "waited": self.waited,
+            "wait_seconds": round(self.wait_seconds, 3),
+            "mean_wait_seconds": (
+                round(self.wait_seconds / self.waited, 3) if self.waited else 0.0
+            ),
+            "throttled": self.throttled,
+            "timeouts": self.timeouts,
+            "remaining_requests": self.remaining_requests,
+            "remaining_tokens": self.remaining_tokens,
+        }
+
+    def _delay(self, tokens: int, now: float) -> Optional[float]:
+        """
+        Returns how long a request must wait: 0 if it may go now, the seconds
+        until the blocking window resets, or None until a slot frees up.
+        """
+        if now < self._backoff_until:
+            return self._backoff_until - now
+        if self.in_flight >= self.max_concurrency:
+            return None
+        if self.remaining_requests is not None and self.remaining_requests <= 0:
+            if now < self._requests_reset_at:
+                return self._requests_reset_at - now
+            self.remaining_requests = None
+        if self.remaining_tokens is not None and self.remaining_tokens < tokens:
+            if now < self._tokens_reset_at:
+                return self._tokens_reset_at - now
+            self.remaining_tokens = None
+        return 0
+
+    def _notify(self):
+        """
+        Wakes the waiting requests up to check again.
+        """
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+
+class RateLimiter:
+    """
+    The limiters of every model and API URL, created on first use. Each
+    backend (OpenAI's or a `custom_url`) has its own budget.
+
+    Attributes:
+        max_concurrency (int): Maximum number of requests in flight per model.
+        max_wait (float): Seconds a request may wait for a slot.
+    """
+
+    def __init__(self, max_concurrency: int = 16, max_wait: float = 30.0):
+        self.max_concurrency = max_concurrency
+        self.max_wait = max_wait
+        self._models: Dict[Tuple[Optional[str], str], ModelLimiter] = {}
+
+    def for_model(self, model: str, base_url: Optional[str] = None) -> ModelLimiter:
+        """
+        Returns the limiter of a model at an API URL (None for OpenAI's).
+        """
+        limiter = self._models.get((base_url, model))
+        if limiter is None:
+            limiter = self._models[(base_url, model)] = ModelLimiter(
+                self.max_concurrency, self.max_wait
+            )
+        return limiter
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the counters of each limiter, by model, suffixed with
+        "@<url>" for other APIs than OpenAI's.
+        """
+        return {
+            model if base_url is None else f"{model}@{base_url}": limiter.stats()
+            for (base_url, model), limiter in self._models.items()
+        }
@@ -0,0 +1,173 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from libraries.rate_limiter import estimate_tokens
+
+# Tokens each message costs on top of its content (role and separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def message_tokens(message: dict) -> int:
+    """
+    Roughly estimates the tokens a chat message takes in a request.
+
+    Args:
+        message (dict): The message.
+
+    Returns:
+        int: The estimate.
+    """
+    return estimate_tokens(str(message.get("content") or "")) + (
+        MESSAGE_OVERHEAD_TOKENS
+    )
+
+
+def trim_messages(messages: List[dict], budget: int) -> Tuple[List[dict], int]:
+    """
+    Drops the oldest turns of a conversation until it fits a token budget.
+
+    System messages are always kept, as is the newest message even if it
+    alone exceeds the budget.
+
+    Args:
+        messages (List[dict]): The conversation, oldest first.
+        budget (int): Maximum estimated tokens of the conversation.
+
+    Returns:
+        Tuple[List[dict], int]: The kept messages, in order, and the number
+        of messages dropped.
+    """
+    system = [m for m in messages if m.get("role") == "system"]
+    used = sum(message_tokens(m) for m in system)
+    kept = set()
+    for position in range(len(messages) - 1, -1, -1):
+        message = messages[position]
+        if message.get("role") == "system":
+            continue
+        tokens = message_tokens(message)
+        if kept and used + tokens > budget:
+            break
+        kept.add(position)
+        used += tokens
+    trimmed = [
+        m for i, m in enumerate(messages) if i in kept or m.get("role") == "system"
+    ]
+    return trimmed, len(messages) - len(trimmed)
+
+
+class Session:
+    """
+    A conversation kept by the server.
+
+    Attributes:
+        session_id (str): The session id.
+        messages (List[dict]): The conversation, oldest first.
+        trimmed (int): Number of messages dropped to fit the token budget.
+        last_used (float): Time of the last use (monotonic seconds).
+        lock (asyncio.Lock): Serializes the turns of the session.
+    """
+
+    def __init__(self, session_id: str, messages: Optional[List[dict]] = None):
+        self.session_id = session_id
+        self.messages: List[dict] = list(messages or [])
+        self.trimmed = 0
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def add_message(self, role: str, content: str):
+        """
+        Appends a message to the conversation.
+        """
+        self.messages.append({"role": role, "content": content})
+
+    def trim(self, budget: int):
+        """
+        Drops the oldest turns until the conversation fits the token budget.
+
+        Args:
+            budget (int): Maximum estimated tokens of the conversation.
+        """
+        self.messages, dropped = trim_messages(self.messages, budget)
+        self.trimmed += dropped
+
+    @property
+    def tokens(self) -> int:
+        """
+        Returns the estimated tokens of the conversation.
+        """
+        return sum(message_tokens(m) for m in self.messages)
+
+
+class SessionStore:
+    """
+    Keeps conversations by session id, in memory.
+
+    The store is bounded: beyond `max_sessions`, the least recently used
+    session is evicted, and sessions idle for more than `ttl` seconds are
+    forgotten.
+
+    Attributes:
+        max_sessions (int): Maximum number of sessions.
+        ttl (float): Idle seconds after which a session expires; 0 disables.
+        evicted (int): Number of sessions evicted or expired.
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl: float = 3600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.evicted = 0
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self, messages: Optional[List[dict]] = None) -> Session:
+        """
+        Starts a session.
+
+        Args:
+            messages (Optional[List[dict]]): Initial messages, e.g. a system
+                prompt.
+
+        Returns:
+            Session: The new session.
+        """
+        session = Session(uuid.uuid4().hex, messages)
+        self._sessions[session.session_id] = session
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """
+        Returns a session and marks it as used.
+
+        Args:
+            session_id (str): The session id.
+
+        Returns:
+            Optional[Session]: The session, or None if unknown or expired.
+        """
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        now = time.monotonic()
+        if self.ttl and now - session.last_used > self.ttl:
+            del self._sessions[session_id]
+            self.evicted += 1
+            return None
+        session.last_used = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        """
+        Ends a session.
+
+        Returns:
+            bool: Whether the session existed.
+        """
+        return self._sessions.pop(session_id, None) is not None
@@ -0,0 +1,294 @@
+import hashlib
+import random
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+
+# Words that rarely change what a short prompt asks for.
+STOPWORDS = frozenset(
+    "a an and are be can could do for from i in is it me my of on or our "
+    "please the this that these those to us we what would you your".split()
+)
+
+_WORD = re.compile(r"[a-z0-9_./~-]+")
+_PRIME = (1 << 61) - 1
+
+
+def prompt_features(prompt: str) -> FrozenSet[str]:
+    """
+    Returns the features of a prompt compared by the similarity cache.
+
+    The prompt is lowercased and split into words; stopwords are dropped and
+    a trailing plural "s" is stripped, so "show me the files in the folder"
+    and "show me files in this folder" get the same features. The features
+    are the remaining words and their adjacent pairs.
+
+    Args:
+        prompt (str): The prompt.
+
+    Returns:
+        FrozenSet[str]: The features.
+    """
+    words = []
+    for word in _WORD.findall(prompt.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    pairs = (f"{a} {b}" for a, b in zip(words, words[1:]))
+    return frozenset(words).union(pairs)
+
+
+def content_words(features: FrozenSet[str]) -> FrozenSet[str]:
+    """
+    Returns the words among the features of a prompt, without the pairs.
+    """
+    return frozenset(feature for feature in features if " " not in feature)
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """
+    Returns the Jaccard similarity of two feature sets.
+    """
+    if not a and not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """
+    Computes MinHash signatures: for each of `num_perm` random hash
+    functions, the smallest hash of the features. Two signatures agree in a
+    fraction of positions that estimates the Jaccard similarity of the sets.
+
+    Attributes:
+        num_perm (int): Length of the signatures.
+    """
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        self.num_perm = num_perm
+        rng = random.Random(seed)
+        # (a * x + b) mod p, a universal family of hash functions
+        self._params = [
+            (rng.randrange(1, _PRIME), rng.randrange(_PRIME)) for _ in range(num_perm)
+        ]
+
+    def signature(self, features: FrozenSet[str]) -> Tuple[int, ...]:
+        """
+        Returns the signature of a feature set.
+        """
+        hashes = [
+            int.from_bytes(
+                hashlib.blake2b(f.encode(), digest_size=8).digest(), "little"
+            )
+            for f in features
+        ]
+        return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in self._params)
+
+
+class SimilarMatch(NamedTuple):
+    """
+    A cached completion of a similar prompt.
+    """
+
+    value: Any
+    similarity: float
+    prompt: str
+
+
+class _Entry:
+    """
+    A cached completion and the data used to find it.
+    """
+
+    __slots__ = (
+        "namespace",
+        "prompt",
+        "features",
+        "words",
+        "bands",
+        "value",
+        "expires_at",
+    )
+
+    def __init__(self, namespace, prompt, features, bands, value, expires_at):
+        self.namespace = namespace
+        self.prompt = prompt
+        self.features = features
+        self.words = content_words(features)
+        self.bands = bands
+        self.value = value
+        self.expires_at = expires_at
+
+
+class SimilarityCache:
+    """
+    Caches completions so that near-duplicate prompts share them.
+
+    Prompts are indexed with MinHash and locality-sensitive hashing: each
+    signature is cut into `bands` bands, and prompts sharing any band are
+    candidates. Candidates are then compared exactly (Jaccard similarity of
+    their features), and the most similar one at or above `threshold` is
+    returned. Lookups cost a few dictionary accesses, whatever the number of
+    entries.
+
+    A match must also have the same words, once stopwords and plurals are
+    dropped: only the filler and the word order of the prompts may differ.
+    Otherwise a long shared template (e.g. instructions around a short
+    command) would make prompts asking for different things look alike.
+
+    Entries live in namespaces (e.g. one per model), expire after `ttl`
+    seconds and are evicted least recently used first beyond `max_entries`.
+
+    Attributes:
+        threshold (float): Minimum similarity of a match, between 0 and 1.
+        max_entries (int): Maximum number of entries.
+        ttl (float): Seconds after which an entry expires.
+        hits (int): Lookups answered.
+        misses (int): Lookups that found no similar prompt.
+        stores (int): Entries stored.
+        evictions (int): Entries evicted or expired.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        max_entries: int = 10_000,
+        ttl: float = 3600,
+        num_perm: int = 64,
+        bands: int = 16,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._hasher = MinHasher(num_perm)
+        self._rows = num_perm // bands
+        self._entries: "OrderedDict[Tuple[str, FrozenSet[str]], _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, int, Tuple[int, ...]], Set] = {}
+        self._similarity_total = 0.0
+
+    def get(self, namespace: str, prompt: str) -> Optional[SimilarMatch]:
+        """
+        Looks the completion of a similar prompt up.
+
+        Args:
+            namespace (str): The namespace, e.g. the model.
+            prompt (str): The prompt.
+
+        Returns:
+            Optional[SimilarMatch]: The best match, or None.
+        """
+        features = prompt_features(prompt)
+        if not features:
+            # Prompts made only of stopwords would all match each other.
+            self.misses += 1
+            return None
+        words = content_words(features)
+        now = time.time()
+        best: Optional[_Entry] = None
+        best_similarity = 0.0
+        for key in self._candidates(namespace, features):
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            if entry.expires_at <= now:
+                self._remove(key)
+                self.evictions += 1
+                continue
+            if entry.words != words:
+                continue
+            similarity = jaccard(features, entry.features)
+            if similarity >= self.threshold and similarity > best_similarity:
+                best, best_similarity = entry, similarity
+        if best is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end((namespace, best.features))
+        self.hits += 1
+        self._similarity_total += best_similarity
+        return SimilarMatch(best.value, best_similarity, best.prompt)
+
+    def put(self, namespace: str, prompt: str, value: Any):
+        """
+        Stores the completion of a prompt.
+
+        Args:
+            namespace (str): The namespace, e.g. the model.
+            prompt (str): The prompt.
+            value (Any): The completion.
+        """
+        features = prompt_features(prompt)
+        if not features:
+            return
+        key = (namespace, features)
+        if key in self._entries:
+            self._remove(key)
+        signature = self._hasher.signature(features)
+        bands = [
+            (namespace, band, signature[band * self._rows : (band + 1) * self._rows])
+            for band in range(len(signature) // self._rows)
+        ]
+        self._entries[key] = _Entry(
+            namespace, prompt, features, bands, value, time.time() + self.ttl
+        )
+        for band in bands:
+            self._buckets.setdefault(band, set()).add(key)
+        self.stores += 1
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the counters of the cache.
+
+        Returns:
+            Dict[str, Any]: Counters, size, hit ratio and mean match similarity.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "mean_similarity": (
+                self._similarity_total / self.hits if self.hits else 0.0
+            ),
+            "entries": len(self._entries),
+            "threshold": self.threshold,
+        }
+
+    def _candidates(self, namespace: str, features: FrozenSet[str]) -> List:
+        """
+        Returns the keys of the entries sharing a band with the features.
+        """
+        exact = (namespace, features)
+        if exact in self._entries:
+            return [exact]
+        signature = self._hasher.signature(features)
+        candidates = set()
+        for band in range(len(signature) // self._rows):
+            rows = signature[band * self._rows : (band + 1) * self._rows]
+            candidates |= self._buckets.get((namespace, band, rows), set())
+        return list(candidates)
+
+    def _remove(self, key):
+        """
+        Removes an entry and its band postings.
+        """
+        entry = self._entries.pop(key)
+        for band in entry.bands:
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
@@ -0,0 +1,202 @@
+import asyncio
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    TypeVar,
+)
+
+T = TypeVar("T")
+
+
+class _Call(Generic[T]):
+    """
+    An upstream call shared by the requests waiting on it.
+    """
+
+    def __init__(self, task: "asyncio.Task[T]"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls into one.
+
+    The first caller of a key starts the call; callers arriving while it is in
+    flight wait for the same result (or exception) instead of starting their
+    own. The call runs in its own task, so a caller going away does not cancel
+    it for the others; it is cancelled only when nobody waits any more.
+
+    Attributes:
+        calls (int): Number of calls started.
+        coalesced (int): Number of callers that joined a call in flight.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._calls: Dict[str, _Call] = {}
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        Runs a call, or joins the identical call in flight.
+
+        Args:
+            key (str): Identifies identical calls, e.g. a `cache_key`.
+            factory (Callable[[], Awaitable[T]]): Starts the call.
+
+        Returns:
+            T: The result of the call.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    def _forget(self, key: str, call: _Call):
+        """
+        Removes a finished call, so later callers start a new one.
+        """
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+
+class SharedStream:
+    """
+    Chunks of one upstream stream, buffered for every follower.
+
+    Attributes:
+        chunks (List[Any]): The chunks received so far.
+        done (bool): Whether the upstream stream has ended.
+        error (Optional[BaseException]): The exception that ended it, if any.
+        followers (int): Number of followers.
+    """
+
+    def __init__(self):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._update = asyncio.Event()
+
+    async def pump(self, source: AsyncIterator[Any]):
+        """
+        Reads the upstream stream into the buffer.
+
+        Args:
+            source (AsyncIterator[Any]): The upstream stream.
+        """
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = ConnectionAbortedError("The upstream stream was cancelled")
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    async def follow(self) -> AsyncIterator[Any]:
+        """
+        Yields the chunks received so far, then the live ones.
+
+        Raises:
+            Exception: The exception that ended the upstream stream.
+        """
+        position = 0
+        while True:
+            update = self._update
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await update.wait()
+
+    def _notify(self):
+        """
+        Wakes the followers up.
+        """
+        update, self._update = self._update, asyncio.Event()
+        update.set()
+
+
+class StreamFlight:
+    """
+    Coalesces concurrent identical streams into one upstream stream.
+
+    The first subscriber of a key starts the upstream stream; subscribers
+    arriving while it runs first replay the chunks received so far, then
+    follow the live stream. The upstream stream is cancelled only when every
+    subscriber has left.
+
+    Attributes:
+        streams (int): Number of upstream streams started.
+        coalesced (int): Number of subscribers that joined a running stream.
+    """
+
+    def __init__(self):
+        self.streams = 0
+        self.coalesced = 0
+        self._streams: Dict[str, SharedStream] = {}
+
+    async def subscribe(
+        self, key: str, factory: Callable[[], AsyncIterator[Any]]
+    ) -> AsyncIterator[Any]:
+        """
+        Yields the chunks of a stream, starting it or joining it.
+
+        Args:
+            key (str): Identifies identical streams, e.g. a `cache_key`.
+            factory (Callable[[], AsyncIterator[Any]]): Starts the stream.
+
+        Yields:
+            Any: Every chunk of the stream, from the first one.
+        """
+        stream = self._streams.get(key)
+        if stream is None:
+            stream = SharedStream()
+            stream.task = asyncio.ensure_future(stream.pump(factory()))
+            stream.task.add_done_callback(lambda _: self._forget(key, stream))
+            self._streams[key] = stream
+            self.streams += 1
+        else:
+            self.coalesced += 1
+        stream.followers += 1
+        try:
+            async for chunk in stream.follow():
+                yield chunk
+        finally:
+            stream.followers -= 1
+            if stream.followers == 0 and not stream.task.done():
+                stream.task.cancel()
+
+    def _forget(self, key: str, stream: SharedStream):
+        """
+        Removes a finished stream, so later subscribers start a new one.
+        """
+        if self._streams.get(key) is stream:
+            del self._streams[key]
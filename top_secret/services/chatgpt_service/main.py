@@ -1,7 +1,34 @@
+import asyncio
 import os
-from typing import List
+from contextlib import aclosing, asynccontextmanager
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+)
+from fastapi import (
+    FastAPI,
+    HTTPException,
+    Request,
+    Response,
+    status,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.responses import StreamingResponse
 import httpx
-from fastapi import FastAPI, HTTPException, Request, status, WebSocket
+from openai import APIStatusError
+from libraries.completion_cache import CompletionCache, cache_key, cache_mode
+from libraries.openai_clients import OpenAIClientRegistry
+from libraries.rate_limiter import RateLimiter
+from libraries.sessions import SessionStore
+from libraries.similarity_cache import SimilarityCache
+from libraries.single_flight import SingleFlight, StreamFlight
 from libraries.openai_wrapper_simple import (
     OpenAIWrapper,
 )
@@ -15,58 +42,186 @@ from libraries.openai_wrapper_function import (
     OpenAIWrapperFunction,
 )
 
-from pydantic import BaseModel
+from shared.deadline import DeadlineMiddleware
+from shared.logger import log_client, send_log
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 import json
 
 load_dotenv()
 
 
-def send_log(message: str):
+def env_flag(name: str, default: str) -> bool:
+    """
+    Reads a boolean setting from the environment.
     """
-    Sends a log message to a predefined logging service.
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
 
-    Args:
-        message (str): The message to be logged.
 
-    Returns:
-        The response from the logging service as JSON, or None if an error occurs.
-    """
-    url = "http://localhost:8000/log"
-    data = {"message": message}
-    try:
-        with httpx.Client() as client:
-            response = client.post(url, json=data)
-            return response.json()
-    except httpx.RequestError as e:
-        print(f"An error occurred: {e}")
+# Connection pool shared by every OpenAI client of the service
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20")
+)
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+OPENAI_HTTP2 = env_flag("OPENAI_HTTP2", "true")
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+
+# Per-model pacing of /completion requests; the budget follows the
+# x-ratelimit-* headers of the provider
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+OPENAI_MAX_QUEUE_WAIT = float(os.getenv("OPENAI_MAX_QUEUE_WAIT", "30"))
+
+# Opt-in cache of /completion responses; an empty path keeps it in memory only
+COMPLETION_CACHE_ENABLED = env_flag("COMPLETION_CACHE_ENABLED", "false")
+COMPLETION_CACHE_MAX_ENTRIES = int(os.getenv("COMPLETION_CACHE_MAX_ENTRIES", "1024"))
+COMPLETION_CACHE_TTL = float(os.getenv("COMPLETION_CACHE_TTL", "3600"))
+COMPLETION_CACHE_PATH = os.getenv("COMPLETION_CACHE_PATH", "./data/completions.db")
+
+# Opt-in cache answering near-duplicate prompts (similarity between 0 and 1)
+SIMILARITY_CACHE_ENABLED = env_flag("SIMILARITY_CACHE_ENABLED", "false")
+SIMILARITY_CACHE_THRESHOLD = float(os.getenv("SIMILARITY_CACHE_THRESHOLD", "0.8"))
+SIMILARITY_CACHE_MAX_ENTRIES = int(os.getenv("SIMILARITY_CACHE_MAX_ENTRIES", "10000"))
+SIMILARITY_CACHE_TTL = float(os.getenv("SIMILARITY_CACHE_TTL", "3600"))
+
+# Server-side conversations of /sessions
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "3000"))
+
+# Limits of /completion/batch
+COMPLETION_BATCH_CONCURRENCY = int(os.getenv("COMPLETION_BATCH_CONCURRENCY", "8"))
+COMPLETION_BATCH_MAX_PROMPTS = int(os.getenv("COMPLETION_BATCH_MAX_PROMPTS", "1000"))
 
 
 class CompletionRequest(BaseModel):
     """
     Pydantic model for handling completion requests.
+
+    `cache` controls the completion cache for this request: "use" (default),
+    "bypass" (neither read nor store) or "refresh" (skip the lookup but store
+    the new response). Cache-Control: no-store / no-cache mean the same.
+    `similar` set to false keeps the request out of the similarity cache,
+    e.g. for templated prompts that differ only in a few words.
+
+    `streaming` asks for the completion as Server-Sent Events.
     """
 
     prompt: str
     model: str = "gpt-3.5-turbo"
     custom_url: str = None
+    cache: Optional[Literal["use", "bypass", "refresh"]] = None
+    similar: bool = True
+    streaming: bool = False
 
 
-app = FastAPI()
-send_log("ChatGPT service starting up")
+class BatchCompletionRequest(BaseModel):
+    """
+    Pydantic model for handling batch completion requests.
+
+    `concurrency` lowers the number of prompts completed at once; it cannot
+    exceed COMPLETION_BATCH_CONCURRENCY. `cache` and `similar` apply to
+    every prompt.
+    """
+
+    prompts: List[str] = Field(
+        ..., min_length=1, max_length=COMPLETION_BATCH_MAX_PROMPTS
+    )
+    model: str = "gpt-3.5-turbo"
+    custom_url: str = None
+    cache: Optional[Literal["use", "bypass", "refresh"]] = None
+    similar: bool = True
+    concurrency: Optional[int] = Field(None, ge=1)
+
+
+log_client.service = log_client.service or "chatgpt_service"
+openai_clients = OpenAIClientRegistry(
+    max_connections=OPENAI_MAX_CONNECTIONS,
+    max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+    http2=OPENAI_HTTP2,
+    timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+)
+rate_limiter = RateLimiter(
+    max_concurrency=OPENAI_MAX_CONCURRENCY, max_wait=OPENAI_MAX_QUEUE_WAIT
+)
+sessions = SessionStore(max_sessions=SESSION_MAX_SESSIONS, ttl=SESSION_TTL)
+completion_flights = SingleFlight()
+stream_flights = StreamFlight()
+completion_cache = (
+    CompletionCache(
+        max_entries=COMPLETION_CACHE_MAX_ENTRIES,
+        ttl=COMPLETION_CACHE_TTL,
+        path=COMPLETION_CACHE_PATH or None,
+    )
+    if COMPLETION_CACHE_ENABLED
+    else None
+)
+similarity_cache = (
+    SimilarityCache(
+        threshold=SIMILARITY_CACHE_THRESHOLD,
+        max_entries=SIMILARITY_CACHE_MAX_ENTRIES,
+        ttl=SIMILARITY_CACHE_TTL,
+    )
+    if SIMILARITY_CACHE_ENABLED
+    else None
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Starts the shared log client, the OpenAI connection pool and the completion
+    cache, and closes them on shutdown.
+    """
+    await log_client.start()
+    openai_clients.start()
+    if completion_cache is not None:
+        if completion_cache.path:
+            os.makedirs(
+                os.path.dirname(os.path.abspath(completion_cache.path)), exist_ok=True
+            )
+        await asyncio.to_thread(completion_cache.open)
+    send_log("ChatGPT service starting up")
+    yield
+    if completion_cache is not None:
+        await asyncio.to_thread(completion_cache.close)
+    await openai_clients.aclose()
+    await log_client.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+# Requests whose caller gave up (see X-Request-Timeout-Ms) are abandoned.
+app.add_middleware(DeadlineMiddleware)
 
 
 @app.post("/completion")
-async def generic_chatgpt_endpoint(request_data: CompletionRequest, request: Request):
+async def generic_chatgpt_endpoint(
+    request_data: CompletionRequest, request: Request, response: Response
+):
     """
     Endpoint for processing generic ChatGPT completion requests.
 
+    When the completion cache is enabled, the X-Cache response header tells
+    whether the completion was served from it (HIT), fetched and stored (MISS
+    or REFRESH) or fetched without it (BYPASS). With the similarity cache, a
+    completion of a near-duplicate prompt is served as SIMILAR, with its
+    similarity in X-Cache-Similarity. Identical requests arriving while one
+    is in flight share its upstream call.
+
+    With `streaming`, the completion is sent as Server-Sent Events as the
+    tokens arrive: a `data: {"content": ...}` event per token, then an
+    `event: done` with the finish reason and usage (or an `event: error`).
+    The upstream request is cancelled when the client disconnects.
+
     Args:
         request_data (CompletionRequest): The completion request data.
         request (Request): The request object.
+        response (Response): The response, for the cache header.
 
     Returns:
-        A JSON response containing the completion result.
+        A JSON response containing the completion result, or the event stream.
 
     Raises:
         HTTPException: If the API key is missing or an unexpected error occurs.
@@ -75,18 +230,97 @@ async def generic_chatgpt_endpoint(request_data: CompletionRequest, request: Req
 
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
-        send_log("API key is missing")
+        send_log("API key is missing", level="ERROR")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="API key is missing"
         )
 
-    openai_wrapper = OpenAIWrapper(api_key=api_key, base_url=request_data.custom_url)
+    messages = [{"role": "user", "content": request_data.prompt}]
+    key = cache_key(request_data.model, messages, base_url=request_data.custom_url)
+    mode = cache_mode(request_data.cache, request.headers.get("cache-control"))
+    caching = completion_cache is not None or similarity_cache is not None
+    store = caching and mode != "bypass"
+    if caching:
+        if mode == "bypass":
+            if completion_cache is not None:
+                completion_cache.bypasses += 1
+            response.headers["X-Cache"] = "BYPASS"
+        else:
+            if mode == "use":
+                cached, headers = await find_cached_completion(
+                    key,
+                    request_data.prompt,
+                    request_data.model,
+                    request_data.custom_url,
+                    request_data.similar,
+                )
+                if cached is not None:
+                    response.headers.update(headers)
+                    if request_data.streaming:
+                        return completion_event_stream(
+                            single_completion_event(cached), response.headers
+                        )
+                    return {"completion": cached}
+            response.headers["X-Cache"] = "MISS" if mode == "use" else "REFRESH"
+
+    if request_data.streaming:
+        stream_wrapper = OpenAIWrapperStream(
+            api_key=api_key,
+            base_url=request_data.custom_url,
+            clients=openai_clients,
+            limiter=rate_limiter,
+        )
+        events = stream_flights.subscribe(
+            f"{api_key}:{key}",
+            lambda: stream_wrapper.create_chat_completion_deltas(
+                messages, request_data.model
+            ),
+        )
+        try:
+            # Fail with a proper status if the upstream rejects the request.
+            first = await anext(events)
+        except HTTPException:
+            await events.aclose()
+            raise
+        except APIStatusError as e:
+            await events.aclose()
+            raise HTTPException(
+                status_code=e.status_code,
+                detail=f"Non-200-range status code received: {e.status_code}",
+            ) from e
+        except Exception as e:
+            await events.aclose()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="An unexpected error occurred" + str(e),
+            ) from e
+
+        async def store_stream(content: str):
+            await store_completion(
+                key,
+                request_data.prompt,
+                request_data.model,
+                request_data.custom_url,
+                content,
+                request_data.similar,
+            )
+
+        return completion_event_stream(
+            stream_completion_events(first, events, store_stream if store else None),
+            response.headers,
+        )
 
     try:
-        completion = await openai_wrapper.get_completion(
-            request_data.prompt, request_data.model
+        content = await fetch_completion(
+            api_key,
+            request_data.prompt,
+            request_data.model,
+            request_data.custom_url,
+            key,
+            store,
+            request_data.similar,
         )
-        return {"completion": completion.choices[0].message.content}
+        return {"completion": content}
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -96,31 +330,396 @@ async def generic_chatgpt_endpoint(request_data: CompletionRequest, request: Req
         )
 
 
+@app.post("/completion/batch")
+async def batch_completion_endpoint(request_data: BatchCompletionRequest):
+    """
+    Endpoint for completing many prompts in one request.
+
+    The prompts are completed concurrently, at most `concurrency` at a time,
+    and each result is streamed back as an NDJSON line as soon as it is
+    ready, so lines arrive in completion order:
+    {"index": i, "completion": ...} on success, or
+    {"index": i, "status": ..., "error": ...} if that prompt failed. A failed
+    prompt does not fail the batch.
+
+    Args:
+        request_data (BatchCompletionRequest): The prompts and settings.
+
+    Returns:
+        StreamingResponse: The `application/x-ndjson` results.
+
+    Raises:
+        HTTPException: If the API key is missing.
+    """
+    send_log(f"Received batch of {len(request_data.prompts)} completion requests")
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        send_log("API key is missing", level="ERROR")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="API key is missing"
+        )
+
+    mode = cache_mode(request_data.cache)
+    caching = completion_cache is not None or similarity_cache is not None
+    store = caching and mode != "bypass"
+
+    async def complete(prompt: str) -> Optional[str]:
+        messages = [{"role": "user", "content": prompt}]
+        key = cache_key(request_data.model, messages, base_url=request_data.custom_url)
+        if caching and mode == "use":
+            cached, _ = await find_cached_completion(
+                key,
+                prompt,
+                request_data.model,
+                request_data.custom_url,
+                request_data.similar,
+            )
+            if cached is not None:
+                return cached
+        return await fetch_completion(
+            api_key,
+            prompt,
+            request_data.model,
+            request_data.custom_url,
+            key,
+            store,
+            request_data.similar,
+        )
+
+    concurrency = min(
+        request_data.concurrency or COMPLETION_BATCH_CONCURRENCY,
+        COMPLETION_BATCH_CONCURRENCY,
+    )
+    return StreamingResponse(
+        batch_completion_lines(request_data.prompts, complete, concurrency),
+        media_type="application/x-ndjson",
+    )
+
+
+async def batch_completion_lines(
+    prompts: List[str],
+    complete: Callable[[str], Awaitable[Optional[str]]],
+    concurrency: int,
+) -> AsyncIterator[str]:
+    """
+    Completes prompts with a bounded number of workers and yields an NDJSON
+    line per prompt as soon as it is done.
+
+    The workers are cancelled if the client goes away before the end.
+
+    Args:
+        prompts (List[str]): The prompts.
+        complete (Callable[[str], Awaitable[Optional[str]]]): Completes one
+            prompt.
+        concurrency (int): Number of prompts completed at once.
+    """
+    results: asyncio.Queue = asyncio.Queue()
+    pending = iter(enumerate(prompts))
+
+    async def worker():
+        for index, prompt in pending:
+            try:
+                line = {"index": index, "completion": await complete(prompt)}
+            except HTTPException as e:
+                line = {"index": index, "status": e.status_code, "error": e.detail}
+            except Exception as e:
+                line = {
+                    "index": index,
+                    "status": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    "error": "An unexpected error occurred" + str(e),
+                }
+            await results.put(line)
+
+    workers = [
+        asyncio.create_task(worker()) for _ in range(min(concurrency, len(prompts)))
+    ]
+    try:
+        for _ in prompts:
+            yield json.dumps(await results.get(), ensure_ascii=False) + "\n"
+    finally:
+        for task in workers:
+            task.cancel()
+
+
+async def fetch_completion(
+    api_key: str,
+    prompt: str,
+    model: str,
+    custom_url: Optional[str],
+    key: str,
+    store: bool,
+    similar: bool = True,
+) -> Optional[str]:
+    """
+    Fetches a completion from the upstream, joining the identical call in
+    flight if there is one.
+
+    Args:
+        api_key (str): The OpenAI API key.
+        prompt (str): The prompt.
+        model (str): The model.
+        custom_url (Optional[str]): The API URL, if not OpenAI's.
+        key (str): The cache key of the request.
+        store (bool): Whether to store the completion in the caches.
+        similar (bool): Whether to use the similarity cache.
+
+    Returns:
+        Optional[str]: The completion text.
+    """
+    openai_wrapper = OpenAIWrapper(
+        api_key=api_key,
+        base_url=custom_url,
+        clients=openai_clients,
+        limiter=rate_limiter,
+    )
+
+    async def fetch():
+        completion = await openai_wrapper.get_completion(prompt, model)
+        content = completion.choices[0].message.content
+        if store and content is not None:
+            await store_completion(key, prompt, model, custom_url, content, similar)
+        return content
+
+    # Callers only share calls made with their own API key.
+    return await completion_flights.run(f"{api_key}:{key}", fetch)
+
+
+def similarity_namespace(model: str, custom_url: Optional[str]) -> str:
+    """
+    Returns the similarity cache namespace of a model and API URL; prompts
+    only match prompts sent to the same model.
+    """
+    return f"{model}@{custom_url or ''}"
+
+
+async def find_cached_completion(
+    key: str,
+    prompt: str,
+    model: str,
+    custom_url: Optional[str],
+    similar: bool = True,
+) -> Tuple[Optional[str], Dict[str, str]]:
+    """
+    Looks a completion up in the completion cache, then in the similarity
+    cache.
+
+    Args:
+        key (str): The cache key of the request.
+        prompt (str): The prompt.
+        model (str): The model.
+        custom_url (Optional[str]): The API URL, if not OpenAI's.
+        similar (bool): Whether to look in the similarity cache too.
+
+    Returns:
+        Tuple[Optional[str], Dict[str, str]]: The cached completion, or None,
+        and the response headers describing where it came from.
+    """
+    if completion_cache is not None:
+        cached = await completion_cache.get(key)
+        if cached is not None:
+            return cached, {"X-Cache": "HIT"}
+    if similarity_cache is not None and similar:
+        match = similarity_cache.get(similarity_namespace(model, custom_url), prompt)
+        if match is not None:
+            return match.value, {
+                "X-Cache": "SIMILAR",
+                "X-Cache-Similarity": f"{match.similarity:.3f}",
+            }
+    return None, {}
+
+
+async def store_completion(
+    key: str,
+    prompt: str,
+    model: str,
+    custom_url: Optional[str],
+    content: str,
+    similar: bool = True,
+):
+    """
+    Stores a fetched completion in the enabled caches, leaving the similarity
+    cache out unless `similar`.
+    """
+    if completion_cache is not None:
+        await completion_cache.put(key, content)
+    if similarity_cache is not None and similar:
+        similarity_cache.put(similarity_namespace(model, custom_url), prompt, content)
+
+
+def completion_event_stream(events, headers) -> StreamingResponse:
+    """
+    Wraps completion events in a `text/event-stream` response.
+
+    Args:
+        events: The SSE-formatted events.
+        headers: Headers to send, e.g. X-Cache.
+
+    Returns:
+        StreamingResponse: The response.
+    """
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", **headers},
+    )
+
+
+async def single_completion_event(content: str) -> AsyncIterator[str]:
+    """
+    Streams a cached completion as one token and the final event.
+    """
+    yield f"data: {json.dumps({'content': content}, ensure_ascii=False)}\n\n"
+    yield f"event: done\ndata: {json.dumps({'finish_reason': 'stop'})}\n\n"
+
+
+async def stream_completion_events(
+    first: dict,
+    events: AsyncIterator[dict],
+    store: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> AsyncIterator[str]:
+    """
+    Formats the events of `create_chat_completion_deltas` as Server-Sent
+    Events: a `data:` event per token, then a `done` event with the finish
+    reason and usage, or an `error` event.
+
+    The events come from a shared upstream stream; when the client goes away,
+    this generator is cancelled and the upstream request with it, unless other
+    identical requests still follow it.
+
+    Args:
+        first (dict): The event already read from `events`.
+        events (AsyncIterator[dict]): The remaining events.
+        store (Optional[Callable[[str], Awaitable[None]]]): Stores the
+            complete text, if it should be cached.
+    """
+    parts = []
+    async with aclosing(events):
+        event = first
+        try:
+            while True:
+                if event["type"] == "delta":
+                    parts.append(event["content"])
+                    data = json.dumps({"content": event["content"]}, ensure_ascii=False)
+                    yield f"data: {data}\n\n"
+                else:
+                    done = {k: v for k, v in event.items() if k != "type"}
+                    yield f"event: done\ndata: {json.dumps(done)}\n\n"
+                    break
+                event = await anext(events)
+        except Exception as e:
+            send_log(f"Completion stream failed: {e}", level="ERROR")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+            return
+    if store is not None:
+        await store("".join(parts))
+
+
+@app.get("/cache/stats")
+async def completion_cache_stats():
+    """
+    Endpoint for reading the counters of the completion cache.
+
+    Returns:
+        A JSON object with hits, misses, stores, bypasses, the hit ratio and
+        the number of entries in memory, or {"enabled": false}.
+    """
+    if completion_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **completion_cache.stats()}
+
+
+@app.get("/cache/similarity/stats")
+async def similarity_cache_stats():
+    """
+    Endpoint for reading the counters of the similarity cache.
+
+    Returns:
+        A JSON object with hits, misses, stores, evictions, the hit ratio, the
+        mean similarity of the matches and the number of entries, or
+        {"enabled": false}.
+    """
+    if similarity_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **similarity_cache.stats()}
+
+
+@app.get("/limits/stats")
+async def rate_limit_stats():
+    """
+    Endpoint for reading the counters of the per-model rate limiters.
+
+    Returns:
+        A JSON object mapping each model ("<model>@<url>" for a custom URL)
+        to its requests in flight, queue depth, wait times, 429s and
+        remaining budget.
+    """
+    return rate_limiter.stats()
+
+
 @app.websocket("/stream")
-async def websocket_chatgpt_endpoint(websocket: WebSocket):
+async def websocket_chatgpt_endpoint(
+    websocket: WebSocket, mode: Literal["delta", "cumulative"] = "delta"
+):
     """
     WebSocket endpoint for streaming ChatGPT responses.
 
+    The socket carries a conversation: each text frame from the client is a
+    turn, either a JSON list of messages or a single message object, which is
+    appended to the conversation together with the previous replies. The
+    server answers every turn with JSON frames:
+
+    - {"type": "delta", "content": ...} with the new text (mode=delta), or
+      {"type": "content", "content": ...} with the whole reply so far
+      (mode=cumulative);
+    - {"type": "done", "finish_reason": ..., "usage": ...} once the reply is
+      complete, after which the next turn can be sent;
+    - {"type": "error", "detail": ...} if the turn failed.
+
     Args:
         websocket (WebSocket): The WebSocket connection object.
-
-    Raises:
-        WebSocketDisconnect: If the WebSocket connection is closed unexpectedly.
+        mode (str): "delta" (default) sends only the new text of each chunk;
+            "cumulative" resends the whole reply every time.
     """
-    wrapper = OpenAIWrapperStream()
+    wrapper = OpenAIWrapperStream(clients=openai_clients, limiter=rate_limiter)
+    history = MessageHistory()
     await websocket.accept()
     try:
         while True:
-            # deepcode ignore single~iteration~loop: no reason
             message_json = await websocket.receive_text()
-            messages = json.loads(message_json)
-
-            async for text in wrapper.create_chat_completion_stream(messages):
-                await websocket.send_text(text)
-
-            await websocket.close()
-            break
-
+            try:
+                turn = json.loads(message_json)
+                for message in turn if isinstance(turn, list) else [turn]:
+                    history.add_message(message["role"], message["content"])
+            except (ValueError, TypeError, KeyError) as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            messages = list(history.get_messages())
+
+            # Identical concurrent conversations share one upstream stream.
+            events = stream_flights.subscribe(
+                cache_key("gpt-3.5-turbo", messages),
+                lambda: wrapper.create_chat_completion_deltas(messages),
+            )
+            parts = []
+            try:
+                async with aclosing(events):
+                    async for event in events:
+                        if event["type"] == "delta":
+                            parts.append(event["content"])
+                            if mode == "cumulative":
+                                event = {"type": "content", "content": "".join(parts)}
+                        await websocket.send_json(event)
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            history.add_message("assistant", "".join(parts))
+
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
         print(f"An error occurred: {e}")
         await websocket.close(code=1011)
@@ -184,7 +783,7 @@ async def json_chatgpt_endpoint(messages: List[Message]):
     for message in messages:
         message_history.add_message(message.role, message.content)
 
-    wrapper = OpenAIWrapperJson()
+    wrapper = OpenAIWrapperJson(clients=openai_clients)
     try:
         completion = await wrapper.create_completion(
             model="gpt-3.5-turbo-1106", messages=message_history.get_messages()
@@ -194,6 +793,125 @@ async def json_chatgpt_endpoint(messages: List[Message]):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class SessionRequest(BaseModel):
+    """
+    Pydantic model for starting a session, optionally with initial messages
+    such as a system prompt.
+    """
+
+    messages: List[Message] = []
+
+
+def get_session(session_id: str):
+    """
+    Returns a session or fails with 404.
+
+    Raises:
+        HTTPException: If the session is unknown or expired.
+    """
+    session = sessions.get(session_id)
+    if session is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Session not found"
+        )
+    return session
+
+
+@app.post("/sessions", status_code=status.HTTP_201_CREATED)
+async def create_session_endpoint(request_data: Optional[SessionRequest] = None):
+    """
+    Endpoint for starting a server-side conversation.
+
+    The server keeps the history, so each turn only sends the new message to
+    /sessions/{session_id}/messages. Sessions live in memory: the least
+    recently used ones are evicted beyond SESSION_MAX_SESSIONS, and idle ones
+    expire after SESSION_TTL seconds.
+
+    Args:
+        request_data (Optional[SessionRequest]): Initial messages.
+
+    Returns:
+        A JSON object with the session id.
+    """
+    messages = [m.model_dump() for m in request_data.messages] if request_data else []
+    session = sessions.create(messages)
+    session.trim(SESSION_TOKEN_BUDGET)
+    return {"session_id": session.session_id}
+
+
+@app.post("/sessions/{session_id}/messages")
+async def session_message_endpoint(session_id: str, message: Message):
+    """
+    Endpoint for sending the next message of a session, answered like /json.
+
+    Before the upstream call, the oldest turns are dropped until the history
+    fits SESSION_TOKEN_BUDGET (estimated tokens; system messages are kept),
+    so the request size stays flat however long the conversation gets.
+
+    Args:
+        session_id (str): The session id.
+        message (Message): The new message.
+
+    Returns:
+        A JSON response containing the completion result.
+
+    Raises:
+        HTTPException: If the session is unknown or an unexpected error occurs.
+    """
+    session = get_session(session_id)
+    wrapper = OpenAIWrapperJson(clients=openai_clients)
+    # Turns of the same session run one at a time.
+    async with session.lock:
+        session.add_message(message.role, message.content)
+        session.trim(SESSION_TOKEN_BUDGET)
+        try:
+            completion = await wrapper.create_completion(
+                model="gpt-3.5-turbo-1106", messages=list(session.messages)
+            )
+        except Exception as e:
+            # Leave the history as it was before the failed turn.
+            session.messages.pop()
+            raise HTTPException(status_code=500, detail=str(e))
+        reply = completion.choices[0].message
+        session.add_message(reply.role, reply.content or "")
+    return wrapper.model_dump_json(completion)
+
+
+@app.get("/sessions/{session_id}")
+async def read_session_endpoint(session_id: str):
+    """
+    Endpoint for reading the history of a session.
+
+    Returns:
+        A JSON object with the messages, their estimated tokens and the number
+        of messages trimmed so far.
+
+    Raises:
+        HTTPException: If the session is unknown or expired.
+    """
+    session = get_session(session_id)
+    return {
+        "session_id": session.session_id,
+        "messages": session.messages,
+        "tokens": session.tokens,
+        "trimmed": session.trimmed,
+    }
+
+
+@app.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_session_endpoint(session_id: str):
+    """
+    Endpoint for ending a session.
+
+    Raises:
+        HTTPException: If the session is unknown.
+    """
+    if not sessions.delete(session_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Session not found"
+        )
+
+
 class FunctionInput(BaseModel):
     """
     Pydantic model for handling function input.
@@ -226,7 +944,7 @@ async def function_chatgpt_endpoint(data: FunctionData):
     Raises:
         HTTPException: If an unexpected error occurs.
     """
-    async_wrapper = OpenAIWrapperFunction()
+    async_wrapper = OpenAIWrapperFunction(clients=openai_clients)
 
     completion = await async_wrapper.create_completion(
         model="gpt-3.5-turbo",
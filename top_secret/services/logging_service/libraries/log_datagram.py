@@ -0,0 +1,266 @@
+import asyncio
+import json
+import math
+import os
+import socket
+import struct
+from typing import List, Optional, Tuple
+from libraries.log_records import FRAME_LENGTH, decode_binary_record
+from libraries.log_storage import LogStorage
+
+# First byte of a datagram holding binary frames. JSON datagrams start with "{".
+DATAGRAM_BINARY = 0x01
+
+MAX_ATTRIBUTE_LENGTH = 256
+STRING_ATTRIBUTES = ("service", "level", "trace_id")
+
+
+def parse_datagram(data: bytes) -> List[dict]:
+    """
+    Decodes the records of one ingestion datagram.
+
+    A datagram holds either JSON lines, or the byte DATAGRAM_BINARY followed
+    by binary frames (see `log_records`) whose "ts" slot carries the time of
+    the event. Either way the records get their ingest time from the storage.
+
+    Args:
+        data (bytes): The datagram.
+
+    Returns:
+        List[dict]: The records, each with a "message" and optional attributes.
+
+    Raises:
+        ValueError: If the datagram or one of its records is invalid.
+    """
+    if not data:
+        raise ValueError("Empty datagram")
+    if data[0] == DATAGRAM_BINARY:
+        records = []
+        position = 1
+        while position < len(data):
+            if position + FRAME_LENGTH.size > len(data):
+                raise ValueError("Truncated frame")
+            (length,) = FRAME_LENGTH.unpack_from(data, position)
+            position += FRAME_LENGTH.size
+            if position + length > len(data):
+                raise ValueError("Truncated frame")
+            try:
+                record = decode_binary_record(data[position : position + length])
+            except (struct.error, ValueError) as e:
+                raise ValueError(f"Invalid frame: {e}") from e
+            position += length
+            event_ts = record.pop("ts")
+            record.setdefault("timestamp", event_ts)
+            records.append(record)
+    else:
+        try:
+            records = [json.loads(line) for line in data.splitlines() if line.strip()]
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON: {e}") from e
+    return [check_record(record) for record in records]
+
+
+def check_record(record) -> dict:
+    """
+    Applies the constraints of the `/log` endpoint to a datagram record,
+    without the cost of a pydantic model per line. Strings must also encode
+    as UTF-8 (JSON may carry lone surrogates), or the storage could not
+    write them.
+
+    Args:
+        record: A decoded record.
+
+    Returns:
+        dict: The record, with only known attributes.
+
+    Raises:
+        ValueError: If the record is invalid.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("A record must be an object")
+    message = record.get("message")
+    if not isinstance(message, str) or not message:
+        raise ValueError("A record needs a non-empty message")
+    checked = {"message": message}
+    for key in STRING_ATTRIBUTES:
+        value = record.get(key)
+        if value is None:
+            continue
+        if not isinstance(value, str) or len(value) > MAX_ATTRIBUTE_LENGTH:
+            raise ValueError(f"Invalid {key}")
+        checked[key] = value
+    timestamp = record.get("timestamp")
+    if timestamp is not None:
+        if not _finite_number(timestamp):
+            raise ValueError("Invalid timestamp")
+        checked["timestamp"] = float(timestamp)
+    fields = record.get("fields")
+    if fields:
+        if not isinstance(fields, dict) or len(fields) > MAX_ATTRIBUTE_LENGTH:
+            raise ValueError("Invalid fields")
+        for name, value in fields.items():
+            if (
+                not isinstance(name, str)
+                or len(name) > MAX_ATTRIBUTE_LENGTH
+                or not _finite_number(value)
+            ):
+                raise ValueError(f"Invalid field {name!r}")
+        checked["fields"] = {name: float(value) for name, value in fields.items()}
+    try:
+        for key, value in checked.items():
+            if key == "fields":
+                for name in value:
+                    name.encode()
+            elif isinstance(value, str):
+                value.encode()
+    except UnicodeEncodeError as e:
+        raise ValueError("A record string is not valid UTF-8") from e
+    return checked
+
+
+def _finite_number(value) -> bool:
+    """
+    Returns whether a value is a finite int or float (not a bool).
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    try:
+        return math.isfinite(value)
+    except OverflowError:
+        return False
+
+
+class LogDatagramProtocol(asyncio.DatagramProtocol):
+    """
+    Hands every valid datagram to the storage as one unit.
+
+    Attributes:
+        storage (LogStorage): The storage receiving the records.
+        received (int): Number of records stored.
+        rejected (int): Number of datagrams dropped because they were invalid.
+    """
+
+    def __init__(self, storage: LogStorage):
+        self.storage = storage
+        self.received = 0
+        self.rejected = 0
+
+    def datagram_received(self, data: bytes, addr):
+        try:
+            records = parse_datagram(data)
+        except ValueError:
+            self.rejected += 1
+            return
+        self.storage.store_records(records)
+        self.received += len(records)
+
+    def error_received(self, exc: Exception):
+        print(f"Log datagram socket error: {exc}")
+
+
+class LogDatagramServer:
+    """
+    Receives log records over UDP and/or a Unix datagram socket.
+
+    Datagrams are fire-and-forget: there is no connection, no response and no
+    validation model per line, so sending a record costs one `sendto`. Records
+    go through the same storage pipeline as the `/log` endpoint.
+
+    Attributes:
+        storage (LogStorage): The storage receiving the records.
+        udp_address (Optional[Tuple[str, int]]): Host and port of the UDP
+            listener, or None to disable it.
+        unix_path (Optional[str]): Path of the Unix datagram socket, or None to
+            disable it.
+        receive_buffer (int): Requested socket receive buffer size in bytes,
+            absorbing bursts while the event loop is busy.
+        protocol (LogDatagramProtocol): Counters shared by both listeners.
+    """
+
+    def __init__(
+        self,
+        storage: LogStorage,
+        udp_address: Optional[Tuple[str, int]] = None,
+        unix_path: Optional[str] = None,
+        receive_buffer: int = 4 * 1024 * 1024,
+    ):
+        self.storage = storage
+        self.udp_address = udp_address
+        self.unix_path = unix_path
+        self.receive_buffer = receive_buffer
+        self.protocol = LogDatagramProtocol(storage)
+        self._transports: List[asyncio.DatagramTransport] = []
+
+    @property
+    def addresses(self) -> List:
+        """
+        Returns the addresses the listeners are bound to.
+
+        Returns:
+            List: A (host, port) tuple for UDP, a path for the Unix socket.
+        """
+        return [transport.get_extra_info("sockname") for transport in self._transports]
+
+    async def start(self):
+        """
+        Binds the configured sockets.
+        """
+        loop = asyncio.get_running_loop()
+        if self.udp_address is not None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._bind(sock, self.udp_address)
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: self.protocol, sock=sock
+            )
+            self._transports.append(transport)
+        if self.unix_path is not None:
+            if os.path.exists(self.unix_path):
+                os.remove(self.unix_path)
+            os.makedirs(os.path.dirname(os.path.abspath(self.unix_path)), exist_ok=True)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._bind(sock, self.unix_path)
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: self.protocol, sock=sock
+            )
+            self._transports.append(transport)
+
+    async def stop(self):
+        """
+        Closes the sockets.
+        """
+        for transport in self._transports:
+            transport.close()
+        self._transports = []
+        if self.unix_path is not None and os.path.exists(self.unix_path):
+            os.remove(self.unix_path)
+
+    def _bind(self, sock: socket.socket, address):
+        """
+        Sizes the receive buffer of a socket and binds it.
+        """
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.receive_buffer)
+        except OSError:
+            pass
+        sock.setblocking(False)
+        try:
+            sock.bind(address)
+        except OSError:
+            sock.close()
+            raise
+
+
+def parse_udp_address(value: str) -> Optional[Tuple[str, int]]:
+    """
+    Parses a "host:port" setting.
+
+    Args:
+        value (str): The setting; empty disables the listener.
+
+    Returns:
+        Optional[Tuple[str, int]]: The address, or None.
+    """
+    if not value:
+        return None
+    host, _, port = value.rpartition(":")
+    return host or "0.0.0.0", int(port)
@@ -0,0 +1,314 @@
+import bisect
+import json
+import mmap
+import os
+import re
+from typing import Iterator, List, Optional, Tuple
+from pydantic import BaseModel, Field, field_validator
+from libraries.log_records import decode_record, format_record_text, iter_frames
+from libraries.log_segments import IndexEntry, SegmentInfo, decompress_block
+from libraries.log_storage import LogStorage
+
+
+class LogQuery(BaseModel):
+    """
+    Filters and pagination for reading log records back.
+
+    Attributes:
+        since (Optional[float]): Only records at or after this time (epoch seconds).
+        until (Optional[float]): Only records at or before this time.
+        service (Optional[str]): Only records from this service.
+        level (Optional[str]): Only records with this level (case-insensitive).
+        contains (Optional[str]): Only records whose message contains this text.
+        regex (Optional[str]): Only records whose message matches this pattern.
+        limit (int): Maximum number of records to return.
+        cursor (Optional[int]): Offset returned as `next_cursor` by a previous
+            query; reading resumes at that record.
+    """
+
+    since: Optional[float] = None
+    until: Optional[float] = None
+    service: Optional[str] = None
+    level: Optional[str] = None
+    contains: Optional[str] = None
+    regex: Optional[str] = None
+    limit: int = Field(100, ge=1, le=1000)
+    cursor: Optional[int] = Field(None, ge=0)
+
+    @field_validator("regex")
+    @classmethod
+    def check_regex(cls, regex: Optional[str]) -> Optional[str]:
+        """
+        Rejects patterns that do not compile.
+        """
+        if regex is not None:
+            try:
+                re.compile(regex)
+            except re.error as e:
+                raise ValueError(f"Invalid regex: {e}") from e
+        return regex
+
+    def matches(self, record: dict) -> bool:
+        """
+        Checks a record against the service, level and message filters.
+
+        Time range and pagination are not considered.
+
+        Args:
+            record (dict): A stored log record.
+
+        Returns:
+            bool: True if the record passes every filter.
+        """
+        if self.service is not None and record.get("service") != self.service:
+            return False
+        if self.level is not None and (
+            (record.get("level") or "").lower() != self.level.lower()
+        ):
+            return False
+        message = record["message"]
+        if self.contains is not None and self.contains not in message:
+            return False
+        return self.regex is None or re.search(self.regex, message) is not None
+
+
+class LogQueryResult(BaseModel):
+    """
+    A page of log records.
+
+    Attributes:
+        records (List[dict]): The matching records, oldest first.
+        next_cursor (Optional[int]): Cursor of the next matching record, or
+            None when there are no more.
+    """
+
+    records: List[dict]
+    next_cursor: Optional[int] = None
+
+
+class LogReader:
+    """
+    Reads log records back from the segments of a LogStorage.
+
+    The manifest narrows a query down to the segments overlapping its time
+    range, and each segment's sparse index narrows it down to the blocks
+    overlapping that range. Plain segments are read through a memory map and
+    compressed segments are decompressed one independent block at a time, so
+    the cost of a query follows the size of the range it covers rather than
+    the size of the log.
+
+    Attributes:
+        storage (LogStorage): The storage to read from.
+    """
+
+    def __init__(self, storage: LogStorage):
+        self.storage = storage
+
+    def query(self, query: LogQuery) -> LogQueryResult:
+        """
+        Runs a query. Performs blocking file I/O.
+
+        Args:
+            query (LogQuery): The filters and pagination of the query.
+
+        Returns:
+            LogQueryResult: The matching records and the cursor of the next page.
+        """
+        records = []
+        for offset, record in self.iter_matching(query):
+            if len(records) == query.limit:
+                return LogQueryResult(records=records, next_cursor=offset)
+            records.append(record)
+        return LogQueryResult(records=records)
+
+    def export(self, query: LogQuery, output_format: str = "jsonl") -> Iterator[str]:
+        """
+        Exports every record matching a query, ignoring its limit. Performs
+        blocking file I/O.
+
+        Args:
+            query (LogQuery): The filters of the export.
+            output_format (str): "jsonl" for one JSON object per line or "text"
+             for human-readable lines.
+
+        Yields:
+            str: One exported line per record, including its newline.
+        """
+        for _, record in self.iter_matching(query):
+            if output_format == "text":
+                yield format_record_text(record) + "\n"
+            else:
+                yield json.dumps(record, ensure_ascii=False) + "\n"
+
+    def iter_matching(self, query: LogQuery) -> Iterator[Tuple[int, dict]]:
+        """
+        Yields every record matching a query's filters, oldest first.
+
+        Args:
+            query (LogQuery): The filters of the query; its limit is ignored.
+
+        Yields:
+            Tuple[int, dict]: The logical offset of each record and the record.
+        """
+        needles = {
+            "jsonl": raw_needle(query.contains),
+            "binary": query.contains.encode() if query.contains else None,
+        }
+        for offset, raw, segment_format in self.iter_raw_records(
+            query.since, query.until, query.cursor
+        ):
+            needle = needles[segment_format]
+            if needle is not None and needle not in raw:
+                continue
+            record = decode_record(raw, segment_format)
+            if query.since is not None and record["ts"] < query.since:
+                continue
+            if query.until is not None and record["ts"] > query.until:
+                return
+            if query.matches(record):
+                yield offset, record
+
+    def iter_raw_records(
+        self,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        cursor: Optional[int] = None,
+    ) -> Iterator[Tuple[int, bytes, str]]:
+        """
+        Yields the raw records of the index blocks overlapping a time range.
+
+        Records just outside the range may be yielded; callers filter on the
+        exact timestamps.
+
+        Args:
+            since (Optional[float]): Start of the range (epoch seconds).
+            until (Optional[float]): End of the range (epoch seconds).
+            cursor (Optional[int]): Logical offset of the first record to yield.
+
+        Yields:
+            Tuple[int, bytes, str]: The logical offset of each record, its raw
+            encoding and the format of its segment.
+        """
+        cursor = cursor or 0
+        for segment in self.storage.segments():
+            if (
+                not segment.lines
+                or segment.end_offset <= cursor
+                or (since is not None and segment.last_ts < since)
+            ):
+                continue
+            if until is not None and segment.first_ts > until:
+                return
+            try:
+                yield from self._read_segment(segment, since, until, cursor)
+            except FileNotFoundError:
+                # The segment was compressed or deleted since the snapshot.
+                current = next(
+                    (s for s in self.storage.segments() if s.id == segment.id), None
+                )
+                if current is not None and current.file != segment.file:
+                    yield from self._read_segment(current, since, until, cursor)
+
+    def _read_segment(
+        self,
+        segment: SegmentInfo,
+        since: Optional[float],
+        until: Optional[float],
+        cursor: int,
+    ) -> Iterator[Tuple[int, bytes]]:
+        """
+        Yields the records of the blocks of one segment overlapping a range.
+
+        Args:
+            segment (SegmentInfo): The segment to read.
+            since (Optional[float]): Start of the range (epoch seconds).
+            until (Optional[float]): End of the range (epoch seconds).
+            cursor (int): Logical offset of the first record to yield.
+
+        Yields:
+            Tuple[int, bytes, str]: The logical offset of each record, its raw
+            encoding and the format of its segment.
+        """
+        segment_format = segment.format
+        path = os.path.join(self.storage.log_directory, segment.file)
+        with open(path, "rb") as segment_file:
+            size = os.fstat(segment_file.fileno()).st_size
+            if size == 0:
+                return
+            index = self.storage.segment_index(segment)
+            first, last = block_range(
+                index, since, until, cursor - segment.start_offset
+            )
+            with mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if segment.compression == "none":
+                    start = max(index[first][1], cursor - segment.start_offset)
+                    end = index[last][1] if last < len(index) else size
+                    for offset, raw in iter_frames(
+                        mm, start, end, segment.start_offset, segment_format
+                    ):
+                        yield offset, raw, segment_format
+                    return
+                for block in range(first, last):
+                    _, raw_offset, stored_offset = index[block]
+                    stored_end = index[block + 1][2] if block + 1 < len(index) else size
+                    data = decompress_block(
+                        mm[stored_offset:stored_end], segment.compression
+                    )
+                    for offset, raw in iter_frames(
+                        data,
+                        0,
+                        len(data),
+                        segment.start_offset + raw_offset,
+                        segment_format,
+                    ):
+                        if offset >= cursor:
+                            yield offset, raw, segment_format
+
+
+def block_range(
+    index: List[IndexEntry],
+    since: Optional[float],
+    until: Optional[float],
+    local_cursor: int,
+) -> Tuple[int, int]:
+    """
+    Picks the index blocks of a segment that may hold records in a range.
+
+    Args:
+        index (List[IndexEntry]): The segment's index.
+        since (Optional[float]): Start of the range (epoch seconds).
+        until (Optional[float]): End of the range (epoch seconds).
+        local_cursor (int): Offset within the segment of the first record.
+
+    Returns:
+        Tuple[int, int]: The first block and the block after the last one.
+    """
+    timestamps = [entry[0] for entry in index]
+    first = 0
+    if since is not None:
+        # Records equal to `since` may end the block before the first match.
+        first = max(bisect.bisect_left(timestamps, since) - 1, 0)
+    if local_cursor > 0:
+        offsets = [entry[1] for entry in index]
+        first = max(first, bisect.bisect_right(offsets, local_cursor) - 1)
+    last = len(index)
+    if until is not None:
+        last = bisect.bisect_right(timestamps, until)
+    return first, max(last, first)
+
+
+def raw_needle(contains: Optional[str]) -> Optional[bytes]:
+    """
+    Encodes a substring filter for matching against raw JSON lines.
+
+    Args:
+        contains (Optional[str]): The substring filter.
+
+    Returns:
+        Optional[bytes]: Bytes that every matching line contains, or None if
+        the substring is escaped in JSON and cannot be pre-filtered.
+    """
+    if contains is None:
+        return None
+    encoded = json.dumps(contains, ensure_ascii=False)[1:-1]
+    return encoded.encode() if encoded == contains else None
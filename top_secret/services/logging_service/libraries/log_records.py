@@ -0,0 +1,219 @@
+import json
+import struct
+from datetime import datetime, timezone
+from typing import Iterator, Tuple
+
+SEGMENT_FORMATS = ("jsonl", "binary")
+SEGMENT_EXTENSIONS = {"jsonl": ".log", "binary": ".bin"}
+
+# Binary frame: u32 body length, then the body. The body starts with the
+# ingest timestamp and a flags byte telling which optional attributes follow.
+FRAME_LENGTH = struct.Struct("<I")
+BODY_HEAD = struct.Struct("<dB")
+STRING_LENGTH = struct.Struct("<H")
+MESSAGE_LENGTH = struct.Struct("<I")
+FLOAT = struct.Struct("<d")
+
+# Optional string attributes, in body order, with their flag bits.
+STRING_ATTRIBUTES = (("service", 0x01), ("level", 0x02), ("trace_id", 0x04))
+TIMESTAMP_FLAG = 0x08
+FIELDS_FLAG = 0x10
+
+
+def check_segment_format(segment_format: str):
+    """
+    Validates a segment format name.
+
+    Args:
+        segment_format (str): One of SEGMENT_FORMATS.
+
+    Raises:
+        ValueError: If the format is unknown.
+    """
+    if segment_format not in SEGMENT_FORMATS:
+        raise ValueError(
+            f"segment format must be one of {SEGMENT_FORMATS}, got {segment_format!r}"
+        )
+
+
+def _pack_string(value: str) -> bytes:
+    """
+    Encodes a string with a u16 length prefix.
+    """
+    data = value.encode()
+    return STRING_LENGTH.pack(len(data)) + data
+
+
+def _unpack_string(body, position: int) -> Tuple[str, int]:
+    """
+    Decodes a u16-prefixed string, returning it and the position after it.
+    """
+    (length,) = STRING_LENGTH.unpack_from(body, position)
+    position += STRING_LENGTH.size
+    return bytes(body[position : position + length]).decode(), position + length
+
+
+def encode_binary_record(record: dict) -> bytes:
+    """
+    Encodes a log record as a length-prefixed binary frame.
+
+    Args:
+        record (dict): The record: "ts", "message" and optional "service",
+         "level", "trace_id", "timestamp" and numeric "fields".
+
+    Returns:
+        bytes: The frame, including its length prefix.
+    """
+    flags = 0
+    parts = []
+    for key, flag in STRING_ATTRIBUTES:
+        if record.get(key) is not None:
+            flags |= flag
+            parts.append(_pack_string(record[key]))
+    if record.get("timestamp") is not None:
+        flags |= TIMESTAMP_FLAG
+        parts.append(FLOAT.pack(record["timestamp"]))
+    message = record["message"].encode()
+    parts.append(MESSAGE_LENGTH.pack(len(message)))
+    parts.append(message)
+    fields = record.get("fields")
+    if fields:
+        flags |= FIELDS_FLAG
+        parts.append(STRING_LENGTH.pack(len(fields)))
+        for name, value in fields.items():
+            parts.append(_pack_string(name))
+            parts.append(FLOAT.pack(value))
+    body = BODY_HEAD.pack(record["ts"], flags) + b"".join(parts)
+    return FRAME_LENGTH.pack(len(body)) + body
+
+
+def decode_binary_record(body) -> dict:
+    """
+    Decodes the body of a binary frame.
+
+    Args:
+        body: The frame body, without its length prefix.
+
+    Returns:
+        dict: The record.
+    """
+    ts, flags = BODY_HEAD.unpack_from(body, 0)
+    position = BODY_HEAD.size
+    attributes = {}
+    for key, flag in STRING_ATTRIBUTES:
+        if flags & flag:
+            attributes[key], position = _unpack_string(body, position)
+    if flags & TIMESTAMP_FLAG:
+        (attributes["timestamp"],) = FLOAT.unpack_from(body, position)
+        position += FLOAT.size
+    (length,) = MESSAGE_LENGTH.unpack_from(body, position)
+    position += MESSAGE_LENGTH.size
+    record = {
+        "ts": ts,
+        "message": bytes(body[position : position + length]).decode(),
+        **attributes,
+    }
+    position += length
+    if flags & FIELDS_FLAG:
+        (count,) = STRING_LENGTH.unpack_from(body, position)
+        position += STRING_LENGTH.size
+        fields = {}
+        for _ in range(count):
+            name, position = _unpack_string(body, position)
+            (fields[name],) = FLOAT.unpack_from(body, position)
+            position += FLOAT.size
+        record["fields"] = fields
+    return record
+
+
+def encode_record(record: dict, segment_format: str) -> bytes:
+    """
+    Encodes a log record for a segment.
+
+    Args:
+        record (dict): The record to encode.
+        segment_format (str): "jsonl" (one JSON object per line) or "binary".
+
+    Returns:
+        bytes: The encoded record, including its newline or length prefix.
+    """
+    if segment_format == "binary":
+        return encode_binary_record(record)
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode()
+
+
+def decode_record(data, segment_format: str) -> dict:
+    """
+    Decodes a record yielded by `iter_frames`.
+
+    Args:
+        data: The raw record.
+        segment_format (str): The format of the segment it was read from.
+
+    Returns:
+        dict: The record.
+    """
+    if segment_format == "binary":
+        return decode_binary_record(data)
+    return json.loads(data)
+
+
+def iter_frames(
+    buffer, start: int, end: int, base: int, segment_format: str
+) -> Iterator[Tuple[int, bytes]]:
+    """
+    Yields the complete records of a buffer between two offsets.
+
+    Args:
+        buffer: A bytes-like object (e.g. an mmap).
+        start (int): Offset of the first record.
+        end (int): Offset at which to stop.
+        base (int): Logical offset of the buffer's first byte.
+        segment_format (str): The format of the records.
+
+    Yields:
+        Tuple[int, bytes]: The logical offset of each record and its raw
+        content, without newline or length prefix. A trailing incomplete
+        record is not yielded.
+    """
+    position = start
+    if segment_format == "binary":
+        while position + FRAME_LENGTH.size <= end:
+            (length,) = FRAME_LENGTH.unpack_from(buffer, position)
+            body_start = position + FRAME_LENGTH.size
+            if body_start + length > end:
+                return
+            yield base + position, buffer[body_start : body_start + length]
+            position = body_start + length
+        return
+    while position < end:
+        newline = buffer.find(b"\n", position, end)
+        if newline < 0:
+            return
+        yield base + position, buffer[position:newline]
+        position = newline + 1
+
+
+def format_record_text(record: dict) -> str:
+    """
+    Renders a record as one human-readable line.
+
+    Args:
+        record (dict): The record.
+
+    Returns:
+        str: "<ISO time> <LEVEL> [<service>] <message> key=value ...", where the
+        time is the event timestamp if the record has one, else its ingest time.
+    """
+    when = datetime.fromtimestamp(record.get("timestamp") or record["ts"], timezone.utc)
+    parts = [when.isoformat()]
+    if record.get("level"):
+        parts.append(record["level"].upper())
+    if record.get("service"):
+        parts.append(f"[{record['service']}]")
+    parts.append(record["message"].replace("\n", "\\n"))
+    if record.get("trace_id"):
+        parts.append(f"trace_id={record['trace_id']}")
+    for name, value in (record.get("fields") or {}).items():
+        parts.append(f"{name}={value:g}")
+    return " ".join(parts)
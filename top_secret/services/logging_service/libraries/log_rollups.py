@@ -0,0 +1,463 @@
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel
+from libraries.log_records import decode_record
+
+ROLLUPS_FILE = "rollups.json"
+MAX_FLOAT = sys.float_info.max
+
+
+class FieldHistogram:
+    """
+    Distribution of a numeric field within one bucket.
+
+    Values are counted in power-of-two bins: bin `i` holds the values in
+    (2 ** (i - 1), 2 ** i], and values at or below zero share bin None. The
+    top bin, 1024, holds the values above 2 ** 1023.
+
+    Attributes:
+        count (int): Number of values.
+        total (float): Sum of the values.
+        low (float): Smallest value.
+        high (float): Largest value.
+        bins (Dict[Optional[int], int]): Number of values per bin.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.low = math.inf
+        self.high = -math.inf
+        self.bins: Dict[Optional[int], int] = {}
+
+    def add(self, value: float):
+        """
+        Counts one value. Infinite and NaN values are ignored, as they
+        have no bin and would spoil the sum, and the sum saturates at the
+        largest float rather than overflowing.
+
+        Args:
+            value (float): The value.
+        """
+        if not math.isfinite(value):
+            return
+        self.count += 1
+        self.total = min(max(self.total + value, -MAX_FLOAT), MAX_FLOAT)
+        self.low = min(self.low, value)
+        self.high = max(self.high, value)
+        key = math.ceil(math.log2(value)) if value > 0 else None
+        self.bins[key] = self.bins.get(key, 0) + 1
+
+    def to_dict(self) -> dict:
+        """
+        Returns the persisted form of the histogram.
+        """
+        return {
+            "count": self.count,
+            "total": self.total,
+            "low": self.low,
+            "high": self.high,
+            "bins": [[key, count] for key, count in self.bins.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FieldHistogram":
+        """
+        Rebuilds a histogram from its persisted form.
+        """
+        histogram = cls()
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.low = data["low"]
+        histogram.high = data["high"]
+        histogram.bins = {key: count for key, count in data["bins"]}
+        return histogram
+
+
+class RollupBucket:
+    """
+    Aggregates of the records ingested during one time bucket.
+
+    Attributes:
+        counts (Dict[Tuple[Optional[str], Optional[str]], int]): Number of
+            records per (service, level); levels are lowercased.
+        fields (Dict[Tuple[Optional[str], str], FieldHistogram]): Histogram
+            per (service, field name).
+    """
+
+    def __init__(self):
+        self.counts: Dict[Tuple[Optional[str], Optional[str]], int] = {}
+        self.fields: Dict[Tuple[Optional[str], str], FieldHistogram] = {}
+
+
+class LevelCount(BaseModel):
+    """
+    Number of records of a service and level in a bucket.
+    """
+
+    service: Optional[str]
+    level: Optional[str]
+    count: int
+
+
+class HistogramBin(BaseModel):
+    """
+    Number of values at or below `le` (and above the previous bin's bound).
+    """
+
+    le: float
+    count: int
+
+
+class FieldStats(BaseModel):
+    """
+    Distribution of a numeric field of a service in a bucket.
+    """
+
+    service: Optional[str]
+    field: str
+    count: int
+    sum: float
+    min: float
+    max: float
+    histogram: List[HistogramBin]
+
+
+class StatsBucket(BaseModel):
+    """
+    Aggregates of one time bucket.
+
+    Attributes:
+        start (float): Start of the bucket (epoch seconds).
+        counts (List[LevelCount]): Record counts per service and level.
+        fields (List[FieldStats]): Field distributions per service.
+    """
+
+    start: float
+    counts: List[LevelCount]
+    fields: List[FieldStats] = []
+
+
+class LogStatsResult(BaseModel):
+    """
+    Rollups of a time range.
+
+    Attributes:
+        bucket_seconds (int): Width of each bucket.
+        buckets (List[StatsBucket]): The non-empty buckets, oldest first.
+    """
+
+    bucket_seconds: int
+    buckets: List[StatsBucket]
+
+
+class LogRollups:
+    """
+    Maintains per-bucket counts and field histograms as records are stored.
+
+    Registered as a storage listener, it folds every committed batch into the
+    bucket of each record's ingest time, so reading the stats of a range costs
+    one lookup per bucket instead of a scan of the log. Buckets older than
+    `retention` are discarded.
+
+    The rollups are saved periodically together with the storage offset they
+    cover. On start, they are loaded and only the records stored after that
+    offset are replayed.
+
+    Attributes:
+        directory (str): Directory of the persisted rollups.
+        bucket_seconds (int): Width of the buckets.
+        retention (float): Age in seconds after which buckets are discarded;
+            0 keeps them all.
+        save_interval (float): Seconds between two saves.
+        offset (int): Storage offset up to which records are counted.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        bucket_seconds: int = 60,
+        retention: float = 7 * 24 * 3600,
+        save_interval: float = 30,
+    ):
+        self.directory = directory
+        self.bucket_seconds = bucket_seconds
+        self.retention = retention
+        self.save_interval = save_interval
+        self.offset = 0
+        self._buckets: Dict[int, RollupBucket] = {}
+        self._newest = 0
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, records: List[dict], end_offset: Optional[int] = None):
+        """
+        Counts newly stored records.
+
+        Args:
+            records (List[dict]): The records, in storage order.
+            end_offset (Optional[int]): Storage offset just past the records.
+        """
+        for record in records:
+            start = int(record["ts"] // self.bucket_seconds) * self.bucket_seconds
+            bucket = self._buckets.get(start)
+            if bucket is None:
+                bucket = self._buckets[start] = RollupBucket()
+                self._newest = max(self._newest, start)
+            service = record.get("service")
+            level = record.get("level")
+            key = (service, level.lower() if level else None)
+            bucket.counts[key] = bucket.counts.get(key, 0) + 1
+            for name, value in (record.get("fields") or {}).items():
+                histogram = bucket.fields.get((service, name))
+                if histogram is None:
+                    histogram = bucket.fields[(service, name)] = FieldHistogram()
+                histogram.add(value)
+        if end_offset is not None:
+            self.offset = end_offset
+        self._dirty = True
+
+    def stats(
+        self,
+        since: float,
+        until: float,
+        service: Optional[str] = None,
+        level: Optional[str] = None,
+        field: Optional[str] = None,
+    ) -> LogStatsResult:
+        """
+        Returns the rollups of the buckets overlapping a time range.
+
+        Args:
+            since (float): Start of the range (epoch seconds).
+            until (float): End of the range (epoch seconds).
+            service (Optional[str]): Only this service.
+            level (Optional[str]): Only this level (case-insensitive).
+            field (Optional[str]): Only this field's histograms.
+
+        Returns:
+            LogStatsResult: The non-empty buckets, oldest first.
+        """
+        width = self.bucket_seconds
+        first = int(since // width) * width
+        # Never walk buckets that cannot exist.
+        last = min(int(until // width) * width, self._newest)
+        if self.retention > 0:
+            first = max(first, last - int(self.retention // width + 1) * width)
+        level = level.lower() if level else None
+        buckets = []
+        for start in range(first, last + 1, width):
+            bucket = self._buckets.get(start)
+            if bucket is None:
+                continue
+            counts = [
+                LevelCount(service=key[0], level=key[1], count=count)
+                for key, count in bucket.counts.items()
+                if (service is None or key[0] == service)
+                and (level is None or key[1] == level)
+            ]
+            fields = [
+                field_stats(key[0], key[1], histogram)
+                for key, histogram in bucket.fields.items()
+                if (service is None or key[0] == service)
+                and (field is None or key[1] == field)
+            ]
+            if counts or fields:
+                buckets.append(StatsBucket(start=start, counts=counts, fields=fields))
+        return LogStatsResult(bucket_seconds=width, buckets=buckets)
+
+    def expire(self, now: float):
+        """
+        Discards the buckets older than the retention.
+
+        Args:
+            now (float): The current time (epoch seconds).
+        """
+        if self.retention <= 0:
+            return
+        cutoff = now - self.retention
+        for start in [s for s in self._buckets if s + self.bucket_seconds < cutoff]:
+            del self._buckets[start]
+            self._dirty = True
+
+    def catch_up(self, records, end_offset: int):
+        """
+        Counts the records stored after `offset`, e.g. those stored since the
+        last save. Performs blocking file I/O.
+
+        Args:
+            records: The (offset, raw, format) tuples of
+             `LogReader.iter_raw_records(cursor=offset)`.
+            end_offset (int): Storage offset just past the last record.
+        """
+        batch = []
+        for offset, raw, segment_format in records:
+            if offset < self.offset:
+                continue
+            batch.append(decode_record(raw, segment_format))
+            if len(batch) == 1000:
+                self.add(batch)
+                batch = []
+        self.add(batch, end_offset)
+
+    def load(self):
+        """
+        Loads the saved rollups, if any. Performs blocking file I/O.
+        """
+        path = os.path.join(self.directory, ROLLUPS_FILE)
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as rollups_file:
+                data = json.load(rollups_file)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable rollups {path}: {e}")
+            return
+        if data.get("bucket_seconds") != self.bucket_seconds:
+            # Rebuild from the log rather than mixing bucket widths.
+            return
+        self.offset = data["offset"]
+        self._buckets = {}
+        for start, counts, fields in data["buckets"]:
+            bucket = self._buckets[start] = RollupBucket()
+            bucket.counts = {(s, lv): count for s, lv, count in counts}
+            bucket.fields = {
+                (s, name): FieldHistogram.from_dict(histogram)
+                for s, name, histogram in fields
+            }
+        self._newest = max(self._buckets, default=0)
+        self._dirty = False
+
+    def snapshot(self) -> dict:
+        """
+        Returns the persisted form of the rollups.
+        """
+        return {
+            "bucket_seconds": self.bucket_seconds,
+            "offset": self.offset,
+            "buckets": [
+                [
+                    start,
+                    [[s, lv, count] for (s, lv), count in bucket.counts.items()],
+                    [
+                        [s, name, histogram.to_dict()]
+                        for (s, name), histogram in bucket.fields.items()
+                    ],
+                ]
+                for start, bucket in sorted(self._buckets.items())
+            ],
+        }
+
+    async def start(self):
+        """
+        Starts the periodic save task.
+        """
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops the save task and saves the rollups one last time.
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.save()
+
+    async def save(self):
+        """
+        Saves the rollups if they changed since the last save.
+        """
+        if not self._dirty:
+            return
+        self._dirty = False
+        # Snapshot on the event loop, where the listener mutates the buckets.
+        data = self.snapshot()
+        await asyncio.to_thread(write_rollups, self.directory, data)
+
+    async def _run(self):
+        """
+        Expires old buckets and saves the rollups periodically.
+        """
+        while True:
+            await asyncio.sleep(self.save_interval)
+            self.expire(time.time())
+            try:
+                await self.save()
+            except OSError as e:
+                print(f"Failed to save log rollups: {e}")
+                self._dirty = True
+
+
+def field_stats(
+    service: Optional[str], name: str, histogram: FieldHistogram
+) -> FieldStats:
+    """
+    Renders the histogram of a field.
+
+    Args:
+        service (Optional[str]): The service of the field.
+        name (str): The field name.
+        histogram (FieldHistogram): Its distribution.
+
+    Returns:
+        FieldStats: The distribution with cumulative bin bounds.
+    """
+    bins = sorted(
+        histogram.bins.items(),
+        key=lambda item: -math.inf if item[0] is None else item[0],
+    )
+    return FieldStats(
+        service=service,
+        field=name,
+        count=histogram.count,
+        sum=histogram.total,
+        min=histogram.low,
+        max=histogram.high,
+        histogram=[HistogramBin(le=bin_bound(key), count=count) for key, count in bins],
+    )
+
+
+def bin_bound(key: Optional[int]) -> float:
+    """
+    Returns the upper bound of a histogram bin.
+
+    Args:
+        key (Optional[int]): The bin.
+
+    Returns:
+        float: 2 ** key, 0 for bin None, and the largest float for the top
+        bin, as 2 ** 1024 does not fit in a float.
+    """
+    if key is None:
+        return 0.0
+    return 2.0**key if key < 1024 else MAX_FLOAT
+
+
+def write_rollups(directory: str, data: dict):
+    """
+    Writes the rollups atomically.
+
+    Args:
+        directory (str): The directory of the rollups file.
+        data (dict): The persisted form of the rollups.
+    """
+    path = os.path.join(directory, ROLLUPS_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as tmp_file:
+        json.dump(data, tmp_file, separators=(",", ":"))
+        tmp_file.flush()
+        os.fsync(tmp_file.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,442 @@
+import gzip
+import os
+import struct
+import threading
+import time
+from typing import Iterator, List, Optional, Tuple
+from pydantic import BaseModel
+from libraries.log_records import SEGMENT_EXTENSIONS, decode_record, iter_frames
+
+try:
+    import zstandard
+except ImportError:  # zstd support is optional
+    zstandard = None
+
+COMPRESSIONS = ("gzip", "zstd", "none")
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+
+SEGMENT_ACTIVE = "active"
+SEGMENT_SEALED = "sealed"
+SEGMENT_COMPRESSED = "compressed"
+
+# Sparse index entry: record timestamp, offset in the uncompressed segment and
+# offset of the compressed block holding the record (equal for plain files).
+INDEX_ENTRY = struct.Struct("<dQQ")
+IndexEntry = Tuple[float, int, int]
+
+
+def check_compression(compression: str):
+    """
+    Validates a compression name and the availability of its codec.
+
+    Args:
+        compression (str): One of COMPRESSIONS.
+
+    Raises:
+        ValueError: If the compression is unknown or its codec is missing.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(
+            f"compression must be one of {COMPRESSIONS}, got {compression!r}"
+        )
+    if compression == "zstd" and zstandard is None:
+        raise ValueError("zstd compression requires the 'zstandard' package")
+
+
+def open_segment(path: str, compression: str, mode: str = "rb"):
+    """
+    Opens a segment file for binary reading or writing.
+
+    Args:
+        path (str): The path of the segment file.
+        compression (str): The compression the file is (to be) stored with.
+        mode (str): "rb" or "wb".
+
+    Returns:
+        A binary file object that transparently (de)compresses.
+    """
+    if compression == "gzip":
+        return gzip.open(path, mode)
+    if compression == "zstd":
+        raw = open(path, mode)
+        if mode == "rb":
+            return zstandard.ZstdDecompressor().stream_reader(
+                raw, read_across_frames=True, closefd=True
+            )
+        return zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+    return open(path, mode)
+
+
+def compress_block(data: bytes, compression: str) -> bytes:
+    """
+    Compresses one block of a segment as a self-contained gzip member or zstd
+    frame, so it can be decompressed without reading the blocks before it.
+
+    Args:
+        data (bytes): The uncompressed block.
+        compression (str): "gzip" or "zstd".
+
+    Returns:
+        bytes: The compressed block.
+    """
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def decompress_block(data: bytes, compression: str) -> bytes:
+    """
+    Decompresses one block written by `compress_block`.
+
+    Args:
+        data (bytes): The compressed block.
+        compression (str): "gzip" or "zstd".
+
+    Returns:
+        bytes: The uncompressed block.
+    """
+    if compression == "gzip":
+        return gzip.decompress(data)
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+class SegmentInfo(BaseModel):
+    """
+    Describes one log segment in the manifest.
+
+    Attributes:
+        id (int): Monotonic segment number.
+        file (str): File name of the segment, relative to the log directory.
+        state (str): "active", "sealed" or "compressed".
+        compression (str): Compression of the file on disk.
+        format (str): Encoding of the records, "jsonl" or "binary".
+        created (float): Creation time of the segment (epoch seconds).
+        first_ts (Optional[float]): Timestamp of the first record.
+        last_ts (Optional[float]): Timestamp of the last record.
+        start_offset (int): Logical byte offset of the segment's first record
+            in the uncompressed stream of all segments.
+        end_offset (int): Logical byte offset just past the last record.
+        lines (int): Number of records in the segment.
+        disk_bytes (int): Size of the file on disk.
+    """
+
+    id: int
+    file: str
+    state: str = SEGMENT_ACTIVE
+    compression: str = "none"
+    format: str = "jsonl"
+    created: float
+    first_ts: Optional[float] = None
+    last_ts: Optional[float] = None
+    start_offset: int = 0
+    end_offset: int = 0
+    lines: int = 0
+    disk_bytes: int = 0
+
+
+class Manifest(BaseModel):
+    """
+    The persisted list of segments, oldest first.
+    """
+
+    next_id: int = 1
+    segments: List[SegmentInfo] = []
+
+
+class SegmentManifest:
+    """
+    Thread-safe owner of the segment manifest file.
+
+    The manifest is rewritten atomically (write to a temporary file, fsync,
+    rename) whenever a segment is opened, sealed, compressed or deleted, so
+    readers can always find the segments covering a time range.
+
+    Attributes:
+        directory (str): The directory holding the segments and the manifest.
+        path (str): The path of the manifest file.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, "manifest.json")
+        self._lock = threading.Lock()
+        self._manifest = Manifest()
+
+    def load(self):
+        """
+        Loads the manifest from disk, starting empty if it does not exist.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            if os.path.exists(self.path):
+                with open(self.path) as manifest_file:
+                    self._manifest = Manifest.model_validate_json(manifest_file.read())
+            else:
+                self._manifest = Manifest()
+
+    def segments(self) -> List[SegmentInfo]:
+        """
+        Returns a snapshot of the segments, oldest first.
+
+        Returns:
+            List[SegmentInfo]: Copies of the segment entries.
+        """
+        with self._lock:
+            return [segment.model_copy() for segment in self._manifest.segments]
+
+    def segments_for_range(
+        self, since: Optional[float] = None, until: Optional[float] = None
+    ) -> List[SegmentInfo]:
+        """
+        Returns the segments that may hold records in a time range.
+
+        Args:
+            since (Optional[float]): Inclusive lower bound (epoch seconds).
+            until (Optional[float]): Inclusive upper bound (epoch seconds).
+
+        Returns:
+            List[SegmentInfo]: Matching segments, oldest first.
+        """
+        return [
+            segment
+            for segment in self.segments()
+            if segment.lines
+            and (since is None or segment.last_ts >= since)
+            and (until is None or segment.first_ts <= until)
+        ]
+
+    def add_segment(
+        self, start_offset: int, segment_format: str = "jsonl"
+    ) -> SegmentInfo:
+        """
+        Registers a new active segment and persists the manifest.
+
+        Args:
+            start_offset (int): Logical offset of the segment's first record.
+            segment_format (str): Encoding of the segment's records.
+
+        Returns:
+            SegmentInfo: The new segment entry.
+        """
+        with self._lock:
+            segment_id = self._manifest.next_id
+            segment = SegmentInfo(
+                id=segment_id,
+                file=f"segment-{segment_id:012d}{SEGMENT_EXTENSIONS[segment_format]}",
+                format=segment_format,
+                created=time.time(),
+                start_offset=start_offset,
+                end_offset=start_offset,
+            )
+            self._manifest.next_id += 1
+            self._manifest.segments.append(segment)
+            self._save()
+            return segment.model_copy()
+
+    def update(self, segment: SegmentInfo):
+        """
+        Replaces a segment entry and persists the manifest.
+
+        Args:
+            segment (SegmentInfo): The updated entry, matched by id.
+        """
+        with self._lock:
+            self._manifest.segments = [
+                segment if existing.id == segment.id else existing
+                for existing in self._manifest.segments
+            ]
+            self._save()
+
+    def remove(self, segment_ids: List[int]):
+        """
+        Drops segment entries and persists the manifest.
+
+        Args:
+            segment_ids (List[int]): Ids of the segments to drop.
+        """
+        with self._lock:
+            self._manifest.segments = [
+                segment
+                for segment in self._manifest.segments
+                if segment.id not in segment_ids
+            ]
+            self._save()
+
+    def _save(self):
+        """
+        Atomically writes the manifest. The caller must hold the lock.
+        """
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as manifest_file:
+            manifest_file.write(self._manifest.model_dump_json(indent=2))
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+        os.replace(temp_path, self.path)
+
+
+def write_index(directory: str, file_name: str, entries: List[IndexEntry]):
+    """
+    Atomically writes the sparse index of a segment file.
+
+    The index lives next to the segment as `<file_name>.idx`.
+
+    Args:
+        directory (str): The directory holding the segment.
+        file_name (str): The segment's file name.
+        entries (List[IndexEntry]): The index entries, in file order.
+    """
+    path = os.path.join(directory, file_name + ".idx")
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as index_file:
+        index_file.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in entries))
+        index_file.flush()
+        os.fsync(index_file.fileno())
+    os.replace(temp_path, path)
+
+
+def read_index(directory: str, segment: SegmentInfo) -> List[IndexEntry]:
+    """
+    Reads the sparse index of a segment.
+
+    Segments without an index are described by a single entry covering the
+    whole file.
+
+    Args:
+        directory (str): The directory holding the segment.
+        segment (SegmentInfo): The segment whose index to read.
+
+    Returns:
+        List[IndexEntry]: The index entries, in file order.
+    """
+    try:
+        with open(os.path.join(directory, segment.file + ".idx"), "rb") as index_file:
+            entries = list(INDEX_ENTRY.iter_unpack(index_file.read()))
+    except FileNotFoundError:
+        entries = []
+    return entries or [(segment.first_ts or 0.0, 0, 0)]
+
+
+def iter_segment_records(directory: str, segment: SegmentInfo) -> Iterator[dict]:
+    """
+    Yields the decoded records of a whole segment, decompressing it if needed.
+
+    Args:
+        directory (str): The directory holding the segment.
+        segment (SegmentInfo): The segment to read.
+
+    Yields:
+        dict: Each record, in storage order.
+    """
+    path = os.path.join(directory, segment.file)
+    with open_segment(path, segment.compression) as segment_file:
+        data = segment_file.read()
+    for _, raw in iter_frames(data, 0, len(data), 0, segment.format):
+        yield decode_record(raw, segment.format)
+
+
+def recover_segment(
+    directory: str, segment: SegmentInfo, index_interval: int
+) -> SegmentInfo:
+    """
+    Rebuilds the statistics and index of a segment left active by a previous
+    run.
+
+    A torn trailing record is truncated.
+
+    Args:
+        directory (str): The directory holding the segment.
+        segment (SegmentInfo): The active segment entry.
+        index_interval (int): Minimum number of bytes between index entries.
+
+    Returns:
+        SegmentInfo: The entry, sealed and with recomputed statistics.
+    """
+    path = os.path.join(directory, segment.file)
+    size = lines = 0
+    first_ts = last_ts = None
+    index: List[IndexEntry] = []
+    if os.path.exists(path):
+        with open(path, "rb+") as segment_file:
+            data = segment_file.read()
+            for offset, raw in iter_frames(data, 0, len(data), 0, segment.format):
+                ts = decode_record(raw, segment.format)["ts"]
+                if not index or offset - index[-1][1] >= index_interval:
+                    index.append((ts, offset, offset))
+                first_ts = ts if first_ts is None else first_ts
+                last_ts = ts
+                lines += 1
+                size = offset + len(raw) + (1 if segment.format == "jsonl" else 4)
+            segment_file.truncate(size)
+        write_index(directory, segment.file, index)
+    return segment.model_copy(
+        update={
+            "state": SEGMENT_SEALED,
+            "first_ts": first_ts,
+            "last_ts": last_ts,
+            "lines": lines,
+            "end_offset": segment.start_offset + size,
+            "disk_bytes": size,
+        }
+    )
+
+
+def compress_segment(
+    directory: str, segment: SegmentInfo, compression: str
+) -> SegmentInfo:
+    """
+    Compresses a sealed segment into a new file.
+
+    Every block between two index entries is compressed independently and
+    the index is rewritten with the compressed offsets, so readers can seek
+    straight to the block holding a timestamp. The compressed file is written
+    under a temporary name and renamed once it is complete, so an interrupted
+    compression leaves the sealed segment intact.
+
+    Args:
+        directory (str): The directory holding the segment.
+        segment (SegmentInfo): The sealed segment.
+        compression (str): "gzip" or "zstd".
+
+    Returns:
+        SegmentInfo: The entry describing the compressed segment.
+    """
+    source_path = os.path.join(directory, segment.file)
+    file_name = segment.file + COMPRESSION_SUFFIXES[compression]
+    target_path = os.path.join(directory, file_name)
+    temp_path = target_path + ".tmp"
+    index = read_index(directory, segment)
+    block_ends = [raw_offset for _, raw_offset, _ in index[1:]] + [segment.disk_bytes]
+    compressed_index: List[IndexEntry] = []
+    with open(source_path, "rb") as source, open(temp_path, "wb") as target:
+        for (ts, raw_offset, _), block_end in zip(index, block_ends):
+            source.seek(raw_offset)
+            block = source.read(block_end - raw_offset)
+            compressed_index.append((ts, raw_offset, target.tell()))
+            target.write(compress_block(block, compression))
+        target.flush()
+        os.fsync(target.fileno())
+    write_index(directory, file_name, compressed_index)
+    os.replace(temp_path, target_path)
+    return segment.model_copy(
+        update={
+            "file": file_name,
+            "state": SEGMENT_COMPRESSED,
+            "compression": compression,
+            "disk_bytes": os.path.getsize(target_path),
+        }
+    )
+
+
+def remove_segment_file(directory: str, file_name: str):
+    """
+    Deletes a segment file and its index if they still exist.
+
+    Args:
+        directory (str): The directory holding the segment.
+        file_name (str): The segment's file name.
+    """
+    for path in (file_name, file_name + ".idx"):
+        try:
+            os.remove(os.path.join(directory, path))
+        except FileNotFoundError:
+            pass
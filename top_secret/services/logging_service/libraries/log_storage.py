@@ -0,0 +1,526 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Callable, Iterable, List, Optional
+from libraries.log_records import check_segment_format, encode_record
+from libraries.log_segments import (
+    SEGMENT_ACTIVE,
+    SEGMENT_SEALED,
+    IndexEntry,
+    SegmentInfo,
+    SegmentManifest,
+    check_compression,
+    compress_segment,
+    read_index,
+    recover_segment,
+    remove_segment_file,
+    write_index,
+)
+
+DURABILITY_MODES = ("buffered", "flush", "fsync")
+
+
+class LogStorage:
+    """
+    Manages the storage of log messages in rotating segments using group commit.
+
+    Messages handed to `store` are queued in memory and drained by a single
+    background writer task. The writer keeps one long-lived handle on the
+    active segment and writes every message accumulated since its last pass
+    with a single `write` call (followed by one `flush`/`fsync`, depending on
+    durability), so the cost of a syscall is shared by the whole batch.
+
+    The active segment is sealed once it reaches `segment_max_bytes` or
+    `segment_max_age`. A separate maintenance task compresses sealed segments
+    and enforces retention, so the write path never waits on either. Segment
+    time ranges, offsets and line counts are recorded in a manifest, and each
+    segment carries a sparse timestamp-to-offset index written every
+    `index_interval` bytes.
+
+    Attributes:
+        log_directory (str): Directory holding the segments and the manifest.
+        flush_interval (float): Maximum number of seconds a message waits in
+            the queue before its batch is written.
+        max_batch_size (int): Number of queued messages that triggers a write
+            without waiting for the flush interval.
+        durability (str): One of "buffered" (leave data in the file buffer),
+            "flush" (flush to the OS after each batch) or "fsync" (fsync after
+            each batch).
+        segment_max_bytes (int): Size at which the active segment is sealed.
+        segment_max_age (float): Age in seconds at which the active segment is
+            sealed.
+        compression (str): "gzip", "zstd" or "none" for sealed segments.
+        retention_max_age (float): Segments whose newest record is older than
+            this many seconds are deleted; 0 disables the limit.
+        retention_max_bytes (int): Oldest segments are deleted while the total
+            size on disk exceeds this many bytes; 0 disables the limit.
+        maintenance_interval (float): Seconds between maintenance passes.
+        index_interval (int): Minimum number of bytes between index entries.
+        segment_format (str): Encoding of new segments: "jsonl" (one JSON
+            object per line) or "binary" (length-prefixed frames).
+        manifest (SegmentManifest): The manifest of the segments.
+        dropped (int): Records skipped because they could not be encoded.
+    """
+
+    def __init__(
+        self,
+        log_directory: str,
+        flush_interval: float = 0.05,
+        max_batch_size: int = 1000,
+        durability: str = "flush",
+        segment_max_bytes: int = 64 * 1024 * 1024,
+        segment_max_age: float = 3600,
+        compression: str = "gzip",
+        retention_max_age: float = 0,
+        retention_max_bytes: int = 0,
+        maintenance_interval: float = 5,
+        index_interval: int = 64 * 1024,
+        segment_format: str = "jsonl",
+    ):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(
+                f"durability must be one of {DURABILITY_MODES}, got {durability!r}"
+            )
+        check_compression(compression)
+        check_segment_format(segment_format)
+        self.log_directory = log_directory
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+        self.durability = durability
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self.compression = compression
+        self.retention_max_age = retention_max_age
+        self.retention_max_bytes = retention_max_bytes
+        self.maintenance_interval = maintenance_interval
+        self.index_interval = index_interval
+        self.segment_format = segment_format
+        self.manifest = SegmentManifest(log_directory)
+        self._maintenance_lock = threading.Lock()
+        self._pending: List[dict] = []
+        self._last_ts = 0.0
+        self._pending_done: Optional[asyncio.Future] = None
+        self._inflight_done: Optional[asyncio.Future] = None
+        self._listeners: List[Callable[[List[dict]], None]] = []
+        self._active: Optional[SegmentInfo] = None
+        self._index: List[IndexEntry] = []
+        self._file = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._maintenance_wakeup: Optional[asyncio.Event] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._maintenance_task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.dropped = 0
+
+    @property
+    def wait_for_commit(self) -> bool:
+        """
+        Whether callers should wait for their batch to be written before
+        acknowledging a message.
+
+        Returns:
+            bool: True when durability is "fsync".
+        """
+        return self.durability == "fsync"
+
+    @property
+    def end_offset(self) -> int:
+        """
+        Logical offset just past the last written record.
+
+        Returns:
+            int: The offset; listeners see the offset just past their batch.
+        """
+        if self._active is not None:
+            return self._active.end_offset
+        segments = self.manifest.segments()
+        return segments[-1].end_offset if segments else 0
+
+    async def start(self):
+        """
+        Recovers the segments of a previous run, opens a new active segment
+        and starts the writer and maintenance tasks.
+        """
+        if self._writer_task is not None:
+            return
+        await asyncio.to_thread(self._open)
+        self._wakeup = asyncio.Event()
+        if self._pending:
+            self._wakeup.set()
+        self._maintenance_wakeup = asyncio.Event()
+        self._maintenance_wakeup.set()
+        self._stopping = False
+        self._writer_task = asyncio.create_task(self._run())
+        self._maintenance_task = asyncio.create_task(self._maintain())
+
+    async def stop(self):
+        """
+        Writes every queued message, stops the background tasks and closes the
+        active segment.
+        """
+        if self._writer_task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._maintenance_wakeup.set()
+        await self._writer_task
+        await self._maintenance_task
+        self._writer_task = self._maintenance_task = None
+        await asyncio.to_thread(self._close_file)
+
+    def store(self, message: str, **attributes):
+        """
+        Queues a log message for the background writer.
+
+        Args:
+            message (str): The log message to be stored.
+            **attributes: Optional record attributes, e.g. service and level.
+
+        Note:
+            This method never touches the file; it must be called from the
+            event loop the storage was started on.
+        """
+        self.store_records([{"message": message, **attributes}])
+
+    def store_records(self, records: Iterable[dict]):
+        """
+        Queues several log records as one unit, stamping them with the
+        current time.
+
+        Timestamps never go backwards, so records are stored in time order
+        even if the system clock is adjusted.
+
+        Args:
+            records (Iterable[dict]): The records to be stored, in order. Each
+             holds a "message" and optional attributes.
+        """
+        timestamp = self._last_ts = max(time.time(), self._last_ts)
+        was_empty = not self._pending
+        self._pending.extend({"ts": timestamp, **record} for record in records)
+        if self._wakeup is not None and (
+            was_empty or len(self._pending) >= self.max_batch_size
+        ):
+            self._wakeup.set()
+
+    def add_listener(self, listener: Callable[[List[dict]], None]):
+        """
+        Registers a callback invoked on the event loop with every batch of
+        records once it has been written.
+
+        Listeners must not block; they run between the writer's batches.
+
+        Args:
+            listener (Callable[[List[dict]], None]): The callback.
+        """
+        self._listeners.append(listener)
+
+    async def flush(self):
+        """
+        Waits until every message queued so far has been written.
+
+        Raises:
+            Exception: The error of the batch containing those messages, if
+                it failed to write (usually an OSError).
+        """
+        if self._pending and self._writer_task is not None:
+            if self._pending_done is None:
+                self._pending_done = asyncio.get_running_loop().create_future()
+            done = self._pending_done
+        else:
+            done = self._inflight_done
+        if done is None:
+            return
+        error = await asyncio.shield(done)
+        if error is not None:
+            raise error
+
+    def segments(self) -> List[SegmentInfo]:
+        """
+        Returns the segments, with live statistics for the active one.
+
+        Returns:
+            List[SegmentInfo]: The segments, oldest first.
+        """
+        active = self._active
+        return [
+            active if active is not None and segment.id == active.id else segment
+            for segment in self.manifest.segments()
+        ]
+
+    def segment_index(self, segment: SegmentInfo) -> List[IndexEntry]:
+        """
+        Returns the sparse index of a segment.
+
+        Args:
+            segment (SegmentInfo): A segment returned by `segments`.
+
+        Returns:
+            List[IndexEntry]: The index entries, in file order.
+        """
+        if segment.state == SEGMENT_ACTIVE:
+            return list(self._index) or [(segment.first_ts or 0.0, 0, 0)]
+        return read_index(self.log_directory, segment)
+
+    async def _run(self):
+        """
+        Drains the queue in batches until the storage is stopped.
+        """
+        while not self._stopping:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._stopping and len(self._pending) < self.max_batch_size:
+                # Give concurrent requests a chance to join this batch.
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+            await self._commit_pending()
+            if self._should_rotate():
+                await asyncio.to_thread(self._rotate)
+                self._maintenance_wakeup.set()
+        await self._commit_pending()
+
+    async def _commit_pending(self):
+        """
+        Writes the currently queued messages as a single batch.
+
+        Waiters are resolved with None on success or with the raised
+        exception; any failure only loses this batch, the writer goes on.
+        """
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        done = self._pending_done or asyncio.get_running_loop().create_future()
+        self._pending_done = None
+        self._inflight_done = done
+        try:
+            written = await asyncio.to_thread(self._write_batch, batch)
+        except Exception as e:
+            print(f"Failed to write {len(batch)} log messages: {e}")
+            done.set_result(e)
+        else:
+            done.set_result(None)
+            if written:
+                self._notify_listeners(written)
+        finally:
+            self._inflight_done = None
+
+    def _notify_listeners(self, batch: List[dict]):
+        """
+        Hands a written batch to the registered listeners.
+
+        Args:
+            batch (List[dict]): The records that were written.
+        """
+        for listener in self._listeners:
+            try:
+                listener(batch)
+            except Exception as e:
+                print(f"Log listener {listener!r} failed: {e}")
+
+    def _write_batch(self, batch: List[dict]):
+        """
+        Appends a batch to the active segment and extends its sparse index.
+        Records that cannot be encoded are skipped, so they do not cost the
+        rest of the batch. Runs in a worker thread.
+
+        Args:
+            batch (List[dict]): The records to write.
+
+        Returns:
+            List[dict]: The records written.
+        """
+        offset = self._active.disk_bytes
+        last_indexed = self._index[-1][1] if self._index else None
+        written = []
+        lines = []
+        entries = []
+        for record in batch:
+            try:
+                line = encode_record(record, self._active.format)
+            except (ValueError, TypeError, OverflowError) as e:
+                print(f"Dropped a log record that cannot be encoded: {e}")
+                self.dropped += 1
+                continue
+            written.append(record)
+            if last_indexed is None or offset - last_indexed >= self.index_interval:
+                entries.append((record["ts"], offset, offset))
+                last_indexed = offset
+            lines.append(line)
+            offset += len(line)
+        if not written:
+            return written
+        data = b"".join(lines)
+        self._file.write(data)
+        if self.durability != "buffered":
+            self._file.flush()
+        if self.durability == "fsync":
+            os.fsync(self._file.fileno())
+        self._index.extend(entries)
+        self._active = self._active.model_copy(
+            update={
+                "first_ts": (
+                    written[0]["ts"]
+                    if self._active.first_ts is None
+                    else self._active.first_ts
+                ),
+                "last_ts": written[-1]["ts"],
+                "lines": self._active.lines + len(written),
+                "end_offset": self._active.end_offset + len(data),
+                "disk_bytes": self._active.disk_bytes + len(data),
+            }
+        )
+        return written
+
+    def _should_rotate(self) -> bool:
+        """
+        Checks whether the active segment is due to be sealed.
+
+        Returns:
+            bool: True if the segment is non-empty and too large or too old.
+        """
+        active = self._active
+        return active.lines > 0 and (
+            active.disk_bytes >= self.segment_max_bytes
+            or time.time() - active.created >= self.segment_max_age
+        )
+
+    def _open(self):
+        """
+        Loads the manifest, seals segments left active by a previous run and
+        opens a fresh active segment. Runs in a worker thread.
+        """
+        self.manifest.load()
+        for segment in self.manifest.segments():
+            if segment.state != SEGMENT_ACTIVE:
+                continue
+            recovered = recover_segment(
+                self.log_directory, segment, self.index_interval
+            )
+            if recovered.lines:
+                self.manifest.update(recovered)
+            else:
+                remove_segment_file(self.log_directory, segment.file)
+                self.manifest.remove([segment.id])
+        self._last_ts = max(
+            [self._last_ts]
+            + [s.last_ts for s in self.manifest.segments() if s.last_ts is not None]
+        )
+        for file_name in os.listdir(self.log_directory):
+            if file_name.endswith(".tmp"):
+                remove_segment_file(self.log_directory, file_name)
+        self._open_segment()
+
+    def _open_segment(self):
+        """
+        Registers a new active segment and opens its file for appending.
+        """
+        segments = self.manifest.segments()
+        start_offset = segments[-1].end_offset if segments else 0
+        self._active = self.manifest.add_segment(start_offset, self.segment_format)
+        self._index = []
+        self._file = open(os.path.join(self.log_directory, self._active.file), "ab")
+
+    def _rotate(self):
+        """
+        Seals the active segment and opens the next one. Runs in a worker thread.
+        """
+        self._close_file()
+        write_index(self.log_directory, self._active.file, self._index)
+        self.manifest.update(self._active.model_copy(update={"state": SEGMENT_SEALED}))
+        self._open_segment()
+
+    def _close_file(self):
+        """
+        Flushes, syncs and closes the active segment's file handle.
+        """
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+
+    async def _maintain(self):
+        """
+        Periodically seals an aged active segment, compresses sealed segments
+        and enforces retention until the storage is stopped.
+        """
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(
+                    self._maintenance_wakeup.wait(), self.maintenance_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._maintenance_wakeup.clear()
+            if self._stopping:
+                break
+            if self._should_rotate():
+                # Only the writer task touches the active segment.
+                self._wakeup.set()
+            try:
+                await asyncio.to_thread(self._compress_sealed)
+                await asyncio.to_thread(self._enforce_retention)
+            except OSError as e:
+                print(f"Log segment maintenance failed: {e}")
+
+    def _compress_sealed(self):
+        """
+        Compresses every sealed segment. Runs in a worker thread.
+        """
+        if self.compression == "none":
+            return
+        with self._maintenance_lock:
+            for segment in self.manifest.segments():
+                if self._stopping:
+                    return
+                if segment.state != SEGMENT_SEALED:
+                    continue
+                compressed = compress_segment(
+                    self.log_directory, segment, self.compression
+                )
+                self.manifest.update(compressed)
+                remove_segment_file(self.log_directory, segment.file)
+
+    def _enforce_retention(self):
+        """
+        Deletes the oldest inactive segments that exceed the retention limits.
+        Runs in a worker thread.
+        """
+        with self._maintenance_lock:
+            self._delete_expired(self.segments())
+
+    def _delete_expired(self, segments: List[SegmentInfo]):
+        """
+        Deletes the segments that exceed the retention limits.
+
+        Args:
+            segments (List[SegmentInfo]): The current segments, oldest first.
+        """
+        expired = []
+        if self.retention_max_age:
+            cutoff = time.time() - self.retention_max_age
+            expired = [
+                segment
+                for segment in segments
+                if segment.state != SEGMENT_ACTIVE
+                and segment.last_ts is not None
+                and segment.last_ts < cutoff
+            ]
+        if self.retention_max_bytes:
+            total = sum(s.disk_bytes for s in segments if s not in expired)
+            for segment in segments:
+                if total <= self.retention_max_bytes:
+                    break
+                if segment.state == SEGMENT_ACTIVE or segment in expired:
+                    continue
+                expired.append(segment)
+                total -= segment.disk_bytes
+        if not expired:
+            return
+        self.manifest.remove([segment.id for segment in expired])
+        for segment in expired:
+            remove_segment_file(self.log_directory, segment.file)
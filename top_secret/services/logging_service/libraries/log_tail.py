@@ -0,0 +1,148 @@
+import asyncio
+from collections import deque
+from typing import Deque, List, Set, Tuple
+from libraries.log_query import LogQuery
+
+
+class TooManySubscribers(Exception):
+    """
+    Raised when the live tail already serves its maximum number of subscribers.
+    """
+
+
+class TailSubscription:
+    """
+    A live tail subscriber with a bounded queue of matching records.
+
+    When the subscriber falls behind, the oldest queued records are dropped
+    and counted instead of letting the queue grow, so a slow consumer skips
+    ahead rather than holding memory or slowing the writer down.
+
+    Attributes:
+        query (LogQuery): The filters records must match.
+        queue_size (int): Maximum number of records queued for the subscriber.
+    """
+
+    def __init__(self, query: LogQuery, queue_size: int):
+        self.query = query
+        self.queue_size = queue_size
+        self._queue: Deque[dict] = deque()
+        self._dropped = 0
+        self._ready = asyncio.Event()
+
+    def push(self, records: List[dict]):
+        """
+        Queues the records matching the subscription's filters.
+
+        Args:
+            records (List[dict]): Newly stored records.
+        """
+        for record in records:
+            if not self.query.matches(record):
+                continue
+            if len(self._queue) == self.queue_size:
+                self._queue.popleft()
+                self._dropped += 1
+            self._queue.append(record)
+        if self._queue:
+            self._ready.set()
+
+    async def next_batch(self, timeout: float) -> Tuple[List[dict], int]:
+        """
+        Waits for queued records and takes all of them.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait.
+
+        Returns:
+            Tuple[List[dict], int]: The queued records (empty on timeout) and
+            the number of records dropped since the previous call.
+        """
+        if not self._queue:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._ready.clear()
+        records = list(self._queue)
+        self._queue.clear()
+        dropped, self._dropped = self._dropped, 0
+        return records, dropped
+
+
+class LogTail:
+    """
+    Fans newly stored records out to live subscribers.
+
+    The most recent records are kept in a ring buffer so new subscribers start
+    with a short backlog.
+
+    Attributes:
+        backlog_size (int): Number of recent records kept in the ring buffer.
+        queue_size (int): Maximum number of records queued per subscriber.
+        max_subscribers (int): Maximum number of concurrent subscribers.
+    """
+
+    def __init__(
+        self,
+        backlog_size: int = 1000,
+        queue_size: int = 1000,
+        max_subscribers: int = 100,
+    ):
+        self.backlog_size = backlog_size
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._recent: Deque[dict] = deque(maxlen=backlog_size)
+        self._subscribers: Set[TailSubscription] = set()
+
+    @property
+    def full(self) -> bool:
+        """
+        Returns whether `max_subscribers` is reached.
+        """
+        return len(self._subscribers) >= self.max_subscribers
+
+    def publish(self, records: List[dict]):
+        """
+        Records newly stored records and hands them to every subscriber.
+
+        Args:
+            records (List[dict]): The records, in storage order.
+        """
+        self._recent.extend(records)
+        for subscription in self._subscribers:
+            subscription.push(records)
+
+    def subscribe(self, query: LogQuery, backlog: int = 100) -> TailSubscription:
+        """
+        Registers a subscriber, queueing up to `backlog` recent matching records.
+
+        Args:
+            query (LogQuery): The filters records must match.
+            backlog (int): Number of recent matching records to start with.
+
+        Returns:
+            TailSubscription: The new subscription.
+
+        Raises:
+            TooManySubscribers: If `max_subscribers` is reached.
+        """
+        if self.full:
+            raise TooManySubscribers(
+                f"The live tail is limited to {self.max_subscribers} subscribers"
+            )
+        subscription = TailSubscription(query, self.queue_size)
+        if backlog > 0:
+            recent = [record for record in self._recent if query.matches(record)]
+            subscription.push(recent[-backlog:])
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: TailSubscription):
+        """
+        Removes a subscriber.
+
+        Args:
+            subscription (TailSubscription): The subscription to remove.
+        """
+        self._subscribers.discard(subscription)
@@ -1,13 +1,64 @@
-from fastapi import FastAPI, status
-from pydantic import BaseModel, Field
-import threading
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Annotated, Dict, List, Literal, Optional
+from fastapi import (
+    FastAPI,
+    HTTPException,
+    Query,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from fastapi.exception_handlers import request_validation_exception_handler
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+from libraries.log_datagram import LogDatagramServer, parse_udp_address
+from libraries.log_query import LogQuery, LogQueryResult, LogReader
+from libraries.log_rollups import LogRollups, LogStatsResult
+from libraries.log_storage import LogStorage
+from libraries.log_tail import LogTail, TooManySubscribers
+import asyncio
+import json
+import math
 import os
+import time
+import zlib
 
-app = FastAPI()
-log_file_path = "./logs/services.log"  # Adjusted to use a relative path
+log_directory = "./logs/segments"  # Adjusted to use a relative path
 
-# Ensure thread-safe file writing
-log_file_lock = threading.Lock()
+# Group-commit settings for the background log writer
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.05"))
+LOG_MAX_BATCH_SIZE = int(os.getenv("LOG_MAX_BATCH_SIZE", "1000"))
+LOG_DURABILITY = os.getenv("LOG_DURABILITY", "flush")
+
+# Segment rotation, compression and retention settings
+LOG_SEGMENT_MAX_BYTES = int(os.getenv("LOG_SEGMENT_MAX_BYTES", str(64 * 1024 * 1024)))
+LOG_SEGMENT_MAX_AGE = float(os.getenv("LOG_SEGMENT_MAX_AGE", "3600"))
+LOG_COMPRESSION = os.getenv("LOG_COMPRESSION", "gzip")
+LOG_SEGMENT_FORMAT = os.getenv("LOG_SEGMENT_FORMAT", "jsonl")
+LOG_RETENTION_MAX_AGE = float(os.getenv("LOG_RETENTION_MAX_AGE", str(7 * 24 * 3600)))
+LOG_RETENTION_MAX_BYTES = int(os.getenv("LOG_RETENTION_MAX_BYTES", "0"))
+
+# Live tail settings
+LOG_TAIL_BACKLOG_SIZE = int(os.getenv("LOG_TAIL_BACKLOG_SIZE", "1000"))
+LOG_TAIL_QUEUE_SIZE = int(os.getenv("LOG_TAIL_QUEUE_SIZE", "1000"))
+LOG_TAIL_MAX_SUBSCRIBERS = int(os.getenv("LOG_TAIL_MAX_SUBSCRIBERS", "100"))
+LOG_TAIL_HEARTBEAT = float(os.getenv("LOG_TAIL_HEARTBEAT", "15"))
+
+# Rollup settings for /logs/stats
+LOG_STATS_BUCKET_SECONDS = int(os.getenv("LOG_STATS_BUCKET_SECONDS", "60"))
+LOG_STATS_RETENTION = float(os.getenv("LOG_STATS_RETENTION", str(7 * 24 * 3600)))
+LOG_STATS_SAVE_INTERVAL = float(os.getenv("LOG_STATS_SAVE_INTERVAL", "30"))
+
+# Datagram ingestion listeners ("host:port" / socket path); empty (the
+# default) disables them
+LOG_UDP_ADDRESS = os.getenv("LOG_UDP_ADDRESS", "")
+LOG_UNIX_SOCKET = os.getenv("LOG_UNIX_SOCKET", "")
+
+# Upper bound for a (decompressed) bulk request body
+LOG_BULK_MAX_BYTES = int(os.getenv("LOG_BULK_MAX_BYTES", str(16 * 1024 * 1024)))
 
 
 class LogMessage(BaseModel):
@@ -16,30 +67,102 @@ class LogMessage(BaseModel):
 
     Attributes:
         message (str): The log message content. Must be at least 1 character long.
+        service (Optional[str]): The name of the service emitting the message.
+        level (Optional[str]): The severity of the message, e.g. "INFO".
+        trace_id (Optional[str]): Identifier correlating messages of one request.
+        timestamp (Optional[float]): When the event happened (epoch seconds),
+            stored next to the ingest time.
+        fields (Optional[Dict[str, float]]): Finite numeric measurements,
+            e.g. {"duration_ms": 12.5}.
     """
 
     message: str = Field(..., min_length=1)
+    service: Optional[str] = Field(None, max_length=256)
+    level: Optional[str] = Field(None, max_length=256)
+    trace_id: Optional[str] = Field(None, max_length=256)
+    timestamp: Optional[float] = Field(None, allow_inf_nan=False)
+    fields: Optional[
+        Dict[
+            Annotated[str, Field(max_length=256)],
+            Annotated[float, Field(allow_inf_nan=False)],
+        ]
+    ] = Field(None, max_length=256)
+
+
+log_message_list = TypeAdapter(List[LogMessage])
 
 
-# LogStorage: Handles the storage of log messages.
-class LogStorage:
+def read_bulk_body(body: bytes, content_encoding: str) -> bytes:
     """
-    Manages the storage of log messages in a file.
+    Decompresses a bulk request body if needed, enforcing the size limit.
+
+    Args:
+        body (bytes): The raw request body.
+        content_encoding (str): The Content-Encoding header of the request.
+
+    Returns:
+        bytes: The decompressed body.
+
+    Raises:
+        HTTPException: If the encoding is unsupported, the gzip stream is
+         corrupt or the body exceeds LOG_BULK_MAX_BYTES.
     """
+    encoding = content_encoding.strip().lower()
+    if encoding in ("", "identity"):
+        data = body
+    elif encoding == "gzip":
+        decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+        try:
+            data = decompressor.decompress(body, LOG_BULK_MAX_BYTES + 1)
+        except zlib.error as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid gzip body: {e}",
+            ) from e
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported Content-Encoding: {content_encoding}",
+        )
+    if len(data) > LOG_BULK_MAX_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Bulk body exceeds {LOG_BULK_MAX_BYTES} bytes",
+        )
+    return data
 
-    def store(self, message: str):
-        """
-        Stores a log message in the log file.
 
-        Args:
-            message (str): The log message to be stored.
+def parse_bulk_messages(data: bytes, content_type: str) -> List[LogMessage]:
+    """
+    Parses and validates a bulk body in a single pass.
 
-        Note:
-            This method uses a thread-safe approach to write to the log file.
-        """
-        with log_file_lock:
-            with open(log_file_path, "a") as log_file:
-                log_file.write(message + "\n")
+    A body sent as `application/x-ndjson` (or `application/jsonl`) holds one
+    JSON log message per line; any other body must be a JSON array of log
+    messages.
+
+    Args:
+        data (bytes): The decompressed request body.
+        content_type (str): The Content-Type header of the request.
+
+    Returns:
+        List[LogMessage]: The validated log messages, in order.
+
+    Raises:
+        HTTPException: If the body is not valid JSON.
+        RequestValidationError: If any of the messages is invalid.
+    """
+    media_type = content_type.split(";")[0].strip().lower()
+    try:
+        if media_type in ("application/x-ndjson", "application/jsonl"):
+            items = [json.loads(line) for line in data.splitlines() if line.strip()]
+            return log_message_list.validate_python(items)
+        return log_message_list.validate_json(data)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False)) from e
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid JSON: {e}"
+        ) from e
 
 
 # LogController: Interface for handling log messages.
@@ -61,19 +184,129 @@ class LogController:
         """
         self.log_storage = log_storage
 
-    async def log_message(self, message: str):
+    async def log_message(self, message: str, **attributes):
         """
         Processes and stores a log message.
 
         Args:
             message (str): The log message to be processed and stored.
+            **attributes: Optional record attributes, e.g. service and level.
 
         Returns:
             bool: True if the log message was successfully stored.
         """
-        self.log_storage.store(message)
+        self.log_storage.store(message, **attributes)
+        if self.log_storage.wait_for_commit:
+            await self.log_storage.flush()
         return True
 
+    async def log_messages(self, messages: List[LogMessage]):
+        """
+        Processes and stores a batch of log messages as one unit.
+
+        Args:
+            messages (List[LogMessage]): The log messages to be stored, in order.
+
+        Returns:
+            int: The number of log messages stored.
+        """
+        self.log_storage.store_records(
+            [message.model_dump(exclude_none=True) for message in messages]
+        )
+        if self.log_storage.wait_for_commit:
+            await self.log_storage.flush()
+        return len(messages)
+
+
+log_storage = LogStorage(
+    log_directory,
+    flush_interval=LOG_FLUSH_INTERVAL,
+    max_batch_size=LOG_MAX_BATCH_SIZE,
+    durability=LOG_DURABILITY,
+    segment_max_bytes=LOG_SEGMENT_MAX_BYTES,
+    segment_max_age=LOG_SEGMENT_MAX_AGE,
+    compression=LOG_COMPRESSION,
+    segment_format=LOG_SEGMENT_FORMAT,
+    retention_max_age=LOG_RETENTION_MAX_AGE,
+    retention_max_bytes=LOG_RETENTION_MAX_BYTES,
+)
+log_controller = LogController(log_storage)
+log_reader = LogReader(log_storage)
+log_tail = LogTail(
+    backlog_size=LOG_TAIL_BACKLOG_SIZE,
+    queue_size=LOG_TAIL_QUEUE_SIZE,
+    max_subscribers=LOG_TAIL_MAX_SUBSCRIBERS,
+)
+log_storage.add_listener(log_tail.publish)
+log_rollups = LogRollups(
+    log_directory,
+    bucket_seconds=LOG_STATS_BUCKET_SECONDS,
+    retention=LOG_STATS_RETENTION,
+    save_interval=LOG_STATS_SAVE_INTERVAL,
+)
+log_storage.add_listener(
+    lambda records: log_rollups.add(records, log_storage.end_offset)
+)
+log_datagram_server = LogDatagramServer(
+    log_storage,
+    udp_address=parse_udp_address(LOG_UDP_ADDRESS),
+    unix_path=LOG_UNIX_SOCKET or None,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Starts the background log writer, brings the rollups up to date and starts
+    the datagram listeners, if configured and their sockets can be bound. On
+    shutdown, flushes the writer and saves the
+    rollups.
+
+    Args:
+        app (FastAPI): The application being served.
+    """
+    await log_storage.start()
+    await asyncio.to_thread(log_rollups.load)
+    await asyncio.to_thread(
+        log_rollups.catch_up,
+        log_reader.iter_raw_records(cursor=log_rollups.offset),
+        log_storage.end_offset,
+    )
+    await log_rollups.start()
+    try:
+        await log_datagram_server.start()
+    except OSError as e:
+        # E.g. the port is taken by another replica; HTTP ingestion goes on.
+        print(f"Failed to start the datagram listeners: {e}")
+        await log_datagram_server.stop()
+    yield
+    await log_datagram_server.stop()
+    await log_storage.stop()
+    await log_rollups.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    """
+    Answers invalid requests like FastAPI does, showing the inputs JSON cannot
+    represent (infinite and NaN numbers) as strings.
+    """
+    errors = [
+        (
+            {**error, "input": str(error["input"])}
+            if isinstance(error.get("input"), float)
+            and not math.isfinite(error["input"])
+            else error
+        )
+        for error in exc.errors()
+    ]
+    return await request_validation_exception_handler(
+        request, RequestValidationError(errors)
+    )
+
 
 # LogAPI: FastAPI route for the Logging Microservice.
 @app.post("/log", status_code=status.HTTP_200_OK)
@@ -89,18 +322,314 @@ async def log_message(log_message: LogMessage):
     Returns:
         dict: A dictionary with the status of the logging operation.
     """
-    log_storage = LogStorage()
-    log_controller = LogController(log_storage)
-    await log_controller.log_message(log_message.message)
+    await log_controller.log_message(
+        log_message.message,
+        **log_message.model_dump(exclude={"message"}, exclude_none=True),
+    )
     return {"status": "success"}
 
 
-# Ensure the log file exists
-if not os.path.exists(log_file_path):
+@app.post("/log/bulk", status_code=status.HTTP_200_OK)
+async def log_messages_bulk(request: Request):
+    """
+    Endpoint for logging many messages in one request.
+
+    Accepts either a JSON array of log messages or an NDJSON body
+    (`Content-Type: application/x-ndjson`), optionally compressed with
+    `Content-Encoding: gzip`. The whole batch is validated before anything is
+    stored, so a batch is either accepted or rejected as a unit.
+
+    Args:
+        request (Request): The incoming request carrying the batch.
+
+    Returns:
+        dict: The status of the operation and the number of accepted messages.
+    """
+    data = read_bulk_body(
+        await request.body(), request.headers.get("content-encoding", "")
+    )
+    messages = parse_bulk_messages(data, request.headers.get("content-type", ""))
+    accepted = await log_controller.log_messages(messages)
+    return {"status": "success", "accepted": accepted}
+
+
+def to_timestamp(value: Optional[datetime]) -> Optional[float]:
+    """
+    Converts a query datetime to epoch seconds, treating naive values as UTC.
+
+    Args:
+        value (Optional[datetime]): The datetime to convert.
+
+    Returns:
+        Optional[float]: The epoch timestamp, or None.
+    """
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+@app.get("/logs", response_model=LogQueryResult)
+async def query_logs(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    service: Optional[str] = None,
+    level: Optional[str] = None,
+    contains: Optional[str] = None,
+    regex: Optional[str] = None,
+    limit: int = 100,
+    cursor: Optional[int] = None,
+):
+    """
+    Endpoint for reading stored log records back.
+
+    Records are returned oldest first. `since` and `until` accept ISO 8601
+    datetimes or epoch seconds; pass the returned `next_cursor` as `cursor`
+    to fetch the next page.
+
+    Args:
+        since (Optional[datetime]): Only records at or after this time.
+        until (Optional[datetime]): Only records at or before this time.
+        service (Optional[str]): Only records from this service.
+        level (Optional[str]): Only records with this level.
+        contains (Optional[str]): Only records whose message contains this text.
+        regex (Optional[str]): Only records whose message matches this pattern.
+        limit (int): Maximum number of records to return (1-1000).
+        cursor (Optional[int]): Cursor returned by a previous query.
+
+    Returns:
+        LogQueryResult: The matching records and the cursor of the next page.
+    """
+    try:
+        query = LogQuery(
+            since=to_timestamp(since),
+            until=to_timestamp(until),
+            service=service,
+            level=level,
+            contains=contains,
+            regex=regex,
+            limit=limit,
+            cursor=cursor,
+        )
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False)) from e
+    return await asyncio.to_thread(log_reader.query, query)
+
+
+@app.get("/logs/stats", response_model=LogStatsResult)
+async def log_stats(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    service: Optional[str] = None,
+    level: Optional[str] = None,
+    field: Optional[str] = None,
+):
+    """
+    Endpoint for reading record counts and field histograms per time bucket.
+
+    The rollups are maintained as records are stored, so the cost of a
+    request follows the number of buckets in the range, not the log size.
+
+    Args:
+        since (Optional[datetime]): Start of the range; defaults to one hour
+            before `until`.
+        until (Optional[datetime]): End of the range; defaults to now.
+        service (Optional[str]): Only this service.
+        level (Optional[str]): Only this level.
+        field (Optional[str]): Only this numeric field's histograms.
+
+    Returns:
+        LogStatsResult: Counts per service and level, and field histograms, for
+        each non-empty bucket.
+    """
+    until_ts = to_timestamp(until) if until is not None else time.time()
+    since_ts = to_timestamp(since) if since is not None else until_ts - 3600
+    return log_rollups.stats(since_ts, until_ts, service, level, field)
+
+
+@app.get("/logs/export")
+async def export_logs(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    service: Optional[str] = None,
+    level: Optional[str] = None,
+    contains: Optional[str] = None,
+    regex: Optional[str] = None,
+    output_format: Literal["jsonl", "text"] = Query("jsonl", alias="format"),
+):
+    """
+    Endpoint for exporting every matching log record as a stream.
+
+    Whatever the segment format on disk, records are exported either as JSON
+    lines or as human-readable text lines.
+
+    Args:
+        since (Optional[datetime]): Only records at or after this time.
+        until (Optional[datetime]): Only records at or before this time.
+        service (Optional[str]): Only records from this service.
+        level (Optional[str]): Only records with this level.
+        contains (Optional[str]): Only records whose message contains this text.
+        regex (Optional[str]): Only records whose message matches this pattern.
+        output_format (str): "jsonl" or "text", passed as `format`.
+
+    Returns:
+        StreamingResponse: The exported records, oldest first.
+    """
+    try:
+        query = LogQuery(
+            since=to_timestamp(since),
+            until=to_timestamp(until),
+            service=service,
+            level=level,
+            contains=contains,
+            regex=regex,
+        )
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False)) from e
+    media_type = "application/x-ndjson" if output_format == "jsonl" else "text/plain"
+    return StreamingResponse(
+        log_reader.export(query, output_format), media_type=media_type
+    )
+
+
+def build_tail_query(
+    service: Optional[str],
+    level: Optional[str],
+    contains: Optional[str],
+    regex: Optional[str],
+) -> LogQuery:
+    """
+    Builds the filters of a live tail subscription.
+
+    Args:
+        service (Optional[str]): Only records from this service.
+        level (Optional[str]): Only records with this level.
+        contains (Optional[str]): Only records whose message contains this text.
+        regex (Optional[str]): Only records whose message matches this pattern.
+
+    Returns:
+        LogQuery: The filters.
+
+    Raises:
+        RequestValidationError: If the regex does not compile.
+    """
+    try:
+        return LogQuery(service=service, level=level, contains=contains, regex=regex)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False)) from e
+
+
+@app.get("/logs/tail")
+async def tail_logs_sse(
+    request: Request,
+    service: Optional[str] = None,
+    level: Optional[str] = None,
+    contains: Optional[str] = None,
+    regex: Optional[str] = None,
+    backlog: int = 100,
+):
+    """
+    Endpoint for following stored log records live as Server-Sent Events.
+
+    Each record is sent as a `data:` event. When the client falls behind, the
+    oldest pending records are skipped and a `dropped` event reports how many.
+
+    Args:
+        request (Request): The incoming request.
+        service (Optional[str]): Only records from this service.
+        level (Optional[str]): Only records with this level.
+        contains (Optional[str]): Only records whose message contains this text.
+        regex (Optional[str]): Only records whose message matches this pattern.
+        backlog (int): Number of recent matching records to start with.
+
+    Returns:
+        StreamingResponse: The `text/event-stream` response.
+
+    Raises:
+        HTTPException: If the live tail has too many subscribers.
+    """
+    query = build_tail_query(service, level, contains, regex)
+    if log_tail.full:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"The live tail is limited to {log_tail.max_subscribers} "
+            "subscribers",
+        )
+
+    async def events():
+        # Subscribing here rather than before the response starts means a
+        # client gone before the first event leaves no subscription behind.
+        try:
+            subscription = log_tail.subscribe(query, backlog)
+        except TooManySubscribers as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+            return
+        try:
+            while not await request.is_disconnected():
+                records, dropped = await subscription.next_batch(LOG_TAIL_HEARTBEAT)
+                if dropped:
+                    notice = json.dumps({"dropped": dropped})
+                    yield f"event: dropped\ndata: {notice}\n\n"
+                for record in records:
+                    yield f"data: {json.dumps(record, ensure_ascii=False)}\n\n"
+                if not records and not dropped:
+                    yield ": keep-alive\n\n"
+        finally:
+            log_tail.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.websocket("/logs/tail/ws")
+async def tail_logs_websocket(
+    websocket: WebSocket,
+    service: Optional[str] = None,
+    level: Optional[str] = None,
+    contains: Optional[str] = None,
+    regex: Optional[str] = None,
+    backlog: int = 100,
+):
     """
-    Ensures that the log file and its directory exist.
+    WebSocket endpoint for following stored log records live.
+
+    Each record is sent as a JSON text frame. When the client falls behind,
+    the oldest pending records are skipped and a `{"dropped": n}` frame
+    reports how many.
 
-    Creates the log file and its directory if they do not already exist.
+    Args:
+        websocket (WebSocket): The WebSocket connection object.
+        service (Optional[str]): Only records from this service.
+        level (Optional[str]): Only records with this level.
+        contains (Optional[str]): Only records whose message contains this text.
+        regex (Optional[str]): Only records whose message matches this pattern.
+        backlog (int): Number of recent matching records to start with.
     """
-    os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
-    open(log_file_path, "a").close()
+    try:
+        query = LogQuery(service=service, level=level, contains=contains, regex=regex)
+        subscription = log_tail.subscribe(query, backlog)
+    except (ValidationError, TooManySubscribers) as e:
+        await websocket.close(code=1008, reason=str(e)[:120])
+        return
+    await websocket.accept()
+
+    async def forward():
+        while True:
+            records, dropped = await subscription.next_batch(LOG_TAIL_HEARTBEAT)
+            if dropped:
+                await websocket.send_json({"dropped": dropped})
+            for record in records:
+                await websocket.send_text(json.dumps(record, ensure_ascii=False))
+
+    forwarder = asyncio.create_task(forward())
+    try:
+        # Incoming frames are ignored; receiving only detects the disconnect.
+        while not forwarder.done():
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        forwarder.cancel()
+        log_tail.unsubscribe(subscription)
@@ -1,4 +1,23 @@
 # Configuration settings for the application
 
+import os
+
 # URL for the logging service
-LOGGING_SERVICE_URL = "http://127.0.0.1:8002"
+LOGGING_SERVICE_URL = os.getenv("LOGGING_SERVICE_URL", "http://127.0.0.1:8002")
+
+# "http" (batched bulk requests) or "datagram" (one datagram per record)
+LOG_CLIENT_MODE = os.getenv("LOG_CLIENT_MODE", "http")
+# Datagram listener of the logging service: udp://host:port or unix:///path.
+# The service only listens if LOG_UDP_ADDRESS or LOG_UNIX_SOCKET is set.
+LOGGING_SERVICE_DATAGRAM_URL = os.getenv(
+    "LOGGING_SERVICE_DATAGRAM_URL", "udp://127.0.0.1:8002"
+)
+
+# Batching settings for the shared log client
+LOG_CLIENT_BATCH_SIZE = int(os.getenv("LOG_CLIENT_BATCH_SIZE", "500"))
+LOG_CLIENT_FLUSH_INTERVAL = float(os.getenv("LOG_CLIENT_FLUSH_INTERVAL", "0.5"))
+LOG_CLIENT_MAX_QUEUE_SIZE = int(os.getenv("LOG_CLIENT_MAX_QUEUE_SIZE", "10000"))
+# "drop_oldest" or "drop_newest" when the queue is full
+LOG_CLIENT_OVERFLOW = os.getenv("LOG_CLIENT_OVERFLOW", "drop_oldest")
+# Where batches go while the logging service is down; empty to drop them
+LOG_CLIENT_SPILL_PATH = os.getenv("LOG_CLIENT_SPILL_PATH", "./logs/log_spill.ndjson")
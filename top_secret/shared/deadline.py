@@ -0,0 +1,113 @@
+# End-to-end deadlines propagated between services
+
+import asyncio
+import json
+import time
+from typing import Optional
+
+# Milliseconds the caller still waits for the response. A duration rather
+# than a point in time, so the clocks of the hosts need not agree.
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+
+
+class Deadline:
+    """
+    A point in time after which the caller no longer waits for the result.
+
+    Attributes:
+        expires_at (float): The deadline (monotonic seconds).
+    """
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def from_header(cls, value: Optional[str]) -> Optional["Deadline"]:
+        """
+        Reads the deadline a caller sent in DEADLINE_HEADER.
+
+        Args:
+            value (Optional[str]): The header value.
+
+        Returns:
+            Optional[Deadline]: The deadline, or None if the header is
+            missing or malformed.
+        """
+        try:
+            return cls(float(value) / 1000)
+        except (TypeError, ValueError):
+            return None
+
+    def remaining(self) -> float:
+        """
+        Returns the seconds left, 0 once the deadline has passed.
+        """
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        """
+        Returns whether the deadline has passed.
+        """
+        return self.remaining() == 0
+
+    def header_value(self) -> str:
+        """
+        Returns the value of DEADLINE_HEADER to send downstream.
+        """
+        return str(int(self.remaining() * 1000))
+
+
+class DeadlineMiddleware:
+    """
+    Abandons the requests whose caller has given up.
+
+    A request carrying DEADLINE_HEADER is cancelled when its deadline passes
+    and answered with 504, or refused straight away if it has already
+    passed. Requests without the header are not limited. A response already
+    started (e.g. a stream) is cut off instead.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        value = headers.get(DEADLINE_HEADER.lower().encode())
+        deadline = Deadline.from_header(value.decode() if value else None)
+        if deadline is None:
+            await self.app(scope, receive, send)
+            return
+
+        started = False
+
+        async def send_tracking(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            if deadline.expired:
+                raise asyncio.TimeoutError
+            await asyncio.wait_for(
+                self.app(scope, receive, send_tracking), deadline.remaining()
+            )
+        except asyncio.TimeoutError:
+            if started:
+                return
+            body = json.dumps({"detail": "Deadline exceeded"}).encode()
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 504,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode()),
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": body})
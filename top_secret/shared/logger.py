@@ -1,16 +1,675 @@
+import asyncio
+import gzip
+import json
+import math
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
 import httpx
-from pydantic import BaseModel
-from config import LOGGING_SERVICE_URL  # Import the configuration
+from .config import (
+    LOG_CLIENT_BATCH_SIZE,
+    LOG_CLIENT_FLUSH_INTERVAL,
+    LOG_CLIENT_MAX_QUEUE_SIZE,
+    LOG_CLIENT_MODE,
+    LOG_CLIENT_OVERFLOW,
+    LOG_CLIENT_SPILL_PATH,
+    LOGGING_SERVICE_DATAGRAM_URL,
+    LOGGING_SERVICE_URL,
+)
+from .transport import service_routes
 
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest")
+CLIENT_MODES = ("http", "datagram")
 
-class LogMessage(BaseModel):
-    message: str
+# Datagram framing of the logging service (see its `log_datagram` module): the
+# byte 0x01, then frames of a u32 body length and a body made of the event
+# time, a flags byte, the optional u16-prefixed service, level and trace_id,
+# the u32-prefixed message and the optional numeric fields.
+DATAGRAM_BINARY = b"\x01"
+FRAME_LENGTH = struct.Struct("<I")
+BODY_HEAD = struct.Struct("<dB")
+STRING_LENGTH = struct.Struct("<H")
+MESSAGE_LENGTH = struct.Struct("<I")
+FLOAT = struct.Struct("<d")
+STRING_ATTRIBUTES = (("service", 0x01), ("level", 0x02), ("trace_id", 0x04))
+FIELDS_FLAG = 0x10
+# Longest attribute or field name, and most fields, the logging service takes
+MAX_ATTRIBUTE_LENGTH = 256
 
 
-def send_log(message: str):
-    log_message = LogMessage(message=message)
+class LogClient:
+    """
+    Ships log records to the logging service without blocking the caller.
+
+    `log` only appends the record to a bounded in-memory queue. A background
+    task sends the queue to the logging service's bulk endpoint in batches,
+    over one pooled keep-alive connection, so request handlers never wait on
+    the network.
+
+    When the logging service cannot be reached, batches are appended to a
+    local spill file and replayed, oldest first, once it answers again.
+
+    Attributes:
+        base_url (str): URL of the logging service.
+        service (Optional[str]): Service name attached to every record.
+        max_queue_size (int): Maximum number of records waiting to be sent.
+        batch_size (int): Maximum number of records per request.
+        flush_interval (float): Maximum number of seconds a record waits in the
+            queue before it is sent.
+        overflow (str): What `log` does when the queue is full: "drop_oldest"
+            or "drop_newest". Use `log_wait` to wait for room instead.
+        spill_path (Optional[str]): File receiving the batches that could not
+            be sent, or None to drop them.
+        spill_max_bytes (int): Size above which spilled batches are dropped.
+        retry_interval (float): Seconds to wait before contacting the logging
+            service again after a failure.
+        compress_min_bytes (int): Request bodies at least this large are
+            gzipped.
+        timeout (float): Timeout of each request, in seconds.
+        transport (Optional[httpx.AsyncBaseTransport]): Transport replacing the
+            network, e.g. to talk to an in-process app.
+        dropped (int): Number of records dropped so far.
+    """
+
+    def __init__(
+        self,
+        base_url: str = LOGGING_SERVICE_URL,
+        service: Optional[str] = None,
+        max_queue_size: int = LOG_CLIENT_MAX_QUEUE_SIZE,
+        batch_size: int = LOG_CLIENT_BATCH_SIZE,
+        flush_interval: float = LOG_CLIENT_FLUSH_INTERVAL,
+        overflow: str = LOG_CLIENT_OVERFLOW,
+        spill_path: Optional[str] = LOG_CLIENT_SPILL_PATH,
+        spill_max_bytes: int = 64 * 1024 * 1024,
+        retry_interval: float = 5.0,
+        compress_min_bytes: int = 4096,
+        timeout: float = 5.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"overflow must be one of {OVERFLOW_POLICIES}, got {overflow!r}"
+            )
+        self.base_url = base_url.rstrip("/")
+        self.service = service
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.spill_path = spill_path or None
+        self.spill_max_bytes = spill_max_bytes
+        self.retry_interval = retry_interval
+        self.compress_min_bytes = compress_min_bytes
+        self.timeout = timeout
+        self.transport = transport
+        self.dropped = 0
+        self._queue: Deque[dict] = deque()
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._done = 0
+        self._waiters: List[Tuple[int, asyncio.Future]] = []
+        self._retry_at = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._room: Optional[asyncio.Event] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def start(self):
+        """
+        Opens the pooled HTTP connection and starts the sender task.
+
+        Records logged before `start` are kept and sent once it runs.
+        """
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._room = asyncio.Event()
+        limits = httpx.Limits(max_connections=1, max_keepalive_connections=1)
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            # Reaches the logging service in process when it is mounted here.
+            transport=self.transport or service_routes.transport(limits=limits),
+        )
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        if self._queue or self._has_spill():
+            self._wakeup.set()
+
+    async def stop(self):
+        """
+        Sends (or spills) every queued record, stops the sender task and
+        closes the connection.
+        """
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        await self._client.aclose()
+        self._client = None
+
+    def log(self, message: str, level: Optional[str] = None, **attributes) -> bool:
+        """
+        Queues a log record. Never blocks and may be called from any thread.
+
+        Args:
+            message (str): The log message.
+            level (Optional[str]): The severity of the message, e.g. "INFO".
+            **attributes: Other record attributes, e.g. trace_id or fields.
+
+        Returns:
+            bool: False if the record was dropped because the queue is full
+            or the logging service would reject it (see `valid_record`).
+        """
+        record = {"message": message, "timestamp": time.time(), **attributes}
+        if self.service is not None:
+            record.setdefault("service", self.service)
+        if level is not None:
+            record["level"] = level
+        if not valid_record(record):
+            # The bulk endpoint rejects a batch as a whole; drop the record
+            # alone rather than the batch it would join.
+            self.dropped += 1
+            return False
+        with self._lock:
+            if len(self._queue) >= self.max_queue_size:
+                self.dropped += 1
+                if self.overflow == "drop_newest":
+                    return False
+                self._queue.popleft()
+                self._done += 1
+            self._queue.append(record)
+            self._queued += 1
+            wake = len(self._queue) == 1 or len(self._queue) >= self.batch_size
+        if wake:
+            self._wake()
+        return True
+
+    async def log_wait(self, message: str, level: Optional[str] = None, **attributes):
+        """
+        Queues a log record, waiting for room in the queue instead of dropping.
+
+        Args:
+            message (str): The log message.
+            level (Optional[str]): The severity of the message.
+            **attributes: Other record attributes.
+        """
+        while self._task is not None and len(self._queue) >= self.max_queue_size:
+            self._room.clear()
+            self._wakeup.set()
+            await self._room.wait()
+        self.log(message, level, **attributes)
+
+    async def flush(self):
+        """
+        Waits until every record queued so far has been sent or spilled.
+        """
+        if self._task is None or self._done >= self._queued:
+            return
+        done = asyncio.get_running_loop().create_future()
+        self._waiters.append((self._queued, done))
+        self._wakeup.set()
+        await done
+
+    def _wake(self):
+        """
+        Wakes the sender task up from any thread.
+        """
+        if self._task is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._wakeup.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        """
+        Sends the queue in batches until the client is stopped.
+        """
+        while not self._stopping:
+            # Spilled records are retried even when nothing new is logged.
+            timeout = self.retry_interval if self._has_spill() else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if (
+                not self._stopping
+                and not self._waiters
+                and len(self._queue) < self.batch_size
+            ):
+                # Give a burst of records a chance to join this batch.
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+            await self._send_queue()
+        await self._send_queue()
+
+    async def _send_queue(self):
+        """
+        Sends everything currently queued, replaying the spill file first
+        once the logging service is reachable.
+        """
+        if self._has_spill() and time.monotonic() >= self._retry_at:
+            await self._replay_spill()
+        while self._queue:
+            with self._lock:
+                count = min(len(self._queue), self.batch_size)
+                batch = [self._queue.popleft() for _ in range(count)]
+            self._room.set()
+            if self._has_spill() or time.monotonic() < self._retry_at:
+                # Keep the order: new records wait behind the spilled ones.
+                await asyncio.to_thread(self._spill, batch)
+            elif not await self._post(batch):
+                await asyncio.to_thread(self._spill, batch)
+            with self._lock:
+                self._done += count
+            self._resolve_waiters()
+        self._resolve_waiters()
+
+    def _resolve_waiters(self):
+        """
+        Resolves the `flush` calls whose records have all been handled.
+        """
+        waiting = []
+        for target, done in self._waiters:
+            if self._done >= target:
+                if not done.done():
+                    done.set_result(None)
+            else:
+                waiting.append((target, done))
+        self._waiters = waiting
+
+    async def _post(self, batch: List[dict]) -> bool:
+        """
+        Sends one batch to the bulk endpoint.
+
+        Args:
+            batch (List[dict]): The records to send.
+
+        Returns:
+            bool: False if the batch should be retried later.
+        """
+        body = "".join(json.dumps(record) + "\n" for record in batch).encode()
+        headers = {"Content-Type": "application/x-ndjson"}
+        if len(body) >= self.compress_min_bytes:
+            body = gzip.compress(body, compresslevel=1)
+            headers["Content-Encoding"] = "gzip"
+        try:
+            response = await self._client.post(
+                "/log/bulk", content=body, headers=headers
+            )
+        except httpx.HTTPError as e:
+            print(f"An error occurred while sending log messages: {e}")
+            self._retry_at = time.monotonic() + self.retry_interval
+            return False
+        if response.status_code >= 500:
+            print(f"The logging service answered {response.status_code}")
+            self._retry_at = time.monotonic() + self.retry_interval
+            return False
+        if response.status_code >= 400:
+            # Retrying a rejected batch would fail again.
+            print(f"The logging service rejected {len(batch)} log messages")
+            self.dropped += len(batch)
+        return True
+
+    def _has_spill(self) -> bool:
+        """
+        Checks for records waiting in the spill file.
+        """
+        return self.spill_path is not None and (
+            os.path.exists(self.spill_path)
+            or os.path.exists(self.spill_path + ".replay")
+        )
+
+    def _spill(self, batch: List[dict]):
+        """
+        Appends a batch to the spill file. Runs in a worker thread.
+
+        Args:
+            batch (List[dict]): The records that could not be sent.
+        """
+        if self.spill_path is None:
+            self.dropped += len(batch)
+            return
+        data = "".join(json.dumps(record) + "\n" for record in batch).encode()
+        try:
+            # Only the replay file may exist while it is being sent.
+            size = (
+                os.path.getsize(self.spill_path)
+                if os.path.exists(self.spill_path)
+                else 0
+            )
+            if size + len(data) > self.spill_max_bytes:
+                self.dropped += len(batch)
+                return
+            os.makedirs(
+                os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True
+            )
+            with open(self.spill_path, "ab") as spill_file:
+                spill_file.write(data)
+        except OSError as e:
+            print(f"Failed to spill {len(batch)} log messages: {e}")
+            self.dropped += len(batch)
+
+    async def _replay_spill(self):
+        """
+        Sends the spilled records in batches, oldest first.
+
+        The spill file is renamed before it is replayed so batches spilled in
+        the meantime go to a new file. If the logging service fails again, the
+        records left are written back in front of that file.
+        """
+        replaying = self.spill_path + ".replay"
+        while self._has_spill():
+            if not os.path.exists(replaying):
+                await asyncio.to_thread(os.replace, self.spill_path, replaying)
+            records = await asyncio.to_thread(read_spill, replaying)
+            for start in range(0, len(records), self.batch_size):
+                if not await self._post(records[start : start + self.batch_size]):
+                    await asyncio.to_thread(
+                        restore_spill, records[start:], replaying, self.spill_path
+                    )
+                    return
+            await asyncio.to_thread(os.remove, replaying)
+
+
+def read_spill(path: str) -> List[dict]:
+    """
+    Reads the records of a spill file, skipping a torn last line.
+
+    Args:
+        path (str): The spill file.
+
+    Returns:
+        List[dict]: The spilled records, in order.
+    """
+    records = []
+    with open(path, "rb") as spill_file:
+        for line in spill_file:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def restore_spill(records: List[dict], replaying: str, spill_path: str):
+    """
+    Writes unsent records back to the spill file, ahead of the batches spilled
+    while they were being replayed.
+
+    Args:
+        records (List[dict]): The records that could not be replayed.
+        replaying (str): The file the records were read from.
+        spill_path (str): The spill file.
+    """
+    data = "".join(json.dumps(record) + "\n" for record in records).encode()
+    tmp_path = spill_path + ".tmp"
+    with open(tmp_path, "wb") as tmp_file:
+        tmp_file.write(data)
+        if os.path.exists(spill_path):
+            with open(spill_path, "rb") as spill_file:
+                tmp_file.write(spill_file.read())
+    os.replace(tmp_path, spill_path)
+    os.remove(replaying)
+
+
+class DatagramLogClient:
+    """
+    Sends each log record as one datagram to the logging service.
+
+    Logging a record costs one non-blocking `send`: there is no connection,
+    no response and no background task. Datagrams the kernel cannot take, or
+    that nobody receives, are lost and counted in `dropped`.
+
+    Attributes:
+        url (str): "udp://host:port" or "unix:///path/to/socket".
+        service (Optional[str]): Service name attached to every record.
+        max_datagram_bytes (int): Records encoding to more bytes are dropped.
+        dropped (int): Number of records that could not be sent.
+    """
+
+    def __init__(
+        self,
+        url: str = LOGGING_SERVICE_DATAGRAM_URL,
+        service: Optional[str] = None,
+        max_datagram_bytes: int = 65000,
+    ):
+        self.url = url
+        self.service = service
+        self.max_datagram_bytes = max_datagram_bytes
+        self.dropped = 0
+        self._family, self._address = parse_datagram_url(url)
+        self._socket: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+
+    async def start(self):
+        """
+        Present for compatibility with LogClient; datagrams need no setup.
+        """
+
+    async def stop(self):
+        """
+        Closes the socket.
+        """
+        with self._lock:
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+
+    async def flush(self):
+        """
+        Present for compatibility with LogClient; datagrams are never queued.
+        """
+
+    def log(self, message: str, level: Optional[str] = None, **attributes) -> bool:
+        """
+        Sends a log record. Never blocks and may be called from any thread.
+
+        Args:
+            message (str): The log message.
+            level (Optional[str]): The severity of the message, e.g. "INFO".
+            **attributes: Other record attributes: trace_id, timestamp and
+             numeric fields.
+
+        Returns:
+            bool: False if the record could not be sent.
+        """
+        record = {"message": message, **attributes}
+        if self.service is not None:
+            record.setdefault("service", self.service)
+        if level is not None:
+            record["level"] = level
+        if not valid_record(record):
+            self.dropped += 1
+            return False
+        try:
+            data = DATAGRAM_BINARY + encode_datagram_frame(record)
+        except (struct.error, TypeError, ValueError, AttributeError):
+            # A malformed record (e.g. a non-numeric field or an oversize
+            # string) is dropped rather than raised into the caller.
+            self.dropped += 1
+            return False
+        if len(data) > self.max_datagram_bytes:
+            self.dropped += 1
+            return False
+        with self._lock:
+            try:
+                if self._socket is None:
+                    self._socket = socket.socket(self._family, socket.SOCK_DGRAM)
+                    self._socket.setblocking(False)
+                    self._socket.connect(self._address)
+                self._socket.send(data)
+            except OSError:
+                # Reconnect on the next record, e.g. once the listener is back.
+                if self._socket is not None:
+                    self._socket.close()
+                    self._socket = None
+                self.dropped += 1
+                return False
+        return True
+
+
+def valid_record(record: dict) -> bool:
+    """
+    Checks a record against the rules of the logging service: a non-empty
+    message, string attributes and field names of at most
+    MAX_ATTRIBUTE_LENGTH characters, finite numbers, and strings that encode
+    as UTF-8.
+
+    Args:
+        record (dict): The record.
+
+    Returns:
+        bool: Whether the logging service would accept it.
+    """
+    message = record.get("message")
+    if not isinstance(message, str) or not message:
+        return False
+    strings = [message]
+    for key, _ in STRING_ATTRIBUTES:
+        value = record.get(key)
+        if value is None:
+            continue
+        if not isinstance(value, str) or len(value) > MAX_ATTRIBUTE_LENGTH:
+            return False
+        strings.append(value)
+    timestamp = record.get("timestamp")
+    if timestamp is not None and not _finite_number(timestamp):
+        return False
+    fields = record.get("fields")
+    if fields is not None:
+        if not isinstance(fields, dict) or len(fields) > MAX_ATTRIBUTE_LENGTH:
+            return False
+        for name, value in fields.items():
+            if (
+                not isinstance(name, str)
+                or len(name) > MAX_ATTRIBUTE_LENGTH
+                or not _finite_number(value)
+            ):
+                return False
+            strings.append(name)
     try:
-        with httpx.Client() as client:
-            client.post(f"{LOGGING_SERVICE_URL}/log", json=log_message.dict())
-    except httpx.RequestError as e:
-        print(f"An error occurred while sending log message: {str(e)}")
+        for string in strings:
+            string.encode()
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def _finite_number(value) -> bool:
+    """
+    Returns whether a value is a finite int or float (not a bool).
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    try:
+        return math.isfinite(value)
+    except OverflowError:
+        return False
+
+
+def encode_datagram_frame(record: dict) -> bytes:
+    """
+    Encodes a record as a binary frame of the datagram framing.
+
+    Args:
+        record (dict): The record: "message" and optional "service", "level",
+         "trace_id", "timestamp" (defaults to now) and numeric "fields".
+
+    Returns:
+        bytes: The frame, including its length prefix.
+    """
+    flags = 0
+    parts = []
+    for key, flag in STRING_ATTRIBUTES:
+        if record.get(key) is not None:
+            flags |= flag
+            value = record[key].encode()
+            parts.append(STRING_LENGTH.pack(len(value)) + value)
+    message = record["message"].encode()
+    parts.append(MESSAGE_LENGTH.pack(len(message)) + message)
+    fields = record.get("fields")
+    if fields:
+        flags |= FIELDS_FLAG
+        parts.append(STRING_LENGTH.pack(len(fields)))
+        for name, value in fields.items():
+            name = name.encode()
+            parts.append(STRING_LENGTH.pack(len(name)) + name + FLOAT.pack(value))
+    event_ts = record.get("timestamp") or time.time()
+    body = BODY_HEAD.pack(event_ts, flags) + b"".join(parts)
+    return FRAME_LENGTH.pack(len(body)) + body
+
+
+def parse_datagram_url(url: str) -> Tuple[int, object]:
+    """
+    Parses the address of a datagram listener.
+
+    Args:
+        url (str): "udp://host:port" or "unix:///path/to/socket".
+
+    Returns:
+        Tuple[int, object]: The socket family and address.
+
+    Raises:
+        ValueError: If the URL has another scheme.
+    """
+    scheme, _, address = url.partition("://")
+    if scheme == "udp":
+        host, _, port = address.rpartition(":")
+        return socket.AF_INET, (host, int(port))
+    if scheme == "unix":
+        return socket.AF_UNIX, address
+    raise ValueError(f"Unsupported datagram URL: {url!r}")
+
+
+def create_log_client(mode: str = LOG_CLIENT_MODE, service: Optional[str] = None):
+    """
+    Creates the log client of a transport mode.
+
+    Args:
+        mode (str): "http" for batched requests to the bulk endpoint, or
+         "datagram" for one datagram per record.
+        service (Optional[str]): Service name attached to every record.
+
+    Returns:
+        The LogClient or DatagramLogClient.
+    """
+    if mode not in CLIENT_MODES:
+        raise ValueError(f"mode must be one of {CLIENT_MODES}, got {mode!r}")
+    if mode == "datagram":
+        return DatagramLogClient(service=service)
+    return LogClient(service=service)
+
+
+log_client = create_log_client(service=os.getenv("LOG_SERVICE_NAME") or None)
+
+
+def send_log(message: str, level: Optional[str] = None, **attributes):
+    """
+    Queues a log message on the shared client without waiting for it to be
+    sent.
+
+    Args:
+        message (str): The message to be logged.
+        level (Optional[str]): The severity of the message, e.g. "ERROR".
+        **attributes: Other record attributes.
+    """
+    log_client.log(message, level, **attributes)
@@ -0,0 +1,87 @@
+# In-process routing of the calls between services
+
+from typing import Callable, Dict, Optional
+import httpx
+
+# Hosts whose ports may be served by an app mounted in this process.
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "0.0.0.0", "::1")
+
+
+class ServiceRoutes:
+    """
+    The service apps running in this process, by the port they normally
+    listen on.
+
+    When the services run as one process (see `top_secret.monolith`), each
+    app is mounted here, and HTTP clients created with `transport()` call it
+    directly through ASGI instead of over TCP. Requests to other hosts or
+    ports, and every request when nothing is mounted (the usual one service
+    per process deployment), go over the network unchanged.
+    """
+
+    def __init__(self):
+        self._apps: Dict[int, httpx.ASGITransport] = {}
+
+    def mount(self, port: int, app: Callable):
+        """
+        Routes the requests for a local port to an app.
+
+        Args:
+            port (int): The port the service listens on when run alone.
+            app (Callable): The ASGI app of the service.
+        """
+        # Errors become 500 responses, as they would over the network.
+        self._apps[port] = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+
+    def unmount(self, port: int):
+        """
+        Sends the requests for a local port over the network again.
+        """
+        self._apps.pop(port, None)
+
+    def route(self, url: httpx.URL) -> Optional[httpx.ASGITransport]:
+        """
+        Returns the in-process transport of a URL, if its service is mounted.
+        """
+        if url.host not in LOCAL_HOSTS:
+            return None
+        return self._apps.get(url.port)
+
+    def transport(self, **kwargs) -> "LocalServiceTransport":
+        """
+        Creates a transport for an HTTP client.
+
+        Args:
+            **kwargs: Arguments of the network transport, e.g. `limits`.
+
+        Returns:
+            LocalServiceTransport: Pass it as the `transport` of the client.
+        """
+        return LocalServiceTransport(self, httpx.AsyncHTTPTransport(**kwargs))
+
+
+class LocalServiceTransport(httpx.AsyncBaseTransport):
+    """
+    Sends a request to the app of its service if it is mounted in this
+    process, over the network otherwise.
+
+    Note that in-process responses are read completely before they are
+    returned.
+    """
+
+    def __init__(self, routes: ServiceRoutes, network: httpx.AsyncBaseTransport):
+        self.routes = routes
+        self.network = network
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        local = self.routes.route(request.url)
+        if local is not None:
+            return await local.handle_async_request(request)
+        return await self.network.handle_async_request(request)
+
+    async def aclose(self):
+        await self.network.aclose()
+
+
+# Routes shared by every client of the process
+service_routes = ServiceRoutes()